@@ -3,8 +3,17 @@
 import json
 import os
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
+from argparse import ArgumentParser
+from functools import partial
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
 from diff_features import extract_features_from_patch
+from commit_stream import iter_records
+from hashing_features import (DEFAULT_N_FEATURES, DocumentFrequencies, HashingTfidf, apply_idf, chunked,
+                              make_hasher, map_chunks)
+from streaming_tfidf import collect_stats, iter_tfidf_chunks, make_analyzer, write_rows
+import metrics
 
 CODE_TOKEN_RE = re.compile(r'[A-Za-z_]*[A-Z_][A-Za-z0-9_]*')
 
@@ -24,22 +33,19 @@ def clean_text(text):
     return text
 
 def load_commit_corpus(filepath):
-    with open(filepath, 'r', encoding='utf-8') as f:
-        commits = json.load(f)
-
     documents = []
     ids = []
     dates = []
 
-    for commit in commits:
+    for commit in iter_records(filepath):
         # message + hunk patch 全体を1つの document にする
-        full_text = emphasize_code_tokens(commit['message'])
+        parts = [emphasize_code_tokens(commit['message'])]
         for diff in commit['diffs']:
             patch = diff['patch']
-            full_text += ' ' + patch
+            parts.append(patch)
             # add extracted features from the patch with extra weight
-            full_text += ' ' + extract_features_from_patch(patch, weight=5)
-        full_text = clean_text(full_text)
+            parts.append(extract_features_from_patch(patch, weight=5))
+        full_text = clean_text(' '.join(parts))
 
         documents.append(full_text)
         ids.append(commit['hash'])
@@ -52,22 +58,217 @@ def build_tfidf_matrix(documents):
     tfidf_matrix = vectorizer.fit_transform(documents)
     return tfidf_matrix, vectorizer
 
+def commit_fields(commit, code_weight=5, feature_weight=5):
+    """Yield ``(text, weight)`` pairs that make up a commit document.
+
+    Together they describe the same bag of words as ``load_commit_corpus``,
+    but with weights kept as numbers instead of repeated tokens.
+    """
+    plain, code = [], []
+    for t in commit['message'].split():
+        (code if CODE_TOKEN_RE.search(t) else plain).append(t)
+    yield ' '.join(plain), 1
+    yield ' '.join(code), code_weight
+    for diff in commit['diffs']:
+        patch = diff['patch']
+        yield patch, 1
+        yield extract_features_from_patch(patch), feature_weight
+
+def load_weighted_counts(filepath, code_weight=5, feature_weight=5):
+    """Stream commits into a field-weighted term count matrix.
+
+    Each field is tokenized once and its counts are multiplied by the field
+    weight. Returns ``(ids, counts, vocabulary, dates)``; ``counts`` has one
+    column per distinct term in first-seen order.
+    """
+    analyze = CountVectorizer(stop_words='english').build_analyzer()
+    vocabulary = {}
+    ids, dates = [], []
+    indices, values, indptr = [], [], [0]
+    for commit in iter_records(filepath):
+        counts = {}
+        for text, weight in commit_fields(commit, code_weight, feature_weight):
+            for tok in analyze(clean_text(text)):
+                counts[tok] = counts.get(tok, 0) + weight
+        for tok, c in counts.items():
+            indices.append(vocabulary.setdefault(tok, len(vocabulary)))
+            values.append(c)
+        indptr.append(len(indices))
+        ids.append(commit['hash'])
+        dates.append(commit.get('date'))
+    counts = csr_matrix(
+        (np.array(values, dtype=np.float64), np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+        shape=(len(ids), len(vocabulary)),
+    )
+    return ids, counts, vocabulary, dates
+
+def limit_features(counts, vocabulary, max_features=10000):
+    """Sort columns by term and keep the ``max_features`` most frequent ones.
+
+    Mirrors what ``TfidfVectorizer(max_features=...)`` does, including how it
+    breaks ties, so the result matches ``build_tfidf_matrix``.
+    """
+    terms = sorted(vocabulary)
+    counts = counts[:, [vocabulary[t] for t in terms]]
+    if max_features is not None and len(terms) > max_features:
+        tfs = np.asarray(counts.sum(axis=0)).ravel()
+        keep = np.sort((-tfs).argsort()[:max_features])
+        counts = counts[:, keep]
+        terms = [terms[i] for i in keep]
+    return counts.tocsr(), {t: i for i, t in enumerate(terms)}
+
+def build_weighted_tfidf_matrix(filepath, code_weight=5, feature_weight=5, max_features=10000):
+    with metrics.phase("tokenize") as p:
+        ids, counts, vocabulary, dates = load_weighted_counts(filepath, code_weight, feature_weight)
+        p.items = len(ids)
+    with metrics.phase("limit_features"):
+        counts, vocabulary = limit_features(counts, vocabulary, max_features)
+    with metrics.phase("fit_transform", items=len(ids)):
+        tfidf_matrix = TfidfTransformer().fit_transform(counts)
+    return ids, tfidf_matrix, vocabulary, dates
+
+_hasher = None
+
+def _init_hash_worker(n_features):
+    global _hasher
+    _hasher = make_hasher(n_features)
+
+def hash_commit_chunk(commits, code_weight=5, feature_weight=5):
+    """Hashed, field-weighted term counts for a chunk of commits.
+
+    All fields of the chunk are hashed in one call; a sparse
+    ``commits x fields`` weight matrix then sums them per commit.
+    """
+    texts, weights, rows = [], [], []
+    for r, commit in enumerate(commits):
+        for text, weight in commit_fields(commit, code_weight, feature_weight):
+            texts.append(clean_text(text))
+            weights.append(weight)
+            rows.append(r)
+    combine = csr_matrix((np.array(weights, dtype=np.float64), (rows, np.arange(len(texts)))),
+                         shape=(len(commits), len(texts)))
+    counts = combine @ _hasher.transform(texts)
+    return [c['hash'] for c in commits], [c.get('date') for c in commits], counts
+
+def build_hashed_tfidf_matrix(filepath, code_weight=5, feature_weight=5, n_features=DEFAULT_N_FEATURES,
+                              chunk_size=2000, workers=1):
+    """Fit-free variant of ``build_weighted_tfidf_matrix`` using feature hashing.
+
+    Chunks of commits are counted independently (in ``workers`` processes),
+    document frequencies are summed as the chunks arrive and the IDF is
+    applied once at the end. Returns ``(ids, tfidf_matrix, config, dates)``.
+    """
+    ids, dates, chunks = [], [], []
+    dfs = DocumentFrequencies(n_features)
+    count = partial(hash_commit_chunk, code_weight=code_weight, feature_weight=feature_weight)
+    with metrics.phase("tokenize") as p:
+        for chunk_ids, chunk_dates, counts in map_chunks(count, chunked(iter_records(filepath), chunk_size),
+                                                         n_features, workers, initializer=_init_hash_worker):
+            ids.extend(chunk_ids)
+            dates.extend(chunk_dates)
+            chunks.append(dfs.add(counts))
+        p.items = len(ids)
+    with metrics.phase("apply_idf", items=len(ids)):
+        counts = vstack(chunks, format="csr") if chunks else csr_matrix((0, n_features))
+        tfidf_matrix = apply_idf(counts, dfs.idf())
+    return ids, tfidf_matrix, HashingTfidf(n_features).config(), dates
+
+def commit_docs(filepath, code_weight=5, feature_weight=5, ids=None, dates=None):
+    """Stream commits as ``(text, weight)`` field lists, recording ids and dates if lists are given."""
+    for commit in iter_records(filepath):
+        if ids is not None:
+            ids.append(commit['hash'])
+            dates.append(commit.get('date'))
+        yield [(clean_text(text), weight) for text, weight in commit_fields(commit, code_weight, feature_weight)]
+
+def build_tfidf_out_of_core(filepath, output_matrix, code_weight=5, feature_weight=5, max_features=10000,
+                            chunk_size=2000):
+    """Two-pass, bounded-memory variant of ``build_weighted_tfidf_matrix``.
+
+    Pass 1 streams the commits to count terms and document frequencies;
+    pass 2 streams them again and writes the TF-IDF rows to
+    ``output_matrix`` in chunks. Returns ``(ids, vocabulary, dates)``.
+    Stream from a ``.jsonl`` file to keep a JSON array out of memory too.
+    """
+    analyze = make_analyzer()
+    ids, dates = [], []
+    with metrics.phase("tokenize") as p:
+        stats = collect_stats(commit_docs(filepath, code_weight, feature_weight, ids, dates), analyze)
+        p.items = stats.n_docs
+    with metrics.phase("limit_features"):
+        vocabulary, idf, _ = stats.vocabulary(max_features)
+    chunks = iter_tfidf_chunks(commit_docs(filepath, code_weight, feature_weight), analyze, vocabulary, idf,
+                               chunk_size)
+    write_rows(chunks, len(vocabulary), output_matrix)
+    return ids, vocabulary, dates
+
+def build_hashed_tfidf_out_of_core(filepath, output_matrix, code_weight=5, feature_weight=5,
+                                   n_features=DEFAULT_N_FEATURES, chunk_size=2000, workers=1):
+    """Two-pass, bounded-memory variant of ``build_hashed_tfidf_matrix``.
+
+    Pass 1 only sums the document frequencies of the hashed chunks; pass 2
+    hashes the commits again and writes the TF-IDF rows to ``output_matrix``.
+    Returns ``(ids, config, dates)``.
+    """
+    ids, dates = [], []
+    dfs = DocumentFrequencies(n_features)
+    count = partial(hash_commit_chunk, code_weight=code_weight, feature_weight=feature_weight)
+    with metrics.phase("count") as p:
+        for chunk_ids, chunk_dates, counts in map_chunks(count, chunked(iter_records(filepath), chunk_size),
+                                                         n_features, workers, initializer=_init_hash_worker):
+            ids.extend(chunk_ids)
+            dates.extend(chunk_dates)
+            dfs.add(counts)
+        p.items = len(ids)
+    idf = dfs.idf()
+    chunks = map_chunks(count, chunked(iter_records(filepath), chunk_size), n_features, workers,
+                        initializer=_init_hash_worker)
+    write_rows((apply_idf(counts, idf) for _, _, counts in chunks), n_features, output_matrix)
+    return ids, HashingTfidf(n_features).config(), dates
+
 if __name__ == "__main__":
-    input_file = "data/commits.json"
+    ap = ArgumentParser(description="Build the commit-level TF-IDF matrix")
+    ap.add_argument("--vectorizer", choices=["vocab", "hashing"], default="vocab",
+                    help="vocab: term vocabulary limited to 10000 terms, hashing: feature hashing without a fit")
+    ap.add_argument("--n-features", type=int, default=DEFAULT_N_FEATURES, help="Hashing: number of columns")
+    ap.add_argument("--workers", type=int, default=1, help="Hashing: processes counting chunks of commits")
+    ap.add_argument("--chunk-size", type=int, default=2000, help="Commits per chunk (hashing and out-of-core)")
+    ap.add_argument("--out-of-core", action="store_true",
+                    help="Two passes over the commits, streaming rows to the output file")
+    ap.add_argument("--input", default="data/commits.json", help="commits.json or commits.jsonl")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+    metrics.apply_arguments(args)
+
+    input_file = args.input
     output_matrix = "data/tfidf.npz"
     output_ids = "data/commit_ids.json"
 
-    ids, docs, dates = load_commit_corpus(input_file)
-    tfidf_matrix, vectorizer = build_tfidf_matrix(docs)
+    with metrics.stage("build_corpus"):
+        tfidf_matrix = None
+        if args.vectorizer == "hashing" and args.out_of_core:
+            ids, vocabulary, dates = build_hashed_tfidf_out_of_core(
+                input_file, output_matrix, n_features=args.n_features, chunk_size=args.chunk_size,
+                workers=args.workers)
+        elif args.vectorizer == "hashing":
+            ids, tfidf_matrix, vocabulary, dates = build_hashed_tfidf_matrix(
+                input_file, n_features=args.n_features, chunk_size=args.chunk_size, workers=args.workers)
+        elif args.out_of_core:
+            # 行は build_tfidf_out_of_core が output_matrix に直接書く
+            ids, vocabulary, dates = build_tfidf_out_of_core(input_file, output_matrix, chunk_size=args.chunk_size)
+        else:
+            ids, tfidf_matrix, vocabulary, dates = build_weighted_tfidf_matrix(input_file)
 
-    # 保存
-    from scipy.sparse import save_npz
-    save_npz(output_matrix, tfidf_matrix)
+        # 保存
+        from scipy.sparse import save_npz
+        with metrics.phase("dump"):
+            if tfidf_matrix is not None:
+                save_npz(output_matrix, tfidf_matrix)
 
-    with open(output_ids, 'w') as f:
-        json.dump(ids, f)
+            with open(output_ids, 'w') as f:
+                json.dump(ids, f)
 
-    with open("data/commit_dates.json", 'w') as f:
-        json.dump(dates, f)
+            with open("data/commit_dates.json", 'w') as f:
+                json.dump(dates, f)
 
     print(f"TF-IDF matrix saved to {output_matrix}")
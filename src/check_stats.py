@@ -1,4 +1,5 @@
 import json
+from commit_stream import iter_records
 
 def count_bugs(bug_report_path):
     with open(bug_report_path, encoding="utf-8") as f:
@@ -15,9 +16,7 @@ def count_unique_files(commit_features_path):
     return len(file_set)
 
 def count_commits(commits_path):
-    with open(commits_path, encoding="utf-8") as f:
-        commits = json.load(f)
-    return len(commits)
+    return sum(1 for _ in iter_records(commits_path))
 
 if __name__ == "__main__":
     bug_report_path = "data/bug_reports.json"
@@ -0,0 +1,21 @@
+# src/checksums.py
+# 生成物が古くなっていないかを確かめるためのハッシュ。
+# pipeline.py のステージ判定と、キャッシュを持つモジュール (index_format, low_rank, dedup_hunks ...) が共有する。
+
+import hashlib
+import os
+
+def file_hash(path):
+    """sha256 of a file, or of every file below a directory (e.g. data/hunks)."""
+    if not os.path.exists(path):
+        return None
+    h = hashlib.sha256()
+    if os.path.isdir(path):
+        for name in sorted(os.listdir(path)):
+            h.update(name.encode())
+            h.update((file_hash(os.path.join(path, name)) or "").encode())
+        return h.hexdigest()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
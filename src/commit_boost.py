@@ -0,0 +1,184 @@
+# src/commit_boost.py
+# python src/commit_boost.py                 # data/hunk_boost.npy を commit_ids.json に揃えて書く
+#                                            # (入力のハッシュと beta は data/hunk_boost.json に記録)
+# python src/commit_boost.py --beta 0.2
+#
+# コミットの boost (よく変更されるファイルに触れるコミットほど高い) を
+# コミット×ファイルの疎な出現行列から求める。
+# DecayedBoost はバグ報告の日付時点での、減衰付きの変更頻度を日付順に逐次更新する。
+
+import json
+import os
+from argparse import ArgumentParser
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from checksums import file_hash
+from time_index import parse_date
+
+COMMIT_IDS_FILE = "data/commit_ids.json"
+COMMIT_FEATURES_FILE = "data/commit_features.json"
+HUNK_BOOST_FILE = "data/hunk_boost.npy"
+
+def incidence_matrix(features):
+    """Return ``(commit_ids, files, matrix)`` with one row per commit and one column per file.
+
+    ``matrix[c, f]`` counts how often file ``f`` is listed for commit ``c``.
+    """
+    commit_ids = [item["commit_id"] for item in features]
+    file_pos = {}
+    indptr = [0]
+    indices = []
+    for item in features:
+        for fp in item.get("files", []):
+            indices.append(file_pos.setdefault(fp, len(file_pos)))
+        indptr.append(len(indices))
+    data = np.ones(len(indices))
+    matrix = csr_matrix((data, indices, indptr), shape=(len(commit_ids), len(file_pos)))
+    matrix.sum_duplicates()
+    return commit_ids, list(file_pos), matrix
+
+def scale_boost(freq, beta, mask=None):
+    """``1 + beta * freq / max(freq)``, taking the maximum over ``mask`` only if given."""
+    pool = freq if mask is None else freq[mask]
+    max_freq = pool.max() if len(pool) else 0.0
+    return 1.0 + beta * freq / (max_freq or 1.0)
+
+def commit_boost_array(matrix, beta=0.1):
+    """Per-commit boost: the summed change count of every file the commit touches."""
+    file_freq = np.asarray(matrix.sum(axis=0)).ravel()
+    return scale_boost(matrix @ file_freq, beta)
+
+def hunk_commit_rows(commit_ids, hunk_ids):
+    """Row in ``commit_ids`` of each ``<commit>:<index>`` hunk id, -1 if the commit is unknown."""
+    pos = {cid: i for i, cid in enumerate(commit_ids)}
+    return np.array([pos.get(hid.split(":")[0], -1) for hid in hunk_ids], dtype=np.int64)
+
+def expand_to_hunks(values, rows):
+    """Gather per-commit ``values`` for each hunk row; unknown commits get 1.0."""
+    out = np.ones(len(rows))
+    known = rows >= 0
+    out[known] = values[rows[known]]
+    return out
+
+def hunk_boost(hunk_ids, features, beta=0.1):
+    """Boost aligned to ``hunk_ids`` (commit_ids.json)."""
+    commit_ids, _, matrix = incidence_matrix(features)
+    return expand_to_hunks(commit_boost_array(matrix, beta), hunk_commit_rows(commit_ids, hunk_ids))
+
+def boost_meta_file(path):
+    # hunk_boost.npy の隣に、どの入力と beta から作ったかを記録する
+    return os.path.splitext(path)[0] + ".json"
+
+def boost_meta(beta, commit_ids_file, features_file):
+    return {"beta": beta, "commit_ids": file_hash(commit_ids_file),
+            "commit_features": file_hash(features_file)}
+
+def save_hunk_boost(boost, beta, path=HUNK_BOOST_FILE, commit_ids_file=COMMIT_IDS_FILE,
+                    features_file=COMMIT_FEATURES_FILE):
+    np.save(path, boost)
+    with open(boost_meta_file(path), "w") as f:
+        json.dump(boost_meta(beta, commit_ids_file, features_file), f)
+
+def load_hunk_boost(hunk_ids, features, path=HUNK_BOOST_FILE, beta=None,
+                    commit_ids_file=COMMIT_IDS_FILE, features_file=COMMIT_FEATURES_FILE):
+    """Read the stored boost array, or recompute and save it if it is missing or out of date.
+
+    The array is current if its sidecar JSON records the hashes of
+    ``commit_ids_file`` and ``features_file`` and, when ``beta`` is given,
+    that beta. Otherwise the stored beta (default 0.1) is reused.
+    """
+    if os.path.exists(path) and os.path.exists(boost_meta_file(path)):
+        with open(boost_meta_file(path)) as f:
+            meta = json.load(f)
+        if beta is None:
+            beta = meta["beta"]
+        boost = np.load(path)
+        if meta == boost_meta(beta, commit_ids_file, features_file) and len(boost) == len(hunk_ids):
+            return boost
+    beta = 0.1 if beta is None else beta
+    print(f"{path} is missing or out of date; recomputing")
+    boost = hunk_boost(hunk_ids, features, beta=beta)
+    save_hunk_boost(boost, beta, path, commit_ids_file, features_file)
+    return boost
+
+def commit_dates(features, hunk_ids=None, hunk_dates=None):
+    """Epoch date of each commit in ``features`` (NaN if unknown).
+
+    Older commit_features.json files have no ``date``; the dates are then
+    taken from hunk_dates.json when it is given.
+    """
+    fallback = {}
+    if hunk_ids is not None and hunk_dates is not None:
+        for hid, date in zip(hunk_ids, hunk_dates):
+            fallback.setdefault(hid.split(":")[0], date)
+    dates = [parse_date(item.get("date") or fallback.get(item["commit_id"])) for item in features]
+    return np.array([np.nan if d is None else d for d in dates])
+
+class DecayedBoost:
+    """File change frequencies as of a given date, with optional exponential decay.
+
+    ``at(t)`` returns the boost of every hunk using only commits dated before
+    ``t``; each earlier change of a file counts ``0.5 ** (age / half_life)``.
+    Calls must come in non-decreasing ``t``: the file scores are decayed and
+    extended with the newly passed commits instead of being recomputed.
+    """
+
+    def __init__(self, features, hunk_ids, dates, beta=0.1, half_life_days=None):
+        commit_ids, _, matrix = incidence_matrix(features)
+        self.matrix = matrix
+        self.beta = beta
+        self.half_life = half_life_days * 86400 if half_life_days else None
+        dated = np.flatnonzero(~np.isnan(dates))
+        self.order = dated[np.argsort(dates[dated], kind="stable")]
+        self.sorted_dates = dates[self.order]
+        self.sorted_matrix_t = matrix[self.order].T.tocsr()
+        self.rows = hunk_commit_rows(commit_ids, hunk_ids)
+        self.file_scores = np.zeros(matrix.shape[1])
+        self.seen = np.zeros(matrix.shape[0], dtype=bool)
+        self.next = 0
+        self.t = None
+
+    def weights(self, ages):
+        if self.half_life is None:
+            return np.ones(len(ages))
+        return np.exp2(-ages / self.half_life)
+
+    def advance(self, t):
+        if self.t is not None and t < self.t:
+            raise ValueError("DecayedBoost.at() must be called with non-decreasing dates")
+        if self.t is not None and self.half_life is not None:
+            self.file_scores *= np.exp2(-(t - self.t) / self.half_life)
+        end = int(np.searchsorted(self.sorted_dates, t, side="left"))
+        if end > self.next:
+            w = self.weights(t - self.sorted_dates[self.next:end])
+            self.file_scores += self.sorted_matrix_t[:, self.next:end] @ w
+            self.seen[self.order[self.next:end]] = True
+            self.next = end
+        self.t = t
+
+    def at(self, t):
+        if t is None:
+            # 日付のない報告は全履歴を使う
+            t = self.sorted_dates[-1] + 1 if len(self.sorted_dates) else 0.0
+            t = t if self.t is None else max(t, self.t)
+        self.advance(t)
+        freq = self.matrix @ self.file_scores
+        return expand_to_hunks(scale_boost(freq, self.beta, mask=self.seen), self.rows)
+
+def main():
+    ap = ArgumentParser(description="Compute the per-hunk commit boost aligned to commit_ids.json")
+    ap.add_argument("--beta", type=float, default=0.1)
+    ap.add_argument("--output", default=HUNK_BOOST_FILE)
+    args = ap.parse_args()
+
+    with open(COMMIT_IDS_FILE) as f:
+        hunk_ids = json.load(f)
+    with open(COMMIT_FEATURES_FILE) as f:
+        features = json.load(f)
+    boost = hunk_boost(hunk_ids, features, beta=args.beta)
+    save_hunk_boost(boost, args.beta, args.output)
+    print(f"Saved boost for {len(boost)} hunks to {args.output}")
+
+if __name__ == "__main__":
+    main()
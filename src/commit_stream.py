@@ -0,0 +1,66 @@
+# src/commit_stream.py
+# commits.json (JSON 配列) と commits.jsonl (1行1コミット) の両方を読むためのヘルパー
+
+import json
+import os
+
+from git_patches import PatchReader, fill_patches
+
+REPO_ENV = "LOCUS_REPO"
+
+def is_jsonl(path):
+    return path.endswith(".jsonl")
+
+def iter_records(path, repo=None):
+    """Yield records from a JSON array file or, for ``.jsonl``, one per line.
+
+    JSON Lines files are read incrementally, so only one record is held in
+    memory at a time. Commits extracted with ``extract_commits.py --lazy``
+    carry no patch text; it is read from ``repo`` (default: the
+    ``LOCUS_REPO`` environment variable) as the records are yielded.
+    """
+    records = _iter_raw_records(path)
+    repo = repo or os.environ.get(REPO_ENV)
+    if repo:
+        with PatchReader(repo) as reader:
+            yield from fill_patches(records, reader)
+        return
+    for record in records:
+        if record.get("parent") and any("patch" not in d for d in record.get("diffs", [])):
+            raise ValueError(f"{path} was extracted with --lazy; set {REPO_ENV} to the git repository")
+        yield record
+
+def _iter_raw_records(path):
+    if is_jsonl(path):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            yield from json.load(f)
+
+def recover_jsonl(path):
+    """Drop a partially written trailing line and return the last complete record.
+
+    Returns None if the file does not exist or holds no complete record.
+    """
+    if not os.path.exists(path):
+        return None
+    last = None
+    good_end = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                break
+            last = record
+            good_end = f.tell()
+    if good_end != os.path.getsize(path):
+        with open(path, "r+b") as f:
+            f.truncate(good_end)
+    return last
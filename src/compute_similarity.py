@@ -1,48 +1,189 @@
 # src/compute_similarity.py
 
 import json
+from argparse import ArgumentParser
 import numpy as np
 from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 from sklearn.feature_extraction.text import TfidfVectorizer
 from scipy.sparse import load_npz
+from time_index import TimeIndex, load_hunk_dates, parse_date
+from commit_boost import (DecayedBoost, commit_boost_array, commit_dates, incidence_matrix,
+                          load_hunk_boost)
+from inverted_index import InvertedIndex
+from low_rank import load_low_rank_index, rank_two_stage, recall_at_k
+from dedup_hunks import load_groups
+from hashing_features import HashingTfidf
+from index_format import open_index
+import metrics
 
-def load_vectorizer(vocab_file):
+def load_vectorizer(vocab_file, idf=None):
     with open(vocab_file, "r") as f:
         vocab = json.load(f)
+    if isinstance(vocab.get("hashing"), dict):
+        # extract_features.py --vectorizer hashing は語彙の代わりにハッシュの設定を書く
+        return HashingTfidf(idf=idf, **vocab["hashing"])
     vectorizer = TfidfVectorizer(lowercase=True, stop_words="english", vocabulary=vocab)
+    if idf is not None:
+        # 保存済みの IDF を使えば fit し直さずに transform できる
+        vectorizer.idf_ = idf
     return vectorizer
 
 def load_commit_boost(path, beta=0.1):
     with open(path, 'r') as f:
         feats = json.load(f)
+    return commit_boost_from_features(feats, beta)
 
-    file_freq = {}
-    for item in feats:
-        for fp in item.get('files', []):
-            file_freq[fp] = file_freq.get(fp, 0) + 1
-
-    commit_boost = {}
-    for item in feats:
-        freq = sum(file_freq.get(fp, 0) for fp in item.get('files', []))
-        commit_boost[item['commit_id']] = freq
-
-    max_freq = max(commit_boost.values()) if commit_boost else 1
-    for cid in commit_boost:
-        commit_boost[cid] = 1.0 + beta * (commit_boost[cid] / max_freq)
-
-    return commit_boost
+def commit_boost_from_features(feats, beta=0.1):
+    # コミット×ファイルの出現行列で集計する (commit_boost.py)
+    commit_ids, _, matrix = incidence_matrix(feats)
+    return dict(zip(commit_ids, commit_boost_array(matrix, beta).tolist()))
 
 def rank_commits(bug_vector, ce_matrix, commit_ids, commit_boost, top_k=10):
     similarities = cosine_similarity(bug_vector, ce_matrix).flatten()
-    boost = np.array([
-        commit_boost.get(cid.split(":")[0], 1.0)  # ハンクIDのコミット部分だけ使う
-        for cid in commit_ids
-    ])
+    if isinstance(commit_boost, np.ndarray):
+        # commit_ids に揃えた boost 配列ならそのまま使う
+        boost = commit_boost
+    else:
+        boost = np.array([
+            commit_boost.get(cid.split(":")[0], 1.0)  # ハンクIDのコミット部分だけ使う
+            for cid in commit_ids
+        ])
     scores = similarities * boost
     top_indices = np.argsort(scores)[::-1][:top_k]
     return [(commit_ids[i], float(scores[i])) for i in top_indices]
 
+def build_boost_vector(commit_ids, commit_boost):
+    # ハンクIDごとの boost を一度だけ配列にしておく
+    return np.array([commit_boost.get(cid.split(":")[0], 1.0) for cid in commit_ids])
+
+def score_blocks(nl_matrix, ce_matrix, boost, block_size=256):
+    """Yield ``(start, scores)`` for consecutive blocks of bug rows.
+
+    ``scores`` is a dense ``(block, n_hunks)`` array holding the cosine
+    similarity of each bug against every hunk multiplied by ``boost``.
+    Only one block is materialised at a time, so memory stays bounded by
+    ``block_size * n_hunks``.
+    """
+    nl_matrix = normalize(nl_matrix)
+    ce_t = normalize(ce_matrix).T.tocsc()
+    for start in range(0, nl_matrix.shape[0], block_size):
+        with metrics.phase("score", items=min(block_size, nl_matrix.shape[0] - start)):
+            block = (nl_matrix[start:start + block_size] @ ce_t).toarray()
+            block *= boost
+        yield start, block
+
+def top_k_rows(scores, top_k=10):
+    """Return the indices of the ``top_k`` best columns of each row, best first."""
+    k = min(top_k, scores.shape[1])
+    part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    part_scores = np.take_along_axis(scores, part, axis=1)
+    order = np.argsort(-part_scores, axis=1, kind="stable")
+    return np.take_along_axis(part, order, axis=1)
+
+def rank_all(nl_matrix, ce_matrix, commit_ids, boost, top_k=10, block_size=256, group=None):
+    """Batched equivalent of calling ``rank_commits`` for every bug row.
+
+    With ``group`` (the row of ``ce_matrix`` for each hunk, see
+    dedup_hunks.py), ``ce_matrix`` holds one representative per group of
+    duplicate hunks; each score is copied to every member of its group
+    before that member's boost is applied.
+    """
+    ranked = []
+    for _, block in score_blocks(nl_matrix, ce_matrix, 1.0 if group is not None else boost, block_size):
+        if group is not None:
+            with metrics.phase("expand", items=len(block)):
+                block = block[:, group] * boost
+        with metrics.phase("top_k", items=len(block)):
+            top = top_k_rows(block, top_k)
+        for row, cols in zip(block, top):
+            ranked.append([(commit_ids[j], float(row[j])) for j in cols])
+    return ranked
+
+def rank_time_aware(nl_matrix, created, index, boost, top_k=10, block_size=256):
+    """Rank only the hunks committed before each bug was reported.
+
+    Bugs are processed in creation order so that a block of bugs shares one
+    product against the longest prefix any of them needs; columns beyond a
+    bug's own cutoff are masked out before the top-k selection. ``boost`` is
+    either an array aligned to the hunks or a ``DecayedBoost``, which is
+    evaluated as of each bug's creation date.
+    """
+    nl_matrix = normalize(nl_matrix)
+    as_of = isinstance(boost, DecayedBoost)
+    if not as_of:
+        boost = boost[index.order]
+    limits = np.array([index.prefix_len(c) for c in created])
+    ts = np.array([parse_date(c) for c in created], dtype=float)
+    ts[np.isnan(ts)] = np.inf
+    # DecayedBoost は日付の昇順でしか進められないので、同じ prefix 内も日付順に並べる
+    bug_order = np.lexsort((ts, limits))
+    ranked = [None] * nl_matrix.shape[0]
+    for start in range(0, len(bug_order), block_size):
+        rows = bug_order[start:start + block_size]
+        n = int(limits[rows].max())
+        if n == 0:
+            for r in rows:
+                ranked[r] = []
+            continue
+        with metrics.phase("score", items=len(rows)):
+            block = (nl_matrix[rows] @ index.candidates(n)).toarray()
+            if as_of:
+                with metrics.phase("boost", items=len(rows)):
+                    block *= np.stack([boost.at(created_at(ts[r]))[index.order[:n]] for r in rows])
+            else:
+                block *= boost[:n]
+            block[np.arange(n)[None, :] >= limits[rows][:, None]] = -np.inf
+        with metrics.phase("top_k", items=len(rows)):
+            top = top_k_rows(block, top_k)
+        for r, row, cols in zip(rows, block, top):
+            ranked[r] = [(index.commit_ids[j], float(row[j])) for j in cols if row[j] > -np.inf]
+    print(f"Scored {limits.mean() / max(len(index), 1):.1%} of hunks per bug on average")
+    return ranked
+
+def created_at(t):
+    return None if np.isinf(t) else t
+
 def main():
+    ap = ArgumentParser(description="Rank hunks for each bug report")
+    ap.add_argument("--mode", choices=["loop", "batched", "time", "inverted", "two-stage"], default="loop",
+                    help="loop: one bug at a time, batched: blocks of bugs per sparse product, "
+                         "time: batched over hunks committed before each bug's creation date, "
+                         "inverted: term-at-a-time inverted index with top-k pruning, "
+                         "two-stage: low-rank candidate generation followed by an exact rerank")
+    ap.add_argument("--block-size", type=int, default=256,
+                    help="Number of bugs scored together in batched mode")
+    ap.add_argument("--top-k", type=int, default=10, help="Number of hunks kept per bug")
+    ap.add_argument("--hunk-dates", default="data/hunk_dates.json",
+                    help="Commit date of each hunk, aligned with commit_ids.json (time mode)")
+    ap.add_argument("--as-of-boost", action="store_true",
+                    help="Time mode: compute the commit boost from history before each bug's creation date")
+    ap.add_argument("--half-life", type=float, default=None, metavar="DAYS",
+                    help="With --as-of-boost, halve the weight of a file change every DAYS days")
+    ap.add_argument("--dim", type=int, default=128, help="Two-stage: embedding dimension")
+    ap.add_argument("--projection", choices=["svd", "random"], default="svd",
+                    help="Two-stage: truncated SVD or Gaussian random projection")
+    ap.add_argument("--candidates", type=int, default=2000,
+                    help="Two-stage: hunks passed from the approximate stage to the exact rerank")
+    ap.add_argument("--rebuild-embeddings", action="store_true",
+                    help="Two-stage: refit the projection even if data/low_rank.npz matches")
+    ap.add_argument("--recall", action="store_true",
+                    help="Two-stage: also run exact search and report the recall of the top-k")
+    ap.add_argument("--index", metavar="DIR",
+                    help="Read the CE matrix from a raw index written by src/index_format.py "
+                         "(memory-mapped) instead of data/ce_tfidf.npz")
+    ap.add_argument("--dedup", action="store_true",
+                    help="Batched: score one representative per group from data/hunk_groups.json "
+                         "(src/dedup_hunks.py) and expand the scores to every member hunk")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+    metrics.apply_arguments(args)
+    if args.dedup and args.mode != "batched":
+        ap.error("--dedup is only supported with --mode batched")
+    if args.dedup and args.index:
+        # 代表行の行列は ce_tfidf.npz から作られるので、--index の行列とは組み合わせない
+        ap.error("--dedup reads data/ce_tfidf_dedup.npz and cannot be combined with --index")
+
     bug_report_file = "data/bug_reports.json"
     commit_ids_file = "data/commit_ids.json"
     ce_matrix_file = "data/ce_tfidf.npz"
@@ -51,29 +192,89 @@ def main():
     commit_boost_file = "data/commit_features.json"
 
     print("Loading data...")
-    with open(bug_report_file, "r") as f:
-        bug_reports = json.load(f)
+    with metrics.phase("load"):
+        with open(bug_report_file, "r") as f:
+            bug_reports = json.load(f)
 
-    with open(commit_ids_file, "r") as f:
-        commit_ids = json.load(f)
+        with open(commit_ids_file, "r") as f:
+            commit_ids = json.load(f)
 
-    ce_matrix = load_npz(ce_matrix_file)
-    nl_matrix = load_npz(nl_matrix_file)
-    commit_boost = load_commit_boost(commit_boost_file)
-    vectorizer = load_vectorizer(vocab_file)
+        if args.index:
+            try:
+                ce_matrix = open_index(args.index, vocab_file=vocab_file, commit_ids_file=commit_ids_file).matrix
+            except ValueError as e:
+                raise SystemExit(str(e))
+        else:
+            ce_matrix = load_npz(ce_matrix_file)
+        nl_matrix = load_npz(nl_matrix_file)
+        with open(commit_boost_file, "r") as f:
+            features = json.load(f)
+        boost = load_hunk_boost(commit_ids, features, commit_ids_file=commit_ids_file,
+                                features_file=commit_boost_file)
+        vectorizer = load_vectorizer(vocab_file)
 
     print("Computing similarity...")
     results = {}
-    for i, bug in enumerate(bug_reports):
-        bug_id = bug["id"]
-        bug_vector = nl_matrix[i]
-        ranked = rank_commits(bug_vector, ce_matrix, commit_ids, commit_boost, top_k=10)
-        results[bug_id] = [{"commit_id": cid, "score": score} for cid, score in ranked]
+    if args.mode == "time":
+        with metrics.phase("build_index"):
+            hunk_dates = load_hunk_dates(args.hunk_dates)
+            index = TimeIndex(ce_matrix, commit_ids, hunk_dates)
+        if args.as_of_boost:
+            boost = DecayedBoost(features, commit_ids, commit_dates(features, commit_ids, hunk_dates),
+                                 half_life_days=args.half_life)
+        all_ranked = rank_time_aware(nl_matrix, [bug.get("created") for bug in bug_reports],
+                                     index, boost, top_k=args.top_k, block_size=args.block_size)
+        for bug, ranked in zip(bug_reports, all_ranked):
+            results[bug["id"]] = [{"commit_id": cid, "score": score} for cid, score in ranked]
+    elif args.mode == "inverted":
+        with metrics.phase("build_index"):
+            index = InvertedIndex(ce_matrix, boost=boost)
+        for i, bug in enumerate(bug_reports):
+            with metrics.phase("query", items=1):
+                ranked = index.query(nl_matrix[i], top_k=args.top_k)
+            results[bug["id"]] = [{"commit_id": commit_ids[j], "score": score} for j, score in ranked]
+    elif args.mode == "two-stage":
+        with metrics.phase("build_index"):
+            # キャッシュは実際に使う行列 (--index ならそのディレクトリ) に紐づける
+            index = load_low_rank_index(ce_matrix, args.index or ce_matrix_file, dim=args.dim, method=args.projection,
+                                        rebuild=args.rebuild_embeddings)
+        with metrics.phase("two_stage", items=nl_matrix.shape[0]):
+            ranked_rows = rank_two_stage(nl_matrix, ce_matrix, boost, index, n_candidates=args.candidates,
+                                         top_k=args.top_k, block_size=args.block_size)
+        for bug, (rows, scores) in zip(bug_reports, ranked_rows):
+            results[bug["id"]] = [{"commit_id": commit_ids[j], "score": float(s)} for j, s in zip(rows, scores)]
+        if args.recall:
+            exact_rows, exact_scores = [], []
+            for _, block in score_blocks(nl_matrix, ce_matrix, boost, args.block_size):
+                top = top_k_rows(block, args.top_k)
+                exact_rows.extend(top)
+                exact_scores.extend(np.take_along_axis(block, top, axis=1))
+            recall = recall_at_k([rows for rows, _ in ranked_rows], exact_rows, exact_scores)
+            print(f"Recall@{args.top_k} against exact search: {recall:.4f}")
+    elif args.mode == "batched":
+        group = None
+        if args.dedup:
+            with metrics.phase("load_groups"):
+                ce_matrix, group = load_groups(ce_matrix_file)
+            print(f"Scoring {ce_matrix.shape[0]} representatives for {len(commit_ids)} hunks")
+        all_ranked = rank_all(nl_matrix, ce_matrix, commit_ids, boost,
+                              top_k=args.top_k, block_size=args.block_size, group=group)
+        for bug, ranked in zip(bug_reports, all_ranked):
+            results[bug["id"]] = [{"commit_id": cid, "score": score} for cid, score in ranked]
+    else:
+        for i, bug in enumerate(bug_reports):
+            bug_id = bug["id"]
+            bug_vector = nl_matrix[i]
+            with metrics.phase("score", items=1):
+                ranked = rank_commits(bug_vector, ce_matrix, commit_ids, boost, top_k=args.top_k)
+            results[bug_id] = [{"commit_id": cid, "score": score} for cid, score in ranked]
 
-    with open("data/similarity_scores.json", "w") as f:
-        json.dump(results, f, indent=2)
+    with metrics.phase("dump", items=len(results)):
+        with open("data/similarity_scores.json", "w") as f:
+            json.dump(results, f, indent=2)
 
     print("Saved ranked similarity results to data/similarity_scores.json")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("compute_similarity"):
+        main()
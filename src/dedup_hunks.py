@@ -0,0 +1,159 @@
+# src/dedup_hunks.py
+# python src/dedup_hunks.py                    # 同一ハンクだけでなく近似重複もまとめる (Jaccard >= 0.9)
+# python src/dedup_hunks.py --threshold 1.0    # CE トークン集合が一致するものだけ (ランキングは変わらない)
+# python src/compute_similarity.py --mode batched --dedup
+#
+# ブランチ間のバックポートや cherry-pick で同じハンクが何度も現れるので、
+# 行番号を除いた本文のハッシュと、CE トークン集合の MinHash/LSH でグループにまとめる。
+# 代表ハンクだけを data/ce_tfidf_dedup.npz に残し、ランキング時にグループを展開する。
+
+import hashlib
+import json
+import re
+import zlib
+from argparse import ArgumentParser
+from collections import defaultdict
+import numpy as np
+from scipy.sparse import coo_matrix, load_npz, save_npz
+from scipy.sparse.csgraph import connected_components
+
+from checksums import file_hash
+from commit_stream import iter_records
+from hunk_store import HunkStore
+import metrics
+
+HUNKS_DIR = "data/hunks"
+CORPUS_FILE = "data/hunk_corpus.jsonl"
+CE_MATRIX_FILE = "data/ce_tfidf.npz"
+GROUPS_FILE = "data/hunk_groups.json"
+DEDUP_MATRIX_FILE = "data/ce_tfidf_dedup.npz"
+
+HEADER_NUMBERS_RE = re.compile(r"^@@ -\d+(?:,\d+)? \+\d+(?:,\d+)? @@")
+MERSENNE_PRIME = (1 << 61) - 1
+
+def body_key(hunk):
+    """Hunk text with the line numbers of the ``@@`` header removed."""
+    return HEADER_NUMBERS_RE.sub("@@", hunk, count=1)
+
+def token_hashes(tokens):
+    return np.array(sorted({zlib.crc32(t.encode("utf-8")) for t in tokens}), dtype=np.uint64)
+
+def minhash_signatures(token_sets, num_perm=64, seed=0):
+    """``(n, num_perm)`` MinHash signatures; empty sets get an all-max signature."""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+    b = rng.integers(0, 1 << 31, size=num_perm, dtype=np.uint64)
+    hashes = [token_hashes(tokens) for tokens in token_sets]
+    lengths = np.array([len(h) for h in hashes])
+    sig = np.full((len(hashes), num_perm), np.iinfo(np.uint64).max, dtype=np.uint64)
+    nonempty = np.flatnonzero(lengths)
+    if len(nonempty):
+        flat = np.concatenate([hashes[i] for i in nonempty])
+        starts = np.concatenate([[0], np.cumsum(lengths[nonempty])[:-1]])
+        for p in range(num_perm):
+            # (a * h + b) mod p を全トークン分まとめて計算し、集合ごとの最小値を取る
+            permuted = (a[p] * flat + b[p]) % MERSENNE_PRIME
+            sig[nonempty, p] = np.minimum.reduceat(permuted, starts)
+    return sig
+
+def jaccard(a, b):
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+def group_hunks(texts, token_sets, threshold=0.9, num_perm=64, bands=16):
+    """Representative row (the group's first row) for every hunk.
+
+    Hunks with the same body (ignoring header line numbers) are grouped
+    directly. Near duplicates are found by LSH over MinHash signatures of
+    their CE token sets; a candidate joins a bucket's first member only if
+    their exact Jaccard similarity reaches ``threshold``.
+    """
+    n = len(token_sets)
+    pairs = set()
+    first_by_body = {}
+    for i, text in enumerate(texts):
+        key = hashlib.blake2b(body_key(text).encode("utf-8"), digest_size=16).digest()
+        j = first_by_body.setdefault(key, i)
+        if j != i:
+            pairs.add((j, i))
+
+    sets = [frozenset(t) for t in token_sets]
+    rows = num_perm // bands
+    sig = minhash_signatures(token_sets, num_perm=num_perm)
+    checked = set()
+    for band in range(bands):
+        buckets = defaultdict(list)
+        for i, key in enumerate(map(bytes, sig[:, band * rows:(band + 1) * rows])):
+            buckets[key].append(i)
+        for members in buckets.values():
+            head = members[0]
+            for i in members[1:]:
+                # 同じ組は複数のバンドで衝突するので Jaccard は一度だけ計算する
+                if (head, i) in pairs or (head, i) in checked:
+                    continue
+                checked.add((head, i))
+                if jaccard(sets[head], sets[i]) >= threshold:
+                    pairs.add((head, i))
+    return representatives(n, pairs)
+
+def representatives(n, pairs):
+    """Smallest row of each connected component of the ``pairs`` graph, per row."""
+    if pairs:
+        a, b = np.array(sorted(pairs)).T
+    else:
+        a = b = np.empty(0, dtype=np.int64)
+    graph = coo_matrix((np.ones(len(a), dtype=np.int8), (a, b)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    # 行は昇順なので、各ラベルの最初の出現がグループ内の最小行 (= 代表)
+    _, first = np.unique(labels, return_index=True)
+    return first[labels]
+
+def save_groups(representative, ce_matrix, ce_hash, threshold):
+    """Write the deduplicated matrix and, per hunk row, its row in that matrix."""
+    reps, group = np.unique(representative, return_inverse=True)
+    save_npz(DEDUP_MATRIX_FILE, ce_matrix.tocsr()[reps])
+    with open(GROUPS_FILE, "w") as f:
+        json.dump({"ce": ce_hash, "threshold": threshold,
+                   "representatives": reps.tolist(), "group": group.tolist()}, f)
+    return len(reps)
+
+def load_groups(ce_file=CE_MATRIX_FILE, groups_file=GROUPS_FILE, matrix_file=DEDUP_MATRIX_FILE):
+    """Return ``(dedup_matrix, group)``; fails if the groups were built from another ce_tfidf.npz."""
+    with open(groups_file) as f:
+        groups = json.load(f)
+    if groups["ce"] != file_hash(ce_file):
+        raise SystemExit(f"{groups_file} does not match {ce_file}; re-run src/dedup_hunks.py")
+    return load_npz(matrix_file), np.array(groups["group"])
+
+def main():
+    ap = ArgumentParser(description="Group identical and near-duplicate hunks and write a deduplicated CE matrix")
+    ap.add_argument("--threshold", type=float, default=0.9,
+                    help="Minimum Jaccard similarity of CE token sets for near duplicates")
+    ap.add_argument("--num-perm", type=int, default=64, help="MinHash permutations")
+    ap.add_argument("--bands", type=int, default=16, help="LSH bands (num-perm must be divisible by it)")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+    metrics.apply_arguments(args)
+    if args.num_perm % args.bands:
+        ap.error("--num-perm must be a multiple of --bands")
+
+    with metrics.phase("load"):
+        store = HunkStore(HUNKS_DIR)
+        token_sets = [item["ce"] for item in iter_records(CORPUS_FILE)]
+        ce_matrix = load_npz(CE_MATRIX_FILE)
+    if not (len(store) == len(token_sets) == ce_matrix.shape[0]):
+        raise SystemExit(f"hunk store ({len(store)}), {CORPUS_FILE} ({len(token_sets)}) and "
+                         f"{CE_MATRIX_FILE} ({ce_matrix.shape[0]}) are out of sync")
+
+    with metrics.phase("group", items=len(token_sets)):
+        representative = group_hunks(store.iter_texts(), token_sets, threshold=args.threshold,
+                                     num_perm=args.num_perm, bands=args.bands)
+    with metrics.phase("dump"):
+        n_groups = save_groups(representative, ce_matrix, file_hash(CE_MATRIX_FILE), args.threshold)
+    print(f"{len(token_sets)} hunks in {n_groups} groups ({1 - n_groups / max(len(token_sets), 1):.1%} removed)")
+    print(f"Saved {GROUPS_FILE} and {DEDUP_MATRIX_FILE}")
+
+if __name__ == "__main__":
+    with metrics.stage("dedup_hunks"):
+        main()
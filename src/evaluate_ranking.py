@@ -1,8 +1,12 @@
 # src/evaluate_hunks.py
 
 import json
+from argparse import ArgumentParser
 import numpy as np
 from collections import defaultdict
+from scipy.sparse import load_npz
+
+import metrics
 
 def load_data():
     with open("data/similarity_scores.json") as f:
@@ -11,22 +15,20 @@ def load_data():
         fix_hunk_ids = json.load(f)
     return scores, fix_hunk_ids
 
-def evaluate(scores, fix_hunk_ids, ks=(1, 5, 10)):
+def summarize(hit_ranks, ks=(1, 5, 10)):
+    """MAP, MRR and TOP@k over ``(bug_id, ranks)`` pairs.
+
+    ``ranks`` are the sorted 0-based ranks of the bug's gold hunks that
+    were found; an empty list counts as a miss.
+    """
     ap_list = []
     rr_list = []
     hit_dict = {k: [] for k in ks}
 
-    for bug_id, predictions in scores.items():
-        gold_hunks = set(fix_hunk_ids.get(bug_id, []))
-        if not gold_hunks:
-            continue
-
-        predicted_ids = [item.get("commit_id") for item in predictions if "commit_id" in item]
-        hit_ranks = [i for i, hid in enumerate(predicted_ids) if hid in gold_hunks]
-
-        if hit_ranks:
-            ap = sum([(i + 1) / (r + 1) for i, r in enumerate(hit_ranks)]) / len(hit_ranks)
-            rr = 1 / (hit_ranks[0] + 1)
+    for _, ranks in hit_ranks:
+        if ranks:
+            ap = sum([(i + 1) / (r + 1) for i, r in enumerate(ranks)]) / len(ranks)
+            rr = 1 / (ranks[0] + 1)
         else:
             ap = 0.0
             rr = 0.0
@@ -34,7 +36,7 @@ def evaluate(scores, fix_hunk_ids, ks=(1, 5, 10)):
         ap_list.append(ap)
         rr_list.append(rr)
         for k in ks:
-            hit_dict[k].append(int(any(r < k for r in hit_ranks)))
+            hit_dict[k].append(int(any(r < k for r in ranks)))
 
     result = {
         "MAP": float(np.mean(ap_list)) if ap_list else 0.0,
@@ -44,9 +46,97 @@ def evaluate(scores, fix_hunk_ids, ks=(1, 5, 10)):
         result[f"TOP@{k}"] = float(np.mean(hit_dict[k])) if hit_dict[k] else 0.0
     return result
 
+def topk_hit_ranks(scores, fix_hunk_ids):
+    for bug_id, predictions in scores.items():
+        gold_hunks = set(fix_hunk_ids.get(bug_id, []))
+        if not gold_hunks:
+            continue
+
+        predicted_ids = [item.get("commit_id") for item in predictions if "commit_id" in item]
+        yield bug_id, [i for i, hid in enumerate(predicted_ids) if hid in gold_hunks]
+
+def evaluate(scores, fix_hunk_ids, ks=(1, 5, 10)):
+    return summarize(topk_hit_ranks(scores, fix_hunk_ids), ks)
+
+def gold_ranks(scores, gold_cols):
+    """Exact 0-based ranks of ``gold_cols`` in ``scores``, smallest first.
+
+    A column's rank is the number of columns scoring higher plus the tied
+    columns before it (the order a stable sort would give). Only counting is
+    done, so the cost is linear in ``len(scores)`` per gold column.
+    """
+    ranks = [
+        np.count_nonzero(scores > scores[j]) + np.count_nonzero(scores[:j] == scores[j])
+        for j in gold_cols
+    ]
+    return sorted(ranks)
+
+def exact_hit_ranks(score_rows, commit_ids, fix_hunk_ids):
+    columns = defaultdict(list)
+    for j, cid in enumerate(commit_ids):
+        columns[cid].append(j)
+
+    for bug_id, scores in score_rows:
+        gold_hunks = set(fix_hunk_ids.get(bug_id, []))
+        if not gold_hunks:
+            continue
+        gold_cols = [j for hid in gold_hunks for j in columns.get(hid, [])]
+        with metrics.phase("rank", items=1):
+            yield bug_id, gold_ranks(scores, gold_cols)
+
+def evaluate_exact(score_rows, commit_ids, fix_hunk_ids, ks=(1, 5, 10)):
+    """Like ``evaluate`` but over the full ranking instead of the top-k lists.
+
+    ``score_rows`` yields ``(bug_id, scores)`` with one score per entry of
+    ``commit_ids``. Every hunk whose id is in the bug's gold set is ranked,
+    however far down it is.
+    """
+    return summarize(exact_hit_ranks(score_rows, commit_ids, fix_hunk_ids), ks)
+
+def exact_score_rows(bug_ids, nl_matrix, ce_matrix, boost, block_size=256):
+    # top-k の評価 (sweep.py のワーカーも含む) では compute_similarity 以下を読み込まない
+    from compute_similarity import score_blocks
+    for start, block in score_blocks(nl_matrix, ce_matrix, boost, block_size):
+        for bug_id, scores in zip(bug_ids[start:start + len(block)], block):
+            yield bug_id, scores
+
+def load_exact_inputs():
+    with open("data/bug_reports.json") as f:
+        bug_ids = [bug["id"] for bug in json.load(f)]
+    with open("data/commit_ids.json") as f:
+        commit_ids = json.load(f)
+    with open("data/fix_hunk_map.json") as f:
+        fix_hunk_ids = json.load(f)
+    with open("data/commit_features.json") as f:
+        features = json.load(f)
+    # compute_similarity と同じ data/hunk_boost.npy を使い、同じスコア関数を評価する
+    from commit_boost import load_hunk_boost
+    boost = load_hunk_boost(commit_ids, features, commit_ids_file="data/commit_ids.json",
+                            features_file="data/commit_features.json")
+    return bug_ids, commit_ids, fix_hunk_ids, boost
+
 if __name__ == "__main__":
-    scores, fix_hunk_ids = load_data()
-    result = evaluate(scores, fix_hunk_ids)
+    ap = ArgumentParser(description="Evaluate hunk rankings against the fixing hunks of each bug")
+    ap.add_argument("--exact", action="store_true",
+                    help="Rank every gold hunk over the full score vector instead of reading "
+                         "the top-k lists in similarity_scores.json")
+    ap.add_argument("--block-size", type=int, default=256, help="Bugs scored together in exact mode")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+    metrics.apply_arguments(args)
+
+    with metrics.stage("evaluate_ranking"):
+        if args.exact:
+            with metrics.phase("load"):
+                bug_ids, commit_ids, fix_hunk_ids, boost = load_exact_inputs()
+                nl_matrix, ce_matrix = load_npz("data/nl_tfidf.npz"), load_npz("data/ce_tfidf.npz")
+            rows = exact_score_rows(bug_ids, nl_matrix, ce_matrix, boost, block_size=args.block_size)
+            result = evaluate_exact(rows, commit_ids, fix_hunk_ids)
+        else:
+            with metrics.phase("load"):
+                scores, fix_hunk_ids = load_data()
+            with metrics.phase("evaluate", items=len(scores)):
+                result = evaluate(scores, fix_hunk_ids)
 
     print("\n=== Evaluation Result (Hunk Level) ===")
     for key, val in result.items():
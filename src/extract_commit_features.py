@@ -4,6 +4,8 @@
 import json
 import os
 from argparse import ArgumentParser
+from commit_stream import iter_records
+from hunk_tokenizer import patch_keywords
 
 def extract_features(commits):
     features = []
@@ -14,27 +16,22 @@ def extract_features(commits):
         for diff in commit.get("diffs", []):
             if "file" in diff:
                 files.append(diff["file"])
-            patch = diff.get("patch", "")
-            for kw in ["if", "for", "while", "null", "try", "catch"]:
-                if kw in patch:
-                    keywords.add(kw)
+            keywords.update(patch_keywords(diff.get("patch", "")))
         features.append({
             "commit_id": commit_id,
             "files": files,
-            "keywords": list(keywords)
+            "keywords": list(keywords),
+            "date": commit.get("date"),
         })
     return features
 
 def main():
     ap = ArgumentParser()
-    ap.add_argument("input", help="Path to commits.json")
+    ap.add_argument("input", help="Path to commits.json or commits.jsonl")
     ap.add_argument("output", help="Path to output commit_features.json")
     args = ap.parse_args()
 
-    with open(args.input, "r", encoding="utf-8") as f:
-        commits = json.load(f)
-
-    features = extract_features(commits)
+    features = extract_features(iter_records(args.input))
 
     os.makedirs(os.path.dirname(args.output), exist_ok=True)
     with open(args.output, "w", encoding="utf-8") as f:
@@ -1,64 +1,179 @@
 # python src/extract_commits.py ../tomcat data/commits.json --branch main
 # python src/extract_commits.py ../tomcat data/commits-8.5.x.json --branch 8.5.x
+# python src/extract_commits.py ../tomcat data/commits.jsonl --branch main --resume
+# python src/extract_commits.py ../tomcat data/commits.jsonl --branch main --workers 8
+# python src/extract_commits.py ../tomcat data/commits.jsonl --branch main --lazy   # パッチ本文は git から都度読む
 import os
 import json
 import re
 from argparse import ArgumentParser
+from multiprocessing import Pool
 from git import Repo
 from tqdm import tqdm
+from commit_stream import is_jsonl, recover_jsonl
+import metrics
 
-def extract_commits(repo_path: str, branch: str = "main", max_count=None):
+def commit_record(commit, lazy=False):
+    """Build the stored record for ``commit``, or None if it should be skipped.
+
+    With ``lazy``, the diffs only name the files and the record keeps the
+    parent hash instead; git_patches.py reads the patch text when needed.
+    """
+    if not commit.parents:
+        return None
+    diffs = commit.diff(commit.parents[0], create_patch=not lazy)
+
+    diff_data = []
+    file_paths = []
+
+    for diff in diffs:
+        if diff.new_file or diff.deleted_file:
+            continue
+        if not diff.b_path:
+            continue
+        file_paths.append(diff.b_path)
+        if lazy:
+            diff_data.append({"file": diff.b_path})
+            continue
+        try:
+            patch = diff.diff.decode("utf-8", errors="ignore")
+            diff_data.append({"file": diff.b_path, "patch": patch})
+        except Exception:
+            continue
+
+    if file_paths and all(
+        f.startswith(("test", "tests", "docs", "webapps/docs"))
+        for f in file_paths
+    ):
+        return None
+
+    record = {
+        "hash": commit.hexsha,
+        "message": commit.message.strip(),
+        "author": commit.author.name,
+        "date": commit.committed_datetime.isoformat(),
+        "diffs": diff_data,
+    }
+    if lazy:
+        record["parent"] = commit.parents[0].hexsha
+    return record
+
+_worker_repo = None
+_worker_lazy = False
+
+def _init_worker(repo_path, lazy=False):
+    global _worker_repo, _worker_lazy
+    _worker_repo = Repo(repo_path)
+    _worker_lazy = lazy
+
+def _record_for_hash(sha):
+    return commit_record(_worker_repo.commit(sha), lazy=_worker_lazy)
+
+def iter_commit_records_parallel(repo_path: str, branch: str = "main", max_count=None,
+                                 after=None, workers=4, chunksize=16, lazy=False):
+    """Like ``iter_commit_records`` but diffs commits in a process pool.
+
+    The commit range is listed once with ``git rev-list`` and handed out to
+    workers in chunks; ``Pool.imap`` returns results in submission order, so
+    the output is identical to the serial path.
+    """
+    repo = Repo(repo_path)
+    kwargs = {"max_count": max_count} if max_count is not None else {}
+    hashes = repo.git.rev_list(branch, **kwargs).split()
+    if after is not None:
+        if after not in hashes:
+            print(f"Warning: {after} not found on {branch}, nothing extracted")
+            return
+        hashes = hashes[hashes.index(after) + 1:]
+    with Pool(workers, initializer=_init_worker, initargs=(repo_path, lazy)) as pool:
+        for record in tqdm(pool.imap(_record_for_hash, hashes, chunksize=chunksize), total=len(hashes)):
+            if record is not None:
+                yield record
+
+def iter_commit_records(repo_path: str, branch: str = "main", max_count=None, after=None, workers=1,
+                        lazy=False):
+    """Yield commit records one by one without materialising the history.
+
+    If ``after`` is a commit hash, every commit up to and including it is
+    skipped so an interrupted run can continue where it stopped. With
+    ``workers > 1`` the diffs are computed in parallel.
+    """
+    if workers > 1:
+        yield from iter_commit_records_parallel(repo_path, branch=branch, max_count=max_count,
+                                                after=after, workers=workers, lazy=lazy)
+        return
     repo = Repo(repo_path)
-    commits_data = []
+    total = int(repo.git.rev_list("--count", branch))
+    if max_count is not None:
+        total = min(total, max_count)
     iterator = repo.iter_commits(branch, max_count=max_count)
-    for commit in tqdm(list(iterator)):
-        if not commit.parents:
-            continue
-        diffs = commit.diff(commit.parents[0], create_patch=True)
-
-        diff_data = []
-        file_paths = []
-
-        for diff in diffs:
-            if diff.new_file or diff.deleted_file:
-                continue
-            if not diff.b_path:
-                continue
-            file_paths.append(diff.b_path)
-            try:
-                patch = diff.diff.decode("utf-8", errors="ignore")
-                diff_data.append({"file": diff.b_path, "patch": patch})
-            except Exception:
-                continue
-
-        if file_paths and all(
-            f.startswith(("test", "tests", "docs", "webapps/docs"))
-            for f in file_paths
-        ):
+    skipping = after is not None
+    for commit in tqdm(iterator, total=total):
+        if skipping:
+            skipping = commit.hexsha != after
             continue
+        record = commit_record(commit, lazy=lazy)
+        if record is not None:
+            yield record
+    if skipping:
+        print(f"Warning: {after} not found on {branch}, nothing extracted")
+
+def extract_commits(repo_path: str, branch: str = "main", max_count=None, workers=1, lazy=False):
+    return list(iter_commit_records(repo_path, branch=branch, max_count=max_count, workers=workers, lazy=lazy))
 
-        commits_data.append({
-            "hash": commit.hexsha,
-            "message": commit.message.strip(),
-            "author": commit.author.name,
-            "date": commit.committed_datetime.isoformat(),
-            "diffs": diff_data,
-        })
-    return commits_data
+def write_jsonl(records, output, resume=False):
+    """Append ``records`` to ``output`` one per line, flushing after each."""
+    count = 0
+    with open(output, "a" if resume else "w", encoding="utf-8") as f:
+        for record in records:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            count += 1
+    return count
 
 def main():
     ap = ArgumentParser(description="Extract commit data from a git repository")
     ap.add_argument("repo", help="Path to git repository")
-    ap.add_argument("output", help="Path to output JSON file")
+    ap.add_argument("output", help="Path to output JSON file (.jsonl streams one commit per line)")
     ap.add_argument("--branch", default="main", help="Branch to scan")
     ap.add_argument("--max-count", type=int, default=None, help="Limit number of commits")
+    ap.add_argument("--resume", action="store_true",
+                    help="Continue an interrupted .jsonl extraction after the last written commit")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Number of processes computing diffs in parallel")
+    ap.add_argument("--lazy", action="store_true",
+                    help="Store file names and the parent hash only; patch text is read from the "
+                         "repository on demand (set LOCUS_REPO for later stages)")
+    metrics.add_arguments(ap)
     args = ap.parse_args()
+    metrics.apply_arguments(args)
 
     os.makedirs(os.path.dirname(args.output), exist_ok=True)
-    commits = extract_commits(args.repo, branch=args.branch, max_count=args.max_count)
-    with open(args.output, "w", encoding="utf-8") as f:
-        json.dump(commits, f, ensure_ascii=False, indent=2)
+    if args.resume and not is_jsonl(args.output):
+        ap.error("--resume requires a .jsonl output file")
+
+    if is_jsonl(args.output):
+        last = recover_jsonl(args.output) if args.resume else None
+        after = last["hash"] if last else None
+        if after:
+            print(f"Resuming after {after}")
+        records = iter_commit_records(args.repo, branch=args.branch,
+                                      max_count=args.max_count, after=after, workers=args.workers,
+                                      lazy=args.lazy)
+        with metrics.phase("extract") as p:
+            count = p.items = write_jsonl(records, args.output, resume=args.resume)
+        print(f"Saved {count} commits to {args.output}")
+        return
+
+    with metrics.phase("extract") as p:
+        commits = extract_commits(args.repo, branch=args.branch, max_count=args.max_count,
+                                  workers=args.workers, lazy=args.lazy)
+        p.items = len(commits)
+    with metrics.phase("dump", items=len(commits)):
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(commits, f, ensure_ascii=False, indent=2)
     print(f"Saved {len(commits)} commits to {args.output}")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("extract_commits"):
+        main()
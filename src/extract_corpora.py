@@ -1,54 +1,83 @@
+# python src/extract_corpora.py --workers 32
 import json
-import re
+import os
+from argparse import ArgumentParser
+from multiprocessing import Pool
 from tqdm import tqdm
 import nltk
-# python -c "import nltk; nltk.download('stopwords'); nltk.download('punkt_tab')"
-from nltk.corpus import stopwords
-from nltk.tokenize import word_tokenize
+# python -c "import nltk; nltk.download('stopwords')"
+from hunk_store import HunkStore
+from hunk_tokenizer import load_stopwords, tokenize_hunk
+import metrics
 
-STOPWORDS = set(stopwords.words("english"))
+STOPWORDS = load_stopwords()
 
 def extract_nl(hunk):
     # コメント・英語的単語の抽出
-    words = re.findall(r'//.*|/\*.*?\*/|#.*|\"[^\"]+\"|\'[^\']+\'', hunk, re.DOTALL)
-    joined = " ".join(words)
-    tokens = word_tokenize(joined.lower())
-    return [w for w in tokens if w.isalpha() and w not in STOPWORDS]
+    return tokenize_hunk(hunk, STOPWORDS, ce=False, features=False).nl
 
 def extract_ce(hunk):
-    identifiers = set()
-    for line in hunk.splitlines():
-        if not line.startswith('+'):
-            continue
-        # 関数・クラス・変数らしきもの
-        matches = re.findall(r'\b([a-zA-Z_]\w*)\b', line)
-        for match in matches:
-            if len(match) > 1 and match.lower() not in STOPWORDS:
-                identifiers.add(match)
-    return list(identifiers)
+    # 追加行の関数・クラス・変数らしきもの
+    return tokenize_hunk(hunk, STOPWORDS, nl=False, features=False).ce
+
+HUNKS_DIR = "data/hunks"
+OUTPUT_FILE = "data/hunk_corpus.jsonl"
+
+_worker_store = None
+
+def _init_worker(store_path):
+    # 各ワーカーはストアを自前で mmap する (本文をプロセス間で送らない)。
+    # ストップワードはモジュール読み込み時にワーカーごとに一度だけ読まれる
+    global _worker_store
+    _worker_store = HunkStore(store_path)
+
+def corpus_lines(store, start, end):
+    """JSON lines with the NL and CE tokens of hunk rows ``start:end``."""
+    lines = []
+    for i in range(start, end):
+        tokens = tokenize_hunk(store.text(i), STOPWORDS, features=False)
+        lines.append(json.dumps({"hunk_id": store.hunk_id(i), "nl": tokens.nl, "ce": tokens.ce}))
+    return lines
+
+def _corpus_lines_for_range(bounds):
+    return corpus_lines(_worker_store, *bounds)
 
 def main():
-    with open("data/hunks.json") as f:
-        hunks = json.load(f)
+    ap = ArgumentParser(description="Extract NL and CE token corpora from the hunk store")
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Number of tokenizer processes (0 = all cores)")
+    ap.add_argument("--chunk-size", type=int, default=2000, help="Hunks per work item")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+    metrics.apply_arguments(args)
 
-    result = []
-    for h in tqdm(hunks, desc="Extracting corpora"):
-        hunk_text = h["hunk"]
-        nl_tokens = extract_nl(hunk_text)
-        ce_tokens = extract_ce(hunk_text)
-        result.append({
-            "hunk_id": h["hunk_id"],
-            "nl": nl_tokens,
-            "ce": ce_tokens
-        })
+    store = HunkStore(HUNKS_DIR)
+    workers = args.workers or os.cpu_count()
+    chunks = [(s, min(s + args.chunk_size, len(store))) for s in range(0, len(store), args.chunk_size)]
 
-    with open("data/hunk_corpus.json", "w") as f:
-        json.dump(result, f, indent=2)
+    count = 0
+    progress = tqdm(total=len(store), desc="Extracting corpora")
+    # トークン化と書き出しは並行して進むので1つのフェーズで測る
+    with metrics.phase("tokenize") as p, open(OUTPUT_FILE, "w") as f:
+        if workers > 1:
+            with Pool(workers, initializer=_init_worker, initargs=(HUNKS_DIR,)) as pool:
+                # imap は投入順に結果を返すので、出力はハンク順のまま
+                for lines in pool.imap(_corpus_lines_for_range, chunks):
+                    f.write("\n".join(lines) + "\n")
+                    count += len(lines)
+                    progress.update(len(lines))
+        else:
+            for start, end in chunks:
+                lines = corpus_lines(store, start, end)
+                f.write("\n".join(lines) + "\n")
+                count += len(lines)
+                progress.update(len(lines))
+        p.items = count
+    progress.close()
 
-    print(f"Saved corpus for {len(result)} hunks to data/hunk_corpus.json")
+    print(f"Saved corpus for {count} hunks to {OUTPUT_FILE}")
 
 if __name__ == "__main__":
-    import nltk
-    nltk.download("punkt")
     nltk.download("stopwords")
-    main()
+    with metrics.stage("extract_corpora"):
+        main()
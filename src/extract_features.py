@@ -1,28 +1,34 @@
 import json
 import os
+from argparse import ArgumentParser
 from sklearn.feature_extraction.text import TfidfVectorizer
 from scipy import sparse
 import numpy as np
+from commit_stream import iter_records
+from hashing_features import (DEFAULT_N_FEATURES, DocumentFrequencies, HashingTfidf, apply_idf, count_texts,
+                              iter_counts)
+from streaming_tfidf import collect_stats, iter_tfidf_chunks, make_analyzer, write_rows
+import metrics
 
 NL_FILE = "data/bug_reports.json"
-CE_FILE = "data/hunk_corpus.json"
+CE_FILE = "data/hunk_corpus.jsonl"
 VOCAB_FILE = "data/tfidf_vocab.json"
 NL_MATRIX_FILE = "data/nl_tfidf.npz"
 CE_MATRIX_FILE = "data/ce_tfidf.npz"
+STATS_FILE = "data/tfidf_stats.npz"
 
-def load_texts(json_path, key):
-    with open(json_path) as f:
-        items = json.load(f)
-    texts = []
-    for item in items:
+def iter_texts(json_path, key):
+    for item in iter_records(json_path):
         value = item.get(key)
         if isinstance(value, list):
-            texts.append(" ".join(value))
+            yield " ".join(value)
         elif isinstance(value, str):
-            texts.append(value)
+            yield value
         else:
-            texts.append("")
-    return texts
+            yield ""
+
+def load_texts(json_path, key):
+    return list(iter_texts(json_path, key))
 
 def save_sparse_matrix(filename, matrix):
     sparse.save_npz(filename, matrix)
@@ -30,27 +36,134 @@ def save_sparse_matrix(filename, matrix):
 def convert_vocab_to_serializable(vocab):
     return {str(k): int(v) for k, v in vocab.items()}
 
-def main():
-    print("Loading data...")
-    nl_texts = load_texts(NL_FILE, "summary")  # could use description too
-    ce_texts = load_texts(CE_FILE, "ce")
+def document_frequencies(*matrices):
+    # TF-IDF の非ゼロ要素 = 文書に現れた語 なので、列ごとの非ゼロ数が df になる
+    n_features = matrices[0].shape[1]
+    df = np.zeros(n_features, dtype=np.int64)
+    for m in matrices:
+        df += np.bincount(m.indices, minlength=n_features)
+    return df
 
-    print("Fitting shared TF-IDF vectorizer...")
-    vectorizer = TfidfVectorizer(lowercase=True, stop_words='english', max_features=10000)
-    vectorizer.fit(nl_texts + ce_texts)
+def save_stats(filename, idf, df, n_docs):
+    """Save what is needed to transform new documents without refitting."""
+    np.savez(filename, idf=idf, df=df, n_docs=np.int64(n_docs))
+
+def load_stats(filename):
+    with np.load(filename) as f:
+        return f["idf"], f["df"], int(f["n_docs"])
+
+def fit_vocabulary(nl_texts, ce_texts):
+    with metrics.phase("fit", items=len(nl_texts) + len(ce_texts)):
+        vectorizer = TfidfVectorizer(lowercase=True, stop_words='english', max_features=10000)
+        vectorizer.fit(nl_texts + ce_texts)
 
     print("Transforming NL texts...")
-    nl_matrix = vectorizer.transform(nl_texts)
+    with metrics.phase("transform_nl", items=len(nl_texts)):
+        nl_matrix = vectorizer.transform(nl_texts)
     print("Transforming CE texts...")
-    ce_matrix = vectorizer.transform(ce_texts)
+    with metrics.phase("transform_ce", items=len(ce_texts)):
+        ce_matrix = vectorizer.transform(ce_texts)
+    vocab = convert_vocab_to_serializable(vectorizer.vocabulary_)
+    df = document_frequencies(nl_matrix, ce_matrix)
+    return vocab, vectorizer.idf_, df, nl_matrix, ce_matrix
+
+def hash_features(nl_texts, ce_texts, n_features, chunk_size=5000, workers=1):
+    # fit が要らないので、CE はファイルから流しながらチャンクごとにワーカーで数える
+    dfs = DocumentFrequencies(n_features)
+    with metrics.phase("count_nl") as p:
+        nl_counts = count_texts(nl_texts, n_features, chunk_size, workers, dfs=dfs)
+        p.items = nl_counts.shape[0]
+    print("Counting CE texts...")
+    with metrics.phase("count_ce") as p:
+        ce_counts = count_texts(ce_texts, n_features, chunk_size, workers, dfs=dfs)
+        p.items = ce_counts.shape[0]
+    idf = dfs.idf()
+    with metrics.phase("apply_idf", items=dfs.n_docs):
+        nl_matrix = apply_idf(nl_counts, idf)
+        ce_matrix = apply_idf(ce_counts, idf)
+    return HashingTfidf(n_features).config(), idf, dfs.df, nl_matrix, ce_matrix
+
+def text_docs(json_path, key):
+    return (((text, 1),) for text in iter_texts(json_path, key))
+
+def out_of_core_features(chunk_size=5000):
+    # 2パス: 文字列のリストを作らず、行はチャンクごとに npz へ流す (streaming_tfidf.py)
+    analyze = make_analyzer()
+    with metrics.phase("count") as p:
+        stats = collect_stats(text_docs(NL_FILE, "summary"), analyze)
+        collect_stats(text_docs(CE_FILE, "ce"), analyze, stats)
+        p.items = stats.n_docs
+    vocab, idf, df = stats.vocabulary(max_features=10000)
+    print(f"Selected {len(vocab)} of {len(stats.tf)} terms; writing rows...")
+    write_rows(iter_tfidf_chunks(text_docs(NL_FILE, "summary"), analyze, vocab, idf, chunk_size),
+               len(vocab), NL_MATRIX_FILE)
+    write_rows(iter_tfidf_chunks(text_docs(CE_FILE, "ce"), analyze, vocab, idf, chunk_size),
+               len(vocab), CE_MATRIX_FILE)
+    return vocab, idf, df, stats.n_docs
+
+def hash_features_out_of_core(n_features, chunk_size=5000, workers=1):
+    # 1パス目は df だけを数えて捨て、2パス目で数え直して IDF を掛けながら書き出す
+    dfs = DocumentFrequencies(n_features)
+    with metrics.phase("count") as p:
+        for path, key in ((NL_FILE, "summary"), (CE_FILE, "ce")):
+            for counts in iter_counts(iter_texts(path, key), n_features, chunk_size, workers):
+                dfs.add(counts)
+        p.items = dfs.n_docs
+    idf = dfs.idf()
+    for path, key, output in ((NL_FILE, "summary", NL_MATRIX_FILE), (CE_FILE, "ce", CE_MATRIX_FILE)):
+        counts = iter_counts(iter_texts(path, key), n_features, chunk_size, workers)
+        write_rows((apply_idf(c, idf) for c in counts), n_features, output)
+    return HashingTfidf(n_features).config(), idf, dfs.df, dfs.n_docs
+
+def main():
+    ap = ArgumentParser(description="Vectorize bug reports and hunk CE tokens into TF-IDF matrices")
+    ap.add_argument("--vectorizer", choices=["vocab", "hashing"], default="vocab",
+                    help="vocab: fit a 10000-term vocabulary, hashing: feature hashing without a fit")
+    ap.add_argument("--n-features", type=int, default=DEFAULT_N_FEATURES, help="Hashing: number of columns")
+    ap.add_argument("--workers", type=int, default=1, help="Hashing: processes counting chunks")
+    ap.add_argument("--chunk-size", type=int, default=5000, help="Texts per chunk (hashing and out-of-core)")
+    ap.add_argument("--out-of-core", action="store_true",
+                    help="Two passes over the texts with bounded memory; rows are streamed to the .npz files")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+    metrics.apply_arguments(args)
+
+    if args.out_of_core:
+        if args.vectorizer == "hashing":
+            vocab, idf, df, n_docs = hash_features_out_of_core(args.n_features, args.chunk_size, args.workers)
+        else:
+            vocab, idf, df, n_docs = out_of_core_features(args.chunk_size)
+        with metrics.phase("dump"):
+            with open(VOCAB_FILE, "w") as f:
+                json.dump(vocab, f)
+            save_stats(STATS_FILE, idf, df, n_docs)
+        print("Done.")
+        return
+
+    print("Loading data...")
+    with metrics.phase("load") as p:
+        nl_texts = load_texts(NL_FILE, "summary")  # could use description too
+        ce_texts = load_texts(CE_FILE, "ce") if args.vectorizer == "vocab" else iter_texts(CE_FILE, "ce")
+        p.items = len(nl_texts)
+
+    if args.vectorizer == "hashing":
+        print(f"Hashing texts into {args.n_features} columns...")
+        vocab, idf, df, nl_matrix, ce_matrix = hash_features(
+            nl_texts, ce_texts, args.n_features, args.chunk_size, args.workers)
+    else:
+        print("Fitting shared TF-IDF vectorizer...")
+        vocab, idf, df, nl_matrix, ce_matrix = fit_vocabulary(nl_texts, ce_texts)
 
     print("Saving TF-IDF matrices and vocab")
-    save_sparse_matrix(NL_MATRIX_FILE, nl_matrix)
-    save_sparse_matrix(CE_MATRIX_FILE, ce_matrix)
-    with open(VOCAB_FILE, "w") as f:
-        json.dump(convert_vocab_to_serializable(vectorizer.vocabulary_), f)
+    with metrics.phase("dump"):
+        save_sparse_matrix(NL_MATRIX_FILE, nl_matrix)
+        save_sparse_matrix(CE_MATRIX_FILE, ce_matrix)
+        with open(VOCAB_FILE, "w") as f:
+            json.dump(vocab, f)
+        save_stats(STATS_FILE, idf, df, nl_matrix.shape[0] + ce_matrix.shape[0])
 
     print("Done.")
 
 if __name__ == "__main__":
-    main()
+    with metrics.stage("extract_features"):
+        main()
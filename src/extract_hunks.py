@@ -1,26 +1,12 @@
+# python src/extract_hunks.py
+# python src/extract_hunks.py --commits data/commits.jsonl --repo ../tomcat --lazy   # 本文は保存しない
 import json
-import re
-import os
+from argparse import ArgumentParser
 from tqdm import tqdm
-
-HUNK_HEADER_RE = re.compile(r"^@@ -\d+(,\d+)? \+\d+(,\d+)? @@")
-
-
-def split_patch_into_hunks(patch):
-    lines = patch.splitlines()
-    hunks = []
-    current_hunk = []
-    for line in lines:
-        if HUNK_HEADER_RE.match(line):
-            if current_hunk:
-                hunks.append(current_hunk)
-            current_hunk = [line]
-        elif current_hunk:
-            current_hunk.append(line)
-    if current_hunk:
-        hunks.append(current_hunk)
-    return hunks
-
+from commit_stream import iter_records
+from git_patches import split_patch_into_hunks
+from hunk_store import HunkStoreWriter
+import metrics
 
 def is_valid_hunk(hunk_lines):
     for line in hunk_lines:
@@ -37,15 +23,12 @@ def is_valid_hunk(hunk_lines):
     return False
 
 
-def extract_hunks_from_commits(commits_file, output_file):
-    with open(commits_file) as f:
-        commits = json.load(f)
-
-    hunk_id = 0
-    hunk_data = []
-
-    for commit in tqdm(commits, desc="Extracting hunks"):
+def iter_hunks(commits, start=0):
+    """Yield hunk records for ``commits``, numbering ``hunk_id`` from ``start``."""
+    hunk_id = start
+    for commit in commits:
         commit_id = commit.get("hash") or commit.get("commit_id")
+        commit_date = commit.get("date")
         for diff in commit.get("diffs", []):
             patch = diff.get("patch")
             file_path = diff.get("file") or diff.get("new_path") or diff.get("old_path")
@@ -58,20 +41,61 @@ def extract_hunks_from_commits(commits_file, output_file):
                 if not is_valid_hunk(hunk):
                     continue
                 hunk_text = "\n".join(hunk)
-                hunk_data.append({
+                record = {
                     "hunk_id": f"{commit_id}_{hunk_id}",
                     "commit_id": commit_id,
                     "file_path": file_path,
                     "hunk": hunk_text,
-                    "index": i
-                })
+                    "index": i,
+                    "date": commit_date
+                }
+                if commit.get("parent"):
+                    record["parent"] = commit["parent"]
+                yield record
                 hunk_id += 1
 
-    with open(output_file, "w") as f:
-        json.dump(hunk_data, f, indent=2)
 
-    print(f"Saved {len(hunk_data)} hunks to {output_file}")
+def extract_hunks_from_commits(commits_file, output_file, repo=None, lazy=False):
+    """Write hunks to a columnar store, or to a JSON list if ``output_file`` ends in .json.
+
+    With ``lazy`` the store keeps only the hunk coordinates; the texts are
+    read back from ``repo`` by ``HunkStore.text``.
+    """
+    commits = tqdm(iter_records(commits_file, repo=repo), desc="Extracting hunks")
+    if output_file.endswith(".json"):
+        with metrics.phase("split") as p:
+            hunk_data = list(iter_hunks(commits))
+            p.items = len(hunk_data)
+        with metrics.phase("dump", items=len(hunk_data)):
+            with open(output_file, "w") as f:
+                json.dump(hunk_data, f, indent=2)
+        count = len(hunk_data)
+    else:
+        # ストアへは逐次書き込むので、分割と書き込みを1つのフェーズとして測る
+        with metrics.phase("split") as p, HunkStoreWriter(output_file, lazy=lazy, repo=repo) as writer:
+            for hunk in iter_hunks(commits):
+                writer.add(hunk)
+            count = p.items = len(writer)
+
+    print(f"Saved {count} hunks to {output_file}")
+
+
+def main():
+    ap = ArgumentParser(description="Split commit patches into hunks")
+    ap.add_argument("--commits", default="data/commits.json", help="Commits file (.json or .jsonl)")
+    ap.add_argument("--output", default="data/hunks", help="Hunk store directory (or a .json file)")
+    ap.add_argument("--repo", default=None,
+                    help="Git repository to read patches of --lazy commits from (default: $LOCUS_REPO)")
+    ap.add_argument("--lazy", action="store_true",
+                    help="Store hunk coordinates only and read the texts from --repo on demand")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+    metrics.apply_arguments(args)
+    if args.lazy and args.output.endswith(".json"):
+        ap.error("--lazy requires a hunk store directory as --output")
+    extract_hunks_from_commits(args.commits, args.output, repo=args.repo, lazy=args.lazy)
 
 
 if __name__ == "__main__":
-    extract_hunks_from_commits("data/commits.json", "data/hunks.json")
+    with metrics.stage("extract_hunks"):
+        main()
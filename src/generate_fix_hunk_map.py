@@ -1,21 +1,20 @@
 import json
 from collections import defaultdict
+from hunk_store import HunkStore
 
 BUG_REPORTS_FILE = "data/bug_reports.json"
-HUNKS_FILE = "data/hunks.json"
+HUNKS_DIR = "data/hunks"
 OUTPUT_FILE = "data/fix_hunk_map.json"
 
 with open(BUG_REPORTS_FILE) as f:
     bugs = json.load(f)
 
-with open(HUNKS_FILE) as f:
-    hunks = json.load(f)
+store = HunkStore(HUNKS_DIR)
 
 # Map prefix to hunk_ids
 prefix_to_hunks = defaultdict(list)
-for hunk in hunks:
-    hunk_id = f"{hunk['commit_id']}:{hunk['index']}"
-    prefix_to_hunks[hunk['commit_id'][:7]].append(hunk_id)
+for hunk_id in store.commit_index_ids():
+    prefix_to_hunks[hunk_id[:7]].append(hunk_id)
 
 fix_hunk_map = {}
 
@@ -1,14 +1,19 @@
 # src/generate_hunk_ids.py
 
 import json
+from hunk_store import HunkStore
 
-with open("data/hunks.json") as f:
-    hunks = json.load(f)
+store = HunkStore("data/hunks")
 
 # 各ハンクのIDを "commit_id:index" として構築
-hunk_ids = [f"{h['commit_id']}:{h['index']}" for h in hunks]
+hunk_ids = store.commit_index_ids()
 
 with open("data/commit_ids.json", "w") as f:
     json.dump(hunk_ids, f)
 
+# time-aware ランキング用に同じ並びでコミット日時も保存
+hunk_dates = store.dates()
+with open("data/hunk_dates.json", "w") as f:
+    json.dump(hunk_dates, f)
+
 print(f"Saved {len(hunk_ids)} hunk IDs to data/commit_ids.json")
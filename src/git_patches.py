@@ -0,0 +1,154 @@
+# src/git_patches.py
+# python src/extract_commits.py ../tomcat data/commits.jsonl --lazy      # パッチ本文を保存しない
+# python src/extract_hunks.py --repo ../tomcat --lazy                    # ストアには座標だけ
+#
+# パッチ本文は Tomcat のリポジトリにすでに圧縮されて入っているので、データには
+# (コミット, 親, パス, ハンク番号) だけを持ち、本文は必要になったときに git から読む。
+# 常駐する `git diff-tree --stdin` に「コミット 親」を1行ずつ送り、コミット単位の結果を LRU で保持する。
+# ハンクはコミット順に読まれるので、1コミットにつき git への問い合わせは1回で済む。
+
+import re
+import subprocess
+from collections import OrderedDict
+
+HUNK_HEADER_RE = re.compile(r"^@@ -\d+(,\d+)? \+\d+(,\d+)? @@")
+
+# diff の行にはならない文字列。diff-tree --stdin はコミット ID でない行をそのまま出力するので、
+# 1回分の出力の終わりの目印に使う
+SENTINEL = b"locus-end-of-diff\n"
+
+# GitPython の commit.diff(parent, create_patch=True) と同じ向き・オプション
+# (コミット -> 親 の差分なので、"コミット 親" を渡して -R で反転する)
+DIFF_TREE_ARGS = ["diff-tree", "--stdin", "--no-commit-id", "-r", "-p", "-R", "-M",
+                  "--full-index", "--abbrev=40", "--no-ext-diff", "--no-color"]
+
+def split_patch_into_hunks(patch):
+    lines = patch.splitlines()
+    hunks = []
+    current_hunk = []
+    for line in lines:
+        if HUNK_HEADER_RE.match(line):
+            if current_hunk:
+                hunks.append(current_hunk)
+            current_hunk = [line]
+        elif current_hunk:
+            current_hunk.append(line)
+    if current_hunk:
+        hunks.append(current_hunk)
+    return hunks
+
+def unquote_path(path):
+    # パスに空白があると末尾にタブが付き、非 ASCII などは "..." で C 風にエスケープされる
+    path = path.rstrip("\n").rstrip("\t")
+    if path.startswith('"') and path.endswith('"'):
+        path = path[1:-1].encode("latin-1", "backslashreplace").decode("unicode_escape") \
+            .encode("latin-1").decode("utf-8", errors="ignore")
+    return path
+
+def diff_path(header_path):
+    path = unquote_path(header_path)
+    return None if path == "/dev/null" else path[2:]
+
+def parse_patches(lines):
+    """Split ``git diff-tree -p`` output into ``{path: patch}``.
+
+    ``path`` is the destination path (GitPython's ``b_path``) and ``patch``
+    the text from the first ``@@`` line on, as in ``Diff.diff``. Added,
+    deleted and binary files are left out, like extract_commits does.
+    """
+    patches = {}
+    path, body, skip = None, None, False
+
+    def flush():
+        if path and body is not None and not skip:
+            patches[path] = "".join(body)
+
+    for line in lines:
+        if line.startswith("diff --git "):
+            flush()
+            path, body, skip = None, None, False
+        elif body is not None:
+            body.append(line)
+        elif line.startswith("@@"):
+            body = [line]
+        elif line.startswith(("new file mode", "deleted file mode")):
+            skip = True
+        elif line.startswith("rename to "):
+            path = unquote_path(line[len("rename to "):])
+        elif line.startswith("+++ "):
+            path = diff_path(line[4:]) or path
+    flush()
+    return patches
+
+class PatchReader:
+    """Patch texts read on demand from a long-lived ``git diff-tree --stdin`` process.
+
+    ``patches(commit, parent)`` returns ``{path: patch}`` for one commit;
+    the last ``cache_size`` commits are kept in an LRU cache, together with
+    their patches split into hunks for ``hunk()``.
+    """
+
+    def __init__(self, repo_path, cache_size=256):
+        self.repo_path = repo_path
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.proc = None
+
+    def _start(self):
+        self.proc = subprocess.Popen(["git", "-C", self.repo_path] + DIFF_TREE_ARGS,
+                                     stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def _read(self, commit, parent):
+        if self.proc is None or self.proc.poll() is not None:
+            self._start()
+        self.proc.stdin.write(f"{commit} {parent}\n".encode() + SENTINEL)
+        self.proc.stdin.flush()
+        lines = []
+        for raw in iter(self.proc.stdout.readline, b""):
+            if raw == SENTINEL:
+                return parse_patches(lines)
+            lines.append(raw.decode("utf-8", errors="ignore"))
+        raise RuntimeError(f"git diff-tree exited while reading {commit} in {self.repo_path}")
+
+    def _entry(self, commit, parent):
+        entry = self.cache.get(commit)
+        if entry is None:
+            entry = {"patches": self._read(commit, parent), "hunks": {}}
+            self.cache[commit] = entry
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        else:
+            self.cache.move_to_end(commit)
+        return entry
+
+    def patches(self, commit, parent):
+        return self._entry(commit, parent)["patches"]
+
+    def hunk(self, commit, parent, path, index):
+        """Text of hunk ``index`` (as numbered by extract_hunks) of ``path`` in ``commit``."""
+        entry = self._entry(commit, parent)
+        if path not in entry["hunks"]:
+            entry["hunks"][path] = split_patch_into_hunks(entry["patches"].get(path, ""))
+        return "\n".join(entry["hunks"][path][index])
+
+    def close(self):
+        if self.proc is not None:
+            self.proc.stdin.close()
+            self.proc.wait()
+            self.proc = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def fill_patches(commits, reader):
+    """Yield ``commits``, adding the patch text to the diffs of lazily extracted records."""
+    for commit in commits:
+        diffs = commit.get("diffs", [])
+        if commit.get("parent") and any("patch" not in d for d in diffs):
+            patches = reader.patches(commit.get("hash") or commit.get("commit_id"), commit["parent"])
+            commit = dict(commit, diffs=[d if "patch" in d else dict(d, patch=patches.get(d["file"], ""))
+                                         for d in diffs])
+        yield commit
@@ -0,0 +1,113 @@
+# src/hashing_features.py
+# python src/extract_features.py --vectorizer hashing --workers 4
+# python src/build_corpus.py --vectorizer hashing --workers 4
+#
+# 語彙を fit しない TF-IDF。語は特徴量ハッシュで列に割り当てるので、文書をチャンクに分けて
+# ワーカーで個別に数えられる。df はチャンクごとに足し合わせ、最後に IDF を列スケールとして掛ける。
+# tfidf_vocab.json には語彙の代わりにハッシュの設定 {"hashing": {"n_features": ...}} を書くので、
+# load_vectorizer() を使う箇所 (serve.py, update_index.py, shards.py) はそのまま動く。
+
+from itertools import islice
+from multiprocessing import Pool
+import numpy as np
+from scipy.sparse import csr_matrix, vstack
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+DEFAULT_N_FEATURES = 2 ** 18
+
+def make_hasher(n_features=DEFAULT_N_FEATURES):
+    # TfidfVectorizer(lowercase=True, stop_words="english") と同じ分かち書きで、生の出現回数を返す
+    return HashingVectorizer(lowercase=True, stop_words="english", n_features=n_features,
+                             alternate_sign=False, norm=None)
+
+def smooth_idf(df, n_docs):
+    # TfidfVectorizer(smooth_idf=True) と同じ式
+    return np.log((1 + n_docs) / (1 + df)) + 1
+
+class HashingTfidf:
+    """Stateless TF-IDF transform over hashed term columns.
+
+    Only ``idf_`` (one value per hash bucket) is learned; it comes from the
+    document frequencies accumulated while the corpus was counted.
+    """
+
+    def __init__(self, n_features=DEFAULT_N_FEATURES, idf=None):
+        self.n_features = n_features
+        self.hasher = make_hasher(n_features)
+        self.idf_ = idf
+
+    def config(self):
+        """What tfidf_vocab.json holds in place of a vocabulary."""
+        return {"hashing": {"n_features": self.n_features}}
+
+    def counts(self, texts):
+        return self.hasher.transform(texts)
+
+    def transform(self, texts):
+        if self.idf_ is None:
+            raise ValueError("HashingTfidf has no IDF; load it with the idf from tfidf_stats.npz")
+        return apply_idf(self.counts(texts), self.idf_)
+
+def apply_idf(counts, idf):
+    """``tf * idf`` with L2-normalised rows, as TfidfVectorizer.transform does."""
+    return normalize(csr_matrix(counts.multiply(idf)))
+
+_hasher = None
+
+def _init_worker(n_features):
+    global _hasher
+    _hasher = make_hasher(n_features)
+
+def _count_chunk(texts):
+    return _hasher.transform(texts)
+
+def chunked(iterable, size):
+    it = iter(iterable)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def map_chunks(func, chunks, n_features, workers=1, initializer=_init_worker):
+    """Apply ``func`` to every chunk in order, in a process pool if ``workers > 1``."""
+    if workers > 1:
+        with Pool(workers, initializer=initializer, initargs=(n_features,)) as pool:
+            yield from pool.imap(func, chunks)
+    else:
+        initializer(n_features)
+        yield from map(func, chunks)
+
+def iter_counts(texts, n_features=DEFAULT_N_FEATURES, chunk_size=5000, workers=1):
+    """Yield hashed term counts of ``texts`` one CSR chunk of ``chunk_size`` rows at a time."""
+    yield from map_chunks(_count_chunk, chunked(texts, chunk_size), n_features, workers)
+
+class DocumentFrequencies:
+    """Running document frequencies over count chunks."""
+
+    def __init__(self, n_features):
+        self.df = np.zeros(n_features, dtype=np.int64)
+        self.n_docs = 0
+
+    def add(self, counts):
+        counts = csr_matrix(counts)
+        counts.eliminate_zeros()
+        self.df += np.bincount(counts.indices, minlength=len(self.df))
+        self.n_docs += counts.shape[0]
+        return counts
+
+    def idf(self):
+        return smooth_idf(self.df, self.n_docs)
+
+def count_texts(texts, n_features=DEFAULT_N_FEATURES, chunk_size=5000, workers=1, dfs=None):
+    """Hashed term counts of ``texts`` as one CSR matrix, counted in chunks.
+
+    If ``dfs`` (a ``DocumentFrequencies``) is given, every chunk is added to it.
+    """
+    chunks = []
+    for counts in iter_counts(texts, n_features, chunk_size, workers):
+        chunks.append(dfs.add(counts) if dfs is not None else counts)
+    if not chunks:
+        return csr_matrix((0, n_features))
+    return vstack(chunks, format="csr")
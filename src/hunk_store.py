@@ -0,0 +1,233 @@
+# src/hunk_store.py
+# python src/hunk_store.py data/hunks.json data/hunks   # 既存の hunks.json を変換
+#
+# ハンクを列ごとに保存するストア。
+#   meta.json    行数と、コミット・ファイルの文字列テーブル
+#   commit.npy   各行のコミット番号 (meta の commits への添字)
+#   file.npy     各行のファイル番号 (meta の files への添字)
+#   index.npy    パッチ内でのハンク番号
+#   offsets.npy  text.bin 内の各ハンク本文の開始位置 (行数 + 1 個)
+#   text.bin     UTF-8 のハンク本文を連結したもの
+# 各ステージは必要な列だけを読み、本文は mmap で必要な分だけ読む。
+#
+# extract_hunks.py --lazy で作ったストアは offsets.npy と text.bin を持たず、meta に
+# 各コミットの親 (commit_parents) と元のリポジトリを記録する。本文は
+# (コミット, 親, ファイル, ハンク番号) から git_patches.PatchReader で読み直す。
+
+import json
+import os
+import sys
+import numpy as np
+
+from commit_stream import REPO_ENV
+from git_patches import PatchReader
+
+FORMAT_VERSION = 1
+COLUMNS = ("commit", "file", "index")
+
+class HunkStoreWriter:
+    """Append hunk records (as produced by ``extract_hunks.iter_hunks``) to a store.
+
+    With ``lazy`` no text is written; the records must carry the ``parent``
+    of their commit so the text can be read back from ``repo``.
+    """
+
+    def __init__(self, path, append=False, lazy=False, repo=None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self.lazy = lazy
+        self.repo = os.path.abspath(repo) if repo else None
+        self.commits, self.commit_dates, self.commit_parents, self.files = [], [], [], []
+        self.columns = {name: [] for name in COLUMNS}
+        self.offsets = [0]
+        if append and os.path.exists(os.path.join(path, "meta.json")):
+            store = HunkStore(path)
+            self.lazy = store.lazy
+            self.repo = self.repo or store.repo
+            self.commits = list(store.commits)
+            self.commit_dates = list(store.commit_dates)
+            self.commit_parents = list(store.commit_parents)
+            self.files = list(store.files)
+            for name in COLUMNS:
+                self.columns[name] = store.column(name).tolist()
+            if not self.lazy:
+                self.offsets = store.offsets.tolist()
+        elif os.path.exists(os.path.join(path, "meta.json")):
+            # 作り直すときは古い meta.json を先に消し、書きかけのストアが開けないようにする
+            os.remove(os.path.join(path, "meta.json"))
+        self._commit_pos = {c: i for i, c in enumerate(self.commits)}
+        self._file_pos = {f: i for i, f in enumerate(self.files)}
+        self._text = None
+        if self.lazy:
+            # 本文を持っていた以前のストアの残りは消しておく
+            for name in ("text.bin", "offsets.npy"):
+                if os.path.exists(os.path.join(path, name)):
+                    os.remove(os.path.join(path, name))
+            return
+        text_path = os.path.join(path, "text.bin")
+        # 途中で落ちた書き込みの残りを捨ててから追記する
+        self._text = open(text_path, "r+b" if append and os.path.exists(text_path) else "wb")
+        self._text.truncate(self.offsets[-1])
+        self._text.seek(self.offsets[-1])
+
+    def __len__(self):
+        return len(self.columns["commit"])
+
+    def add(self, hunk):
+        commit_id = hunk["commit_id"]
+        if self.lazy and not hunk.get("parent"):
+            raise ValueError(f"{self.path} is a lazy hunk store; {commit_id} was not extracted with --lazy")
+        if commit_id not in self._commit_pos:
+            self._commit_pos[commit_id] = len(self.commits)
+            self.commits.append(commit_id)
+            self.commit_dates.append(hunk.get("date"))
+            self.commit_parents.append(hunk.get("parent"))
+        if hunk["file_path"] not in self._file_pos:
+            self._file_pos[hunk["file_path"]] = len(self.files)
+            self.files.append(hunk["file_path"])
+        self.columns["commit"].append(self._commit_pos[commit_id])
+        self.columns["file"].append(self._file_pos[hunk["file_path"]])
+        self.columns["index"].append(hunk["index"])
+        if self.lazy:
+            return
+        data = hunk["hunk"].encode("utf-8")
+        self._text.write(data)
+        self.offsets.append(self.offsets[-1] + len(data))
+
+    def close(self):
+        for name in COLUMNS:
+            np.save(os.path.join(self.path, f"{name}.npy"), np.array(self.columns[name], dtype=np.int32))
+        if self._text is not None:
+            self._text.close()
+            np.save(os.path.join(self.path, "offsets.npy"), np.array(self.offsets, dtype=np.int64))
+        # meta.json を最後に書くので、書きかけのストアは行数が更新されない
+        meta = {
+            "version": FORMAT_VERSION,
+            "rows": len(self),
+            "commits": self.commits,
+            "commit_dates": self.commit_dates,
+            "files": self.files,
+        }
+        if self.lazy:
+            meta.update(lazy=True, repo=self.repo, commit_parents=self.commit_parents)
+        with open(os.path.join(self.path, "meta.json"), "w") as f:
+            json.dump(meta, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        elif self._text is not None:
+            # meta.json は書かないので、ストアは前回の行数のまま開ける
+            self._text.close()
+
+class HunkStore:
+    """Read-only view of a hunk store. Columns are loaded on first use.
+
+    Texts of a lazy store are read from ``repo`` (default: ``$LOCUS_REPO``,
+    then the repository recorded when the store was written).
+    """
+
+    def __init__(self, path, repo=None):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"{path}: unsupported hunk store version {meta.get('version')}")
+        self.rows = meta["rows"]
+        self.commits = meta["commits"]
+        self.commit_dates = meta["commit_dates"]
+        self.files = meta["files"]
+        self.lazy = meta.get("lazy", False)
+        self.commit_parents = meta.get("commit_parents", [])
+        self.repo = repo or os.environ.get(REPO_ENV) or meta.get("repo")
+        self._columns = {}
+        self._blob = None
+        self._reader = None
+
+    def __len__(self):
+        return self.rows
+
+    def column(self, name):
+        if name not in self._columns:
+            arr = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+            self._columns[name] = arr[: self.rows + 1 if name == "offsets" else self.rows]
+        return self._columns[name]
+
+    @property
+    def offsets(self):
+        return self.column("offsets")
+
+    def text(self, i):
+        if self.lazy:
+            return self._lazy_text(i)
+        if self._blob is None:
+            size = int(self.offsets[-1])
+            self._blob = np.memmap(os.path.join(self.path, "text.bin"), dtype=np.uint8, mode="r", shape=(size,)) \
+                if size else np.zeros(0, dtype=np.uint8)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self._blob[start:end].tobytes().decode("utf-8")
+
+    def _lazy_text(self, i):
+        if self._reader is None:
+            if not self.repo:
+                raise ValueError(f"{self.path} is a lazy hunk store; set {REPO_ENV} to the git repository")
+            self._reader = PatchReader(self.repo)
+        c = self.column("commit")[i]
+        return self._reader.hunk(self.commits[c], self.commit_parents[c],
+                                 self.files[self.column("file")[i]], int(self.column("index")[i]))
+
+    def close(self):
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def iter_texts(self):
+        for i in range(self.rows):
+            yield self.text(i)
+
+    def commit_id(self, i):
+        return self.commits[self.column("commit")[i]]
+
+    def hunk_id(self, i):
+        return f"{self.commit_id(i)}_{i}"
+
+    def hunk_ids(self):
+        """``hunk_id`` values as written by extract_hunks (``<commit>_<row>``)."""
+        commit = self.column("commit")
+        return [f"{self.commits[c]}_{i}" for i, c in enumerate(commit)]
+
+    def commit_index_ids(self):
+        """Ranking ids ``<commit>:<index>`` as stored in commit_ids.json."""
+        return [f"{self.commits[c]}:{idx}" for c, idx in zip(self.column("commit"), self.column("index"))]
+
+    def dates(self):
+        return [self.commit_dates[c] for c in self.column("commit")]
+
+    def iter_records(self):
+        """Yield dicts in the old hunks.json layout."""
+        commit, file, index = self.column("commit"), self.column("file"), self.column("index")
+        for i in range(self.rows):
+            commit_id = self.commits[commit[i]]
+            yield {
+                "hunk_id": f"{commit_id}_{i}",
+                "commit_id": commit_id,
+                "file_path": self.files[file[i]],
+                "hunk": self.text(i),
+                "index": int(index[i]),
+                "date": self.commit_dates[commit[i]],
+            }
+
+def convert_json(json_path, store_path):
+    with open(json_path) as f:
+        hunks = json.load(f)
+    with HunkStoreWriter(store_path) as writer:
+        for hunk in hunks:
+            writer.add(hunk)
+    return len(hunks)
+
+if __name__ == "__main__":
+    count = convert_json(sys.argv[1], sys.argv[2])
+    print(f"Converted {count} hunks to {sys.argv[2]}")
@@ -0,0 +1,98 @@
+# src/hunk_tokenizer.py
+# ハンクを1回走査して NL トークン・CE 識別子・差分特徴量をまとめて取り出す。
+# extract_corpora.extract_nl / extract_ce と diff_features.extract_features_from_patch は
+# この関数の薄いラッパー。
+
+import re
+from functools import lru_cache
+from typing import List, NamedTuple
+
+# コメント・文字列リテラル (複数行コメントをまたぐので行単位ではなくテキスト全体に適用)
+NL_SPAN_RE = re.compile(r'//.*|/\*.*?\*/|#.*|\"[^\"]+\"|\'[^\']+\'', re.DOTALL)
+# NLTK の Treebank トークナイザが切り離す記号で分割する。
+# ピリオドは文末 (空白・閉じ記号・末尾の直前) のときだけ、引用符は語の内側でなければ切る。
+NL_PERIOD_RE = re.compile(r"(?<=[^.\s])\.(?=[\s\"')\]}>]|$)")
+NL_SPLIT_RE = re.compile(r"[\s;@#$%&?!()\[\]{}<>\"`*]+|[:,](?!\d)|\.\.\.|--|(?<!\w)'|'(?!\w)")
+NL_CONTRACTION_RE = re.compile(r"^(.+?)(n't|'s|'re|'ve|'ll|'d|'m|')$")
+
+IDENTIFIER_RE = re.compile(r'\b([a-zA-Z_]\w*)\b')
+FUNCTION_REGEX = re.compile(r"\b([A-Za-z_][A-Za-z0-9_]*)\s*\(")
+HEADER_NAME_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+SYNTAX_KEYWORDS = ["if", "for", "while", "switch", "case", "try", "catch"]
+SYNTAX_KEYWORD_RE = re.compile(r"\b(" + "|".join(SYNTAX_KEYWORDS) + r")\b")
+# extract_commit_features が見る部分文字列。先頭文字がすべて異なるので先読みで重なりも拾える
+COMMIT_KEYWORDS = ["if", "for", "while", "null", "try", "catch"]
+COMMIT_KEYWORD_RE = re.compile(r"(?=(" + "|".join(COMMIT_KEYWORDS) + r"))")
+
+
+class HunkTokens(NamedTuple):
+    nl: List[str]
+    ce: List[str]
+    features: List[str]
+
+
+@lru_cache(maxsize=None)
+def load_stopwords():
+    from nltk.corpus import stopwords
+    return frozenset(stopwords.words("english"))
+
+
+def nl_tokens(hunk, stopwords):
+    text = " ".join(NL_SPAN_RE.findall(hunk)).lower()
+    text = NL_PERIOD_RE.sub(" ", text)
+    tokens = []
+    for piece in NL_SPLIT_RE.split(text):
+        m = NL_CONTRACTION_RE.match(piece)
+        if m:
+            piece = m.group(1)
+        for w in (("can", "not") if piece == "cannot" else (piece,)):
+            if w.isalpha() and w not in stopwords:
+                tokens.append(w)
+    return tokens
+
+
+def tokenize_hunk(hunk, stopwords=None, nl=True, ce=True, features=True):
+    """Extract NL tokens, CE identifiers and diff features from one hunk.
+
+    NL tokens come from comments and string literals and follow NLTK's
+    ``word_tokenize`` closely enough for bag-of-words use without calling it.
+    CE identifiers are the distinct names on added lines, in first-seen
+    order. Features are function names and ``kw_<keyword>`` markers from
+    changed lines plus names in ``@@`` headers, as in
+    ``extract_features_from_patch``. Fields that are switched off are empty.
+    """
+    if stopwords is None and (nl or ce):
+        stopwords = load_stopwords()
+    ce_seen = {}
+    feats = []
+    if ce or features:
+        for line in hunk.splitlines():
+            first = line[:1]
+            if first == "+" or first == "-":
+                if ce and first == "+":
+                    for name in IDENTIFIER_RE.findall(line):
+                        if len(name) > 1 and name.lower() not in stopwords:
+                            ce_seen[name] = None
+                if not features or line.startswith(("+++", "---")):
+                    continue
+                feats.extend(FUNCTION_REGEX.findall(line))
+                found = set(SYNTAX_KEYWORD_RE.findall(line))
+                if found:
+                    feats.extend(f"kw_{kw}" for kw in SYNTAX_KEYWORDS if kw in found)
+            elif features and line.startswith("@@"):
+                feats.extend(HEADER_NAME_RE.findall(line.strip("@ ")))
+    return HunkTokens(
+        nl=nl_tokens(hunk, stopwords) if nl else [],
+        ce=list(ce_seen),
+        features=feats,
+    )
+
+
+def patch_keywords(patch):
+    """Keywords from ``COMMIT_KEYWORDS`` occurring anywhere in ``patch`` as substrings."""
+    found = set()
+    for m in COMMIT_KEYWORD_RE.finditer(patch):
+        found.add(m.group(1))
+        if len(found) == len(COMMIT_KEYWORDS):
+            break
+    return [kw for kw in COMMIT_KEYWORDS if kw in found]
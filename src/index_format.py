@@ -0,0 +1,229 @@
+# src/index_format.py
+# python src/index_format.py                          # data/ce_tfidf.npz -> data/index (float64)
+# python src/index_format.py --float32 --normalize    # 正規化済み float32 で半分の大きさに
+# python src/compute_similarity.py --mode batched --index data/index
+#
+# save_npz は zip 圧縮なので、load_npz のたびに全体を展開して各プロセスの私有メモリに載せる。
+# ここでは CSR の data / indices / indptr を無圧縮のまま別々のファイルに書き、np.memmap で開く。
+# 読み込みは定数時間で、並列のワーカーはページキャッシュを共有する。
+# header.json に語彙と commit_ids.json のハッシュを持たせ、組み合わせが違えばすぐに失敗させる。
+
+import json
+import os
+import shutil
+import zipfile
+from argparse import ArgumentParser
+import numpy as np
+from numpy.lib import format as npy_format
+from scipy.sparse import csr_matrix, load_npz
+from sklearn.preprocessing import normalize
+
+from checksums import file_hash
+
+INDEX_FORMAT = "locus-csr"
+INDEX_VERSION = 1
+INDEX_DIR = "data/index"
+CE_MATRIX_FILE = "data/ce_tfidf.npz"
+VOCAB_FILE = "data/tfidf_vocab.json"
+COMMIT_IDS_FILE = "data/commit_ids.json"
+
+class IndexWriter:
+    """Write a CSR matrix to ``path`` one chunk of rows at a time.
+
+    ``data``, ``indices`` and ``indptr`` go to separate raw ``.bin`` files
+    in native byte order; ``header.json`` is written last by ``close()``,
+    so an interrupted export is never opened. Extra dense per-row arrays
+    (e.g. the boost) can be stored alongside with ``add_array``.
+    ``source_hashes`` maps names to hashes of the files the index was built
+    from, for ``open_index(sources=...)`` to check.
+    """
+
+    def __init__(self, path, n_cols, dtype=np.float64, index_dtype=np.int32,
+                 vocab_hash=None, commit_ids_hash=None, normalized=False, source_hashes=None):
+        self.path = path
+        self.n_cols = n_cols
+        self.dtype = np.dtype(dtype)
+        self.index_dtype = np.dtype(index_dtype)
+        self.meta = {"vocab": vocab_hash, "commit_ids": commit_ids_hash, "normalized": normalized,
+                     "sources": source_hashes or {}}
+        self.n_rows = 0
+        self.nnz = 0
+        self.arrays = {}
+        os.makedirs(path, exist_ok=True)
+        header = os.path.join(path, "header.json")
+        if os.path.exists(header):
+            os.remove(header)
+        self.files = {name: open(os.path.join(path, f"{name}.bin"), "wb")
+                      for name in ("data", "indices", "indptr")}
+        self.files["indptr"].write(np.zeros(1, dtype=self.index_dtype).tobytes())
+
+    def append(self, chunk):
+        """Append the rows of a sparse ``chunk`` with ``n_cols`` columns."""
+        chunk = chunk.tocsr()
+        if chunk.shape[1] != self.n_cols:
+            raise ValueError(f"chunk has {chunk.shape[1]} columns, index has {self.n_cols}")
+        chunk.sort_indices()
+        if self.nnz + chunk.nnz > np.iinfo(self.index_dtype).max:
+            raise ValueError(f"{self.nnz + chunk.nnz} non-zeros do not fit {self.index_dtype}; use int64 indices")
+        self.files["data"].write(chunk.data.astype(self.dtype, copy=False).tobytes())
+        self.files["indices"].write(chunk.indices.astype(self.index_dtype, copy=False).tobytes())
+        self.files["indptr"].write((chunk.indptr[1:] + self.nnz).astype(self.index_dtype).tobytes())
+        self.n_rows += chunk.shape[0]
+        self.nnz += chunk.nnz
+
+    def add_array(self, name, values):
+        values = np.ascontiguousarray(values)
+        values.tofile(os.path.join(self.path, f"{name}.bin"))
+        self.arrays[name] = {"dtype": values.dtype.str, "length": len(values)}
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        for name, spec in self.arrays.items():
+            if spec["length"] != self.n_rows:
+                raise ValueError(f"array {name} has {spec['length']} entries for {self.n_rows} rows")
+        header = {
+            "format": INDEX_FORMAT,
+            "version": INDEX_VERSION,
+            "shape": [self.n_rows, self.n_cols],
+            "nnz": self.nnz,
+            "dtype": self.dtype.str,
+            "index_dtype": self.index_dtype.str,
+            "arrays": self.arrays,
+            **self.meta,
+        }
+        with open(os.path.join(self.path, "header.json"), "w") as f:
+            json.dump(header, f, indent=2)
+        return header
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        if exc_type is None:
+            self.close()
+        else:
+            for f in self.files.values():
+                f.close()
+
+class RawIndex:
+    """A memory-mapped index; ``matrix`` is a CSR view over the mapped files."""
+
+    def __init__(self, header, matrix, arrays):
+        self.header = header
+        self.matrix = matrix
+        self.arrays = arrays
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+def _map(path, name, dtype, length):
+    file = os.path.join(path, f"{name}.bin")
+    size = os.path.getsize(file)
+    if size != np.dtype(dtype).itemsize * length:
+        raise ValueError(f"{file} has {size} bytes, header expects {length} x {np.dtype(dtype)}")
+    if length == 0:
+        return np.zeros(0, dtype=dtype)
+    # ndarray のビューにしておけば、演算結果が memmap 型にならない
+    return np.asarray(np.memmap(file, dtype=dtype, mode="r", shape=(length,)))
+
+def open_index(path, vocab_file=None, commit_ids_file=None, sources=None):
+    """Map the index at ``path``, checking it against ``vocab_file`` and ``commit_ids_file`` if given.
+
+    ``sources`` maps names to the files passed to ``write_index(sources=...)``;
+    each must still have the recorded hash. Raises ``ValueError`` for an
+    unknown format or version, truncated files, or when the index was
+    written for a different vocabulary, hunk list or source file.
+    """
+    header_file = os.path.join(path, "header.json")
+    if not os.path.exists(header_file):
+        raise ValueError(f"{header_file} not found; export the index with src/index_format.py")
+    with open(header_file) as f:
+        header = json.load(f)
+    if header.get("format") != INDEX_FORMAT or header.get("version") != INDEX_VERSION:
+        raise ValueError(f"{path} is {header.get('format')} v{header.get('version')}, "
+                         f"expected {INDEX_FORMAT} v{INDEX_VERSION}; re-export it")
+    for key, source in (("vocab", vocab_file), ("commit_ids", commit_ids_file)):
+        if source is not None and header.get(key) != file_hash(source):
+            raise ValueError(f"{path} was written for a different {source}; re-export it")
+    for key, source in (sources or {}).items():
+        if header.get("sources", {}).get(key) != file_hash(source):
+            raise ValueError(f"{path} was written from a different {source}; re-export it")
+
+    n_rows, n_cols = header["shape"]
+    data = _map(path, "data", header["dtype"], header["nnz"])
+    indices = _map(path, "indices", header["index_dtype"], header["nnz"])
+    indptr = _map(path, "indptr", header["index_dtype"], n_rows + 1)
+    # コンストラクタは int64 の添字を int32 にコピーし直すことがあるので、属性を直接差し込む
+    matrix = csr_matrix((n_rows, n_cols), dtype=data.dtype)
+    matrix.data, matrix.indices, matrix.indptr = data, indices, indptr
+    arrays = {name: _map(path, name, spec["dtype"], spec["length"])
+              for name, spec in header.get("arrays", {}).items()}
+    return RawIndex(header, matrix, arrays)
+
+def export_npz(path, npz_file, compressed=True, block_size=1 << 20):
+    """Write the index at ``path`` as a ``save_npz`` file, streaming each array in blocks.
+
+    The result loads with ``scipy.sparse.load_npz``; the arrays are never
+    held in memory as a whole.
+    """
+    with open(os.path.join(path, "header.json")) as f:
+        header = json.load(f)
+    n_rows = header["shape"][0]
+    arrays = [("indices", header["index_dtype"], header["nnz"]),
+              ("indptr", header["index_dtype"], n_rows + 1),
+              ("data", header["dtype"], header["nnz"])]
+    small = {"format": np.array(b"csr"), "shape": np.array(header["shape"])}
+    mode = zipfile.ZIP_DEFLATED if compressed else zipfile.ZIP_STORED
+    with zipfile.ZipFile(npz_file, "w", compression=mode, allowZip64=True) as zf:
+        for name, dtype, length in arrays:
+            with zf.open(f"{name}.npy", "w", force_zip64=True) as out, \
+                    open(os.path.join(path, f"{name}.bin"), "rb") as src:
+                npy_format.write_array_header_1_0(
+                    out, {"descr": np.dtype(dtype).str, "fortran_order": False, "shape": (length,)})
+                shutil.copyfileobj(src, out, block_size)
+        for name, value in small.items():
+            with zf.open(f"{name}.npy", "w") as out:
+                npy_format.write_array(out, value)
+
+def write_index(path, matrix, vocab_file=VOCAB_FILE, commit_ids_file=COMMIT_IDS_FILE,
+                dtype=np.float64, normalize_rows=False, arrays=None, sources=None, chunk_rows=100000):
+    """Export ``matrix`` (and optional per-row ``arrays``) to ``path``.
+
+    ``sources`` maps names to the files ``matrix`` and ``arrays`` were built
+    from; their hashes go into the header.
+    """
+    matrix = matrix.tocsr()
+    with IndexWriter(path, matrix.shape[1], dtype=dtype,
+                     index_dtype=np.int32 if matrix.nnz < 2 ** 31 else np.int64,
+                     vocab_hash=vocab_file and file_hash(vocab_file),
+                     commit_ids_hash=commit_ids_file and file_hash(commit_ids_file),
+                     normalized=normalize_rows,
+                     source_hashes={key: file_hash(p) for key, p in (sources or {}).items()}) as writer:
+        for start in range(0, matrix.shape[0], chunk_rows):
+            chunk = matrix[start:start + chunk_rows]
+            writer.append(normalize(chunk) if normalize_rows else chunk)
+        for name, values in (arrays or {}).items():
+            writer.add_array(name, values)
+    return writer
+
+def main():
+    ap = ArgumentParser(description="Export a TF-IDF matrix to the raw memory-mappable index format")
+    ap.add_argument("--input", default=CE_MATRIX_FILE)
+    ap.add_argument("--output", default=INDEX_DIR)
+    ap.add_argument("--vocab", default=VOCAB_FILE)
+    ap.add_argument("--commit-ids", default=COMMIT_IDS_FILE,
+                    help="Hunk ids the rows belong to (pass an empty string for bug matrices)")
+    ap.add_argument("--float32", action="store_true", help="Store values as float32")
+    ap.add_argument("--normalize", action="store_true", help="L2-normalise rows before writing")
+    args = ap.parse_args()
+
+    matrix = load_npz(args.input)
+    write_index(args.output, matrix, vocab_file=args.vocab, commit_ids_file=args.commit_ids or None,
+                dtype=np.float32 if args.float32 else np.float64, normalize_rows=args.normalize,
+                sources={"matrix": args.input})
+    print(f"Wrote {matrix.shape[0]} x {matrix.shape[1]} ({matrix.nnz} non-zeros) to {args.output}")
+
+if __name__ == "__main__":
+    main()
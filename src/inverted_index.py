@@ -0,0 +1,99 @@
+# src/inverted_index.py
+# 語 -> ハンクの転置インデックス。クエリに現れる語のポスティングだけを辿り、
+# top-k に届かない候補は MaxScore の上限で打ち切る。
+
+import numpy as np
+from sklearn.preprocessing import normalize
+
+class InvertedIndex:
+    """Term-at-a-time query engine over the CE TF-IDF matrix.
+
+    Each posting list holds the hunk rows containing a term, sorted by row,
+    with weights already multiplied by the per-hunk ``boost``. ``max_scores``
+    keeps the largest weight of every list, which bounds how much a term can
+    still add to any hunk's score.
+    """
+
+    def __init__(self, ce_matrix, boost=None):
+        csc = normalize(ce_matrix).tocsc()
+        csc.sort_indices()
+        self.n_docs = csc.shape[0]
+        self.indptr = csc.indptr
+        self.postings = csc.indices
+        self.weights = csc.data
+        if boost is not None:
+            self.weights = self.weights * boost[self.postings]
+        self.max_scores = np.zeros(csc.shape[1])
+        lengths = np.diff(self.indptr)
+        nonempty = np.flatnonzero(lengths)
+        if len(nonempty):
+            # 空でないリストの先頭だけを渡せば各区間がちょうど1語分になる
+            self.max_scores[nonempty] = np.maximum.reduceat(self.weights, self.indptr[nonempty])
+        # クエリ間で使い回す作業領域: スコアの累積、候補に入ったかの印、候補の行番号
+        self._acc = np.zeros(self.n_docs)
+        self._touched = np.zeros(self.n_docs, dtype=bool)
+        self._cand = np.empty(self.n_docs, dtype=self.postings.dtype)
+
+    def posting(self, term):
+        lo, hi = self.indptr[term], self.indptr[term + 1]
+        return self.postings[lo:hi], self.weights[lo:hi]
+
+    def query(self, bug_vector, top_k=10):
+        """Return ``[(row, score), ...]`` of the best ``top_k`` hunks, best first.
+
+        Terms are visited in decreasing order of their score upper bound.
+        Once the k-th best partial score exceeds what all remaining terms
+        together could contribute, no unseen hunk can enter the top-k, so
+        the remaining lists are only probed for the current candidates,
+        which are pruned as their own upper bound falls below the threshold.
+        """
+        q = normalize(bug_vector)
+        terms, q_weights = q.indices, q.data
+        ub = q_weights * self.max_scores[terms]
+        keep = ub > 0
+        order = np.argsort(-ub[keep], kind="stable")
+        terms, q_weights, ub = terms[keep][order], q_weights[keep][order], ub[keep][order]
+        if len(terms) == 0:
+            return []
+        rest = np.cumsum(ub[::-1])[::-1]
+
+        acc, touched, buf = self._acc, self._touched, self._cand
+        n = 0
+        i = 0
+        while i < len(terms):
+            if n >= top_k and kth_largest(acc[buf[:n]], top_k) > rest[i]:
+                break
+            docs, weights = self.posting(terms[i])
+            acc[docs] += q_weights[i] * weights
+            new = docs[~touched[docs]]
+            touched[new] = True
+            buf[n:n + len(new)] = new
+            n += len(new)
+            i += 1
+        # 候補は最後に一度だけ行順に並べる
+        cand = np.sort(buf[:n])
+        scores = acc[cand]
+        acc[cand] = 0.0
+        touched[cand] = False
+
+        for j in range(i, len(terms)):
+            theta = kth_largest(scores, top_k)
+            alive = scores + rest[j] >= theta
+            cand, scores = cand[alive], scores[alive]
+            docs, weights = self.posting(terms[j])
+            pos = np.searchsorted(docs, cand)
+            pos[pos == len(docs)] = 0
+            hit = docs[pos] == cand
+            scores[hit] += q_weights[j] * weights[pos[hit]]
+
+        k = min(top_k, len(cand))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(int(cand[t]), float(scores[t])) for t in top]
+
+def kth_largest(values, k):
+    if len(values) < k:
+        return -np.inf
+    return np.partition(values, len(values) - k)[len(values) - k]
@@ -0,0 +1,108 @@
+# src/low_rank.py
+# 2段階検索の1段目。TF-IDF 空間を低次元の密ベクトル (float32) に射影し、
+# 密行列積で候補を数千件に絞る。2段目は候補だけを元の TF-IDF で厳密に採点し直す。
+#   python src/compute_similarity.py --mode two-stage --dim 128 --candidates 2000 --recall
+
+import json
+import os
+import numpy as np
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+from sklearn.random_projection import GaussianRandomProjection
+
+from checksums import file_hash
+
+CACHE_FILE = "data/low_rank.npz"
+
+class LowRankIndex:
+    """Dense float32 embeddings of the CE hunks in a ``dim``-dimensional space.
+
+    ``method`` is ``"svd"`` (truncated SVD of the normalised TF-IDF matrix) or
+    ``"random"`` (Gaussian random projection). Rows are L2-normalised, so a
+    dot product approximates the cosine similarity of the original vectors.
+    """
+
+    def __init__(self, components, embeddings, method):
+        self.components = components
+        self.embeddings = embeddings
+        self.method = method
+
+    @classmethod
+    def fit(cls, ce_matrix, dim=128, method="svd", seed=0):
+        ce_matrix = normalize(ce_matrix)
+        dim = min(dim, ce_matrix.shape[1] - 1)
+        if method == "svd":
+            model = TruncatedSVD(n_components=dim, random_state=seed).fit(ce_matrix)
+        elif method == "random":
+            model = GaussianRandomProjection(n_components=dim, random_state=seed).fit(ce_matrix)
+        else:
+            raise ValueError(f"unknown projection method {method!r}")
+        components = model.components_.astype(np.float32)
+        embeddings = normalize(np.asarray(ce_matrix @ components.T, dtype=np.float32))
+        return cls(components, embeddings, method)
+
+    def embed(self, matrix):
+        """Project sparse TF-IDF rows into the embedding space."""
+        return normalize(np.asarray(normalize(matrix) @ self.components.T, dtype=np.float32))
+
+    def candidates(self, queries, n_candidates):
+        """Rows of the ``n_candidates`` nearest hunks for each embedded query (unordered)."""
+        scores = queries @ self.embeddings.T
+        n = min(n_candidates, scores.shape[1])
+        if n == scores.shape[1]:
+            return np.tile(np.arange(n), (len(queries), 1))
+        return np.argpartition(-scores, n - 1, axis=1)[:, :n]
+
+    def save(self, path, ce_hash):
+        np.savez(path, components=self.components, embeddings=self.embeddings,
+                 meta=np.array(json.dumps({"method": self.method, "ce": ce_hash})))
+
+def load_low_rank_index(ce_matrix, ce_file, dim=128, method="svd", path=CACHE_FILE, rebuild=False):
+    """Load the cached embeddings if they match ``ce_file``, ``dim`` and ``method``, else fit them.
+
+    ``ce_file`` is the file ``ce_matrix`` was read from: ``ce_tfidf.npz`` or
+    a raw index directory (index_format.py), whose files are all hashed.
+    """
+    ce_hash = file_hash(ce_file)
+    dim = min(dim, ce_matrix.shape[1] - 1)
+    if not rebuild and os.path.exists(path):
+        with np.load(path) as f:
+            meta = json.loads(str(f["meta"]))
+            if meta == {"method": method, "ce": ce_hash} and f["components"].shape[0] == dim:
+                return LowRankIndex(f["components"], f["embeddings"], method)
+    print(f"Projecting {ce_matrix.shape[0]} hunks to {dim} dimensions ({method})...")
+    index = LowRankIndex.fit(ce_matrix, dim=dim, method=method)
+    index.save(path, ce_hash)
+    return index
+
+def rerank(nl_row, ce_normalized, boost, cands, top_k):
+    """Exact cosine * boost over ``cands`` only; returns ``(rows, scores)`` best first."""
+    exact = np.asarray((ce_normalized[cands] @ nl_row.T).todense()).ravel() * boost[cands]
+    k = min(top_k, len(cands))
+    part = np.argpartition(-exact, k - 1)[:k]
+    order = part[np.argsort(-exact[part], kind="stable")]
+    return cands[order], exact[order]
+
+def rank_two_stage(nl_matrix, ce_matrix, boost, index, n_candidates=2000, top_k=10, block_size=256):
+    """Approximate candidates from ``index``, then exact scores for those only.
+
+    Returns a list of ``(rows, scores)`` per bug with at most ``top_k`` entries.
+    """
+    nl_matrix = normalize(nl_matrix).tocsr()
+    ce_normalized = normalize(ce_matrix).tocsr()
+    ranked = []
+    for start in range(0, nl_matrix.shape[0], block_size):
+        block = nl_matrix[start:start + block_size]
+        cands = index.candidates(index.embed(block), n_candidates)
+        for i in range(block.shape[0]):
+            ranked.append(rerank(block[i], ce_normalized, boost, cands[i], top_k))
+    return ranked
+
+def recall_at_k(approx_rows, exact_rows, exact_scores):
+    """Mean share of the exact top-k (ignoring zero scores) found by the approximate search."""
+    recalls = []
+    for approx, exact, scores in zip(approx_rows, exact_rows, exact_scores):
+        relevant = set(exact[scores > 0].tolist())
+        if relevant:
+            recalls.append(len(relevant & set(approx.tolist())) / len(relevant))
+    return float(np.mean(recalls)) if recalls else 1.0
@@ -0,0 +1,145 @@
+# src/metrics.py
+# 各ステージの計測用。環境変数で有効にする:
+#   LOCUS_METRICS_FILE=data/metrics.jsonl   ステージごとに1行の JSON を追記
+#   LOCUS_PROFILE=data/profiles             ステージ全体を cProfile で包み <stage>.prof を保存
+# 単独で実行するステージでは、add_arguments() が足す --metrics-file / --profile でも同じ設定ができる。
+#
+#   with metrics.stage("extract_features"):
+#       with metrics.phase("load") as p:
+#           texts = load_texts(...)
+#           p.items = len(texts)
+
+import cProfile
+import json
+import os
+import resource
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+METRICS_ENV = "LOCUS_METRICS_FILE"
+PROFILE_ENV = "LOCUS_PROFILE"
+
+_current = None
+_profiler = None
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """Peak resident set size of this process (or its largest child) so far, in MiB."""
+    rss = resource.getrusage(who).ru_maxrss
+    # Linux は KiB、macOS はバイト
+    return rss / 2 ** 20 if sys.platform == "darwin" else rss / 2 ** 10
+
+class Phase:
+    """Timing of one named sub-phase. Set ``items`` to get a rate."""
+
+    def __init__(self, name, items=None):
+        self.name = name
+        self.items = items
+        self.wall_s = None
+
+    def merge_into(self, phases):
+        """Add this phase to ``phases``, summing with an earlier phase of the same name."""
+        for rec in phases:
+            if rec["name"] == self.name:
+                rec["calls"] += 1
+                rec["wall_s"] += self.wall_s
+                if self.items is not None:
+                    rec["items"] = rec.get("items", 0) + self.items
+                break
+        else:
+            rec = {"name": self.name, "calls": 1, "wall_s": self.wall_s}
+            if self.items is not None:
+                rec["items"] = self.items
+            phases.append(rec)
+        rec["peak_rss_mb"] = peak_rss_mb()
+        if "items" in rec:
+            rec["rate"] = rec["items"] / rec["wall_s"] if rec["wall_s"] else None
+
+@contextmanager
+def phase(name, items=None):
+    """Time a named sub-phase of the current stage.
+
+    A phase entered repeatedly (e.g. once per block in a loop) is reported
+    as one entry with the summed time and items and a ``calls`` count.
+    """
+    p = Phase(name, items)
+    start = time.perf_counter()
+    try:
+        yield p
+    finally:
+        p.wall_s = time.perf_counter() - start
+        if _current is not None:
+            p.merge_into(_current["phases"])
+
+@contextmanager
+def stage(name):
+    """Collect the phases run inside this block and write them as one record.
+
+    Nothing is written unless ``LOCUS_METRICS_FILE`` is set. With
+    ``LOCUS_PROFILE`` set to a directory, the block also runs under cProfile.
+    """
+    global _current, _profiler
+    record = {
+        "stage": name,
+        "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "argv": sys.argv[1:],
+        "phases": [],
+    }
+    _current = record
+    start = time.perf_counter()
+    if os.environ.get(PROFILE_ENV):
+        _start_profiler()
+    try:
+        yield record
+        record["status"] = "ok"
+    except BaseException as e:
+        record["status"] = f"error: {type(e).__name__}"
+        raise
+    finally:
+        if _profiler:
+            _profiler.disable()
+            profile_dir = os.environ[PROFILE_ENV]
+            os.makedirs(profile_dir, exist_ok=True)
+            _profiler.dump_stats(os.path.join(profile_dir, f"{name}.prof"))
+            _profiler = None
+        record["wall_s"] = time.perf_counter() - start
+        record["peak_rss_mb"] = peak_rss_mb()
+        # ワーカープロセスを使うステージ用 (終了済みの子のうち最大のもの)
+        record["children_peak_rss_mb"] = peak_rss_mb(resource.RUSAGE_CHILDREN)
+        _current = None
+        write_record(record)
+
+def _start_profiler():
+    global _profiler
+    if _current is not None and _profiler is None:
+        _profiler = cProfile.Profile()
+        _profiler.enable()
+
+def add_arguments(ap):
+    """Add ``--metrics-file`` and ``--profile`` to a stage's argument parser."""
+    ap.add_argument("--metrics-file", metavar="FILE",
+                    help=f"Append this stage's phase timings to FILE as one JSON line (same as ${METRICS_ENV})")
+    ap.add_argument("--profile", metavar="DIR",
+                    help=f"Run the stage under cProfile and save <stage>.prof in DIR (same as ${PROFILE_ENV})")
+
+def apply_arguments(args):
+    """Apply the options from ``add_arguments``.
+
+    Scripts that parse their arguments inside ``stage()`` start profiling
+    here, so the profile then misses only the argument parsing.
+    """
+    if args.metrics_file:
+        os.environ[METRICS_ENV] = os.path.abspath(args.metrics_file)
+    if args.profile:
+        os.environ[PROFILE_ENV] = os.path.abspath(args.profile)
+        _start_profiler()
+
+def write_record(record):
+    path = os.environ.get(METRICS_ENV)
+    if not path:
+        return
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    # 1 回の write で追記するので、並列に走るステージの行が混ざらない
+    with open(path, "a") as f:
+        f.write(json.dumps(record) + "\n")
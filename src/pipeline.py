@@ -0,0 +1,250 @@
+# src/pipeline.py
+# python src/pipeline.py                 # 変更のあったステージだけ実行
+# python src/pipeline.py --dry-run       # 何が再実行されるかだけ表示
+# python src/pipeline.py --repo ../tomcat --branch main --jobs 4
+# python src/pipeline.py --repo ../tomcat --lazy   # パッチ本文を data/ に持たない
+#
+# data/ を含むディレクトリ (通常はリポジトリのルート) で実行する。
+# 各ステージの入力・出力・コード・パラメータのハッシュを data/.pipeline_state.json に記録し、
+# どれかが変わったステージ (とその下流) だけを再実行する。
+
+import ast
+import hashlib
+import json
+import os
+import subprocess
+import sys
+from argparse import ArgumentParser
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from checksums import file_hash
+
+SRC = os.path.dirname(os.path.abspath(__file__))
+STATE_FILE = "data/.pipeline_state.json"
+
+class Stage:
+    def __init__(self, name, script, args=(), inputs=(), outputs=(), params=None):
+        self.name = name
+        self.script = script
+        self.args = list(args)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = params or {}
+
+    def command(self):
+        return [sys.executable, os.path.join(SRC, self.script)] + self.args
+
+def build_stages(args):
+    stages = []
+    if args.repo:
+        head = subprocess.run(["git", "-C", args.repo, "rev-parse", args.branch],
+                              capture_output=True, text=True, check=True).stdout.strip()
+        stages.append(Stage("extract_commits", "extract_commits.py",
+                            args=[args.repo, "data/commits.json", "--branch", args.branch]
+                                 + (["--lazy"] if args.lazy else []),
+                            outputs=["data/commits.json"],
+                            params={"branch": args.branch, "head": head, "lazy": args.lazy}))
+    stages += [
+        Stage("extract_hunks", "extract_hunks.py",
+              args=["--lazy"] if args.lazy else [],
+              inputs=["data/commits.json"], outputs=["data/hunks"]),
+        Stage("extract_commit_features", "extract_commit_features.py",
+              args=["data/commits.json", "data/commit_features.json"],
+              inputs=["data/commits.json"], outputs=["data/commit_features.json"]),
+        Stage("extract_corpora", "extract_corpora.py",
+              inputs=["data/hunks"], outputs=["data/hunk_corpus.jsonl"]),
+        Stage("extract_features", "extract_features.py",
+              args=(["--vectorizer", "hashing", "--workers", str(args.jobs)] if args.vectorizer == "hashing" else [])
+                   + (["--out-of-core"] if args.out_of_core else []),
+              inputs=["data/bug_reports.json", "data/hunk_corpus.jsonl"],
+              outputs=["data/tfidf_vocab.json", "data/nl_tfidf.npz", "data/ce_tfidf.npz",
+                       "data/tfidf_stats.npz"]),
+        Stage("generate_hunk_ids", "generate_hunk_ids.py",
+              inputs=["data/hunks"], outputs=["data/commit_ids.json", "data/hunk_dates.json"]),
+        Stage("generate_fix_hunk_map", "generate_fix_hunk_map.py",
+              inputs=["data/bug_reports.json", "data/hunks"], outputs=["data/fix_hunk_map.json"]),
+        Stage("commit_boost", "commit_boost.py",
+              inputs=["data/commit_ids.json", "data/commit_features.json"], outputs=["data/hunk_boost.npy", "data/hunk_boost.json"]),
+    ]
+    if args.dedup:
+        stages.append(Stage("dedup_hunks", "dedup_hunks.py",
+                            args=["--threshold", str(args.dedup_threshold)],
+                            inputs=["data/hunks", "data/hunk_corpus.jsonl", "data/ce_tfidf.npz"],
+                            outputs=["data/hunk_groups.json", "data/ce_tfidf_dedup.npz"]))
+    stages += [
+        Stage("compute_similarity", "compute_similarity.py",
+              args=["--mode", args.mode] + (["--dedup"] if args.dedup else []),
+              inputs=["data/bug_reports.json", "data/commit_ids.json", "data/ce_tfidf.npz",
+                      "data/nl_tfidf.npz", "data/tfidf_vocab.json", "data/commit_features.json",
+                      "data/hunk_boost.npy"]
+                     + (["data/hunk_dates.json"] if args.mode == "time" else [])
+                     + (["data/hunk_groups.json", "data/ce_tfidf_dedup.npz"] if args.dedup else []),
+              outputs=["data/similarity_scores.json"]),
+        Stage("evaluate_ranking", "evaluate_ranking.py",
+              inputs=["data/similarity_scores.json", "data/fix_hunk_map.json"]),
+    ]
+    return stages
+
+def local_imports(script):
+    """Scripts under src/ imported by ``script``, followed transitively."""
+    seen = set()
+    todo = [script]
+    while todo:
+        name = todo.pop()
+        if name in seen:
+            continue
+        seen.add(name)
+        with open(os.path.join(SRC, name)) as f:
+            tree = ast.parse(f.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.Import):
+                modules = [alias.name for alias in node.names]
+            elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+                modules = [node.module]
+            else:
+                continue
+            for module in modules:
+                candidate = module.split(".")[0] + ".py"
+                if os.path.exists(os.path.join(SRC, candidate)):
+                    todo.append(candidate)
+    return sorted(seen)
+
+def stage_signature(stage):
+    """Hash of everything that determines a stage's outputs."""
+    record = {
+        "command": stage.args,
+        "params": stage.params,
+        "inputs": {p: file_hash(p) for p in stage.inputs},
+        "code": {s: file_hash(os.path.join(SRC, s)) for s in local_imports(stage.script)},
+    }
+    return hashlib.sha256(json.dumps(record, sort_keys=True).encode()).hexdigest()
+
+def is_up_to_date(stage, state):
+    prev = state.get(stage.name)
+    if not prev or prev["signature"] != stage_signature(stage):
+        return False
+    return all(file_hash(p) == prev["outputs"].get(p) for p in stage.outputs)
+
+def load_state():
+    if not os.path.exists(STATE_FILE):
+        return {}
+    with open(STATE_FILE) as f:
+        return json.load(f)
+
+def save_state(state):
+    with open(STATE_FILE, "w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+
+def upstream(stages):
+    """Map each stage name to the names of the stages producing its inputs."""
+    producer = {out: s.name for s in stages for out in s.outputs}
+    return {s.name: {producer[p] for p in s.inputs if p in producer} for s in stages}
+
+def run_stage(stage):
+    print(f"[{stage.name}] running", flush=True)
+    return subprocess.run(stage.command(), capture_output=True, text=True)
+
+def run_pipeline(stages, state, jobs=1, force=(), dry_run=False):
+    deps = upstream(stages)
+    by_name = {s.name: s for s in stages}
+    done, failed, reran = set(), set(), set()
+    pending = [s.name for s in stages]
+    running = {}
+
+    def ready(name):
+        return deps[name] <= done
+
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        while pending or running:
+            for name in list(pending):
+                if deps[name] & failed:
+                    pending.remove(name)
+                    failed.add(name)
+                    print(f"[{name}] skipped: upstream stage failed")
+                    continue
+                if not ready(name):
+                    continue
+                pending.remove(name)
+                stage = by_name[name]
+                # dry-run では上流が再実行される想定なら下流も古いとみなす
+                stale = name in force or (dry_run and bool(deps[name] & reran))
+                if not stale and is_up_to_date(stage, state):
+                    print(f"[{name}] up to date")
+                    done.add(name)
+                elif dry_run:
+                    print(f"[{name}] would run")
+                    reran.add(name)
+                    done.add(name)
+                else:
+                    running[pool.submit(run_stage, stage)] = name
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for fut in finished:
+                name = running.pop(fut)
+                stage = by_name[name]
+                proc = fut.result()
+                sys.stdout.write(proc.stdout)
+                if proc.returncode != 0:
+                    sys.stderr.write(proc.stderr)
+                    print(f"[{name}] failed with exit code {proc.returncode}")
+                    failed.add(name)
+                    continue
+                state[name] = {
+                    "signature": stage_signature(stage),
+                    "outputs": {p: file_hash(p) for p in stage.outputs},
+                }
+                save_state(state)
+                reran.add(name)
+                done.add(name)
+    return not failed
+
+def main():
+    ap = ArgumentParser(description="Run the Locus pipeline, skipping stages whose inputs are unchanged")
+    ap.add_argument("--repo", help="Tomcat checkout; adds the extract_commits stage")
+    ap.add_argument("--branch", default="main", help="Branch passed to extract_commits")
+    ap.add_argument("--mode", default="batched", help="Ranking mode passed to compute_similarity")
+    ap.add_argument("--vectorizer", choices=["vocab", "hashing"], default="vocab",
+                    help="TF-IDF vectorizer used by extract_features (see src/hashing_features.py)")
+    ap.add_argument("--out-of-core", action="store_true",
+                    help="Build the TF-IDF matrices in two streaming passes with bounded memory")
+    ap.add_argument("--dedup", action="store_true",
+                    help="Add the dedup_hunks stage and score one representative per group (batched mode)")
+    ap.add_argument("--dedup-threshold", type=float, default=0.9,
+                    help="Jaccard threshold passed to dedup_hunks")
+    ap.add_argument("--lazy", action="store_true",
+                    help="Keep only hunk coordinates in data/ and read patch texts from --repo on demand")
+    ap.add_argument("--jobs", type=int, default=2, help="Maximum number of stages run in parallel")
+    ap.add_argument("--force", nargs="*", default=None,
+                    help="Re-run the named stages (all stages if no name is given)")
+    ap.add_argument("--dry-run", action="store_true", help="Only report which stages would run")
+    ap.add_argument("--metrics", default="data/metrics.jsonl",
+                    help="Append per-stage phase timings here (see src/metrics.py); empty to disable")
+    ap.add_argument("--profile", metavar="DIR", help="Run every stage under cProfile and save <stage>.prof in DIR")
+    args = ap.parse_args()
+    if args.dedup and args.mode != "batched":
+        ap.error("--dedup requires --mode batched")
+    if args.lazy and not args.repo:
+        ap.error("--lazy requires --repo")
+
+    # 子プロセスのステージは環境変数で metrics.stage の出力先を受け取る
+    if args.metrics:
+        os.environ["LOCUS_METRICS_FILE"] = os.path.abspath(args.metrics)
+    if args.profile:
+        os.environ["LOCUS_PROFILE"] = os.path.abspath(args.profile)
+    # --lazy で作ったデータの本文は各ステージが git から読む (commit_stream.REPO_ENV)
+    if args.repo:
+        os.environ["LOCUS_REPO"] = os.path.abspath(args.repo)
+
+    stages = build_stages(args)
+    if args.force is None:
+        force = set()
+    elif not args.force:
+        force = {s.name for s in stages}
+    else:
+        force = set(args.force)
+    ok = run_pipeline(stages, load_state(), jobs=args.jobs, force=force, dry_run=args.dry_run)
+    sys.exit(0 if ok else 1)
+
+if __name__ == "__main__":
+    main()
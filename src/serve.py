@@ -0,0 +1,175 @@
+# src/serve.py
+# python src/serve.py --port 8765 --workers 4
+# curl -s localhost:8765/localize -d '{"text": "NPE in BodyContentImpl", "top_k": 10}'
+#
+# インデックスを一度だけ読み込み、届いたバグ報告の本文をその場でランキングする常駐サービス。
+
+import json
+import os
+import time
+from argparse import ArgumentParser
+from http.server import BaseHTTPRequestHandler, HTTPServer, ThreadingHTTPServer
+import numpy as np
+from scipy.sparse import load_npz
+from sklearn.preprocessing import normalize
+
+from commit_boost import HUNK_BOOST_FILE, load_hunk_boost
+from compute_similarity import load_vectorizer, top_k_rows
+from extract_features import load_stats
+from index_format import open_index, write_index
+
+COMMIT_IDS_FILE = "data/commit_ids.json"
+CE_MATRIX_FILE = "data/ce_tfidf.npz"
+VOCAB_FILE = "data/tfidf_vocab.json"
+STATS_FILE = "data/tfidf_stats.npz"
+COMMIT_FEATURES_FILE = "data/commit_features.json"
+CACHE_DIR = "data/index_cache"
+# キャッシュの中身はこれらから作るので、どれかが変わったら作り直す
+CACHE_SOURCES = {"matrix": CE_MATRIX_FILE, "commit_features": COMMIT_FEATURES_FILE, "boost": HUNK_BOOST_FILE}
+
+def export_index_cache(cache_dir, ce_matrix, boost, dtype=np.float64):
+    """Write the normalised CE matrix and boost in the raw index format (index_format.py)."""
+    write_index(cache_dir, ce_matrix, vocab_file=VOCAB_FILE, commit_ids_file=COMMIT_IDS_FILE,
+                dtype=dtype, normalize_rows=True, arrays={"boost": boost}, sources=CACHE_SOURCES)
+
+def load_index_cache(cache_dir):
+    """Open the cached arrays memory-mapped, so forked workers share pages."""
+    index = open_index(cache_dir, vocab_file=VOCAB_FILE, commit_ids_file=COMMIT_IDS_FILE,
+                       sources=CACHE_SOURCES)
+    return index.matrix, index.arrays["boost"]
+
+class Localizer:
+    """Holds the index in memory and ranks hunks for raw bug text."""
+
+    def __init__(self, ce_matrix, boost, commit_ids, vectorizer):
+        if ce_matrix.shape[0] != len(commit_ids):
+            raise ValueError(f"ce matrix has {ce_matrix.shape[0]} rows but {len(commit_ids)} hunk ids")
+        self.ce_matrix = ce_matrix
+        self.boost = boost
+        self.commit_ids = commit_ids
+        self.vectorizer = vectorizer
+
+    def localize(self, texts, top_k=10):
+        bug_vectors = normalize(self.vectorizer.transform(texts))
+        # CSR @ 密ベクトル なら mmap した配列をそのまま読むだけでコピーが起きない
+        scores = np.asarray(self.ce_matrix @ bug_vectors.T.toarray()).T * self.boost
+        top = top_k_rows(scores, top_k)
+        return [
+            [{"commit_id": self.commit_ids[j], "score": float(row[j])} for j in cols]
+            for row, cols in zip(scores, top)
+        ]
+
+def load_localizer(cache_dir=CACHE_DIR, rebuild_cache=False, dtype=np.float64):
+    if not os.path.exists(STATS_FILE):
+        raise SystemExit(f"{STATS_FILE} not found; run src/extract_features.py first")
+    with open(COMMIT_IDS_FILE) as f:
+        commit_ids = json.load(f)
+    header_file = os.path.join(cache_dir, "header.json")
+    if not rebuild_cache and os.path.exists(header_file):
+        with open(header_file) as f:
+            cached = json.load(f).get("dtype")
+        if cached != np.dtype(dtype).str:
+            # --float32 の有無がキャッシュと違えば、要求された精度で作り直す
+            print(f"{cache_dir} holds {np.dtype(cached)} values, {np.dtype(dtype)} requested; rebuilding")
+            rebuild_cache = True
+    if rebuild_cache or not os.path.exists(header_file):
+        with open(COMMIT_FEATURES_FILE) as f:
+            features = json.load(f)
+        # hunk_boost.npy が古ければここで作り直して保存されるので、キャッシュにはその後のハッシュが入る
+        boost = load_hunk_boost(commit_ids, features, commit_ids_file=COMMIT_IDS_FILE,
+                                features_file=COMMIT_FEATURES_FILE)
+        export_index_cache(cache_dir, load_npz(CE_MATRIX_FILE), boost, dtype=dtype)
+    try:
+        ce_matrix, boost = load_index_cache(cache_dir)
+    except ValueError as e:
+        raise SystemExit(f"{e} (or start with --rebuild-cache)")
+    idf, _, _ = load_stats(STATS_FILE)
+    return Localizer(ce_matrix, boost, commit_ids, load_vectorizer(VOCAB_FILE, idf=idf))
+
+def parse_request(body):
+    """``(texts, top_k)`` of a /localize request body; raises ValueError if it is malformed."""
+    if not isinstance(body, dict):
+        raise ValueError("body must be a JSON object")
+    items = body["bugs"] if "bugs" in body else [body]
+    if not isinstance(items, list) or not items:
+        raise ValueError("bugs must be a non-empty list")
+    for item in items:
+        if not isinstance(item, dict) or not any(key in item for key in ("text", "summary", "description")):
+            raise ValueError("every bug must be an object with text, summary or description")
+        if not all(isinstance(item.get(key), (str, type(None))) for key in ("text", "summary", "description")):
+            raise ValueError("text, summary and description must be strings")
+    top_k = body.get("top_k", 10)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or top_k < 1:
+        raise ValueError("top_k must be a positive integer")
+    return [bug_text(item) for item in items], top_k
+
+def bug_text(item):
+    if "text" in item:
+        return item["text"]
+    return " ".join(filter(None, [item.get("summary"), item.get("description")]))
+
+def make_handler(localizer):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/health":
+                self.send_json(200, {"status": "ok", "hunks": len(localizer.commit_ids)})
+            else:
+                self.send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/localize":
+                self.send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                texts, top_k = parse_request(json.loads(self.rfile.read(length) or b"{}"))
+            except (ValueError, TypeError) as e:
+                self.send_json(400, {"error": f"invalid request: {e}"})
+                return
+            start = time.perf_counter()
+            results = localizer.localize(texts, top_k=top_k)
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.send_json(200, {"results": results, "elapsed_ms": elapsed_ms})
+
+        def send_json(self, status, obj):
+            payload = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+def main():
+    ap = ArgumentParser(description="Serve bug localization over HTTP on a local port")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--workers", type=int, default=1,
+                    help="Number of forked processes sharing the listening socket and mapped index")
+    ap.add_argument("--cache-dir", default=CACHE_DIR, help="Directory of the memory-mapped raw index")
+    ap.add_argument("--rebuild-cache", action="store_true",
+                    help="Re-export the index from ce_tfidf.npz before serving")
+    ap.add_argument("--float32", action="store_true",
+                    help="Store the exported index as float32 (half the size, ~1e-7 relative error); "
+                         "a cache of the other precision is rebuilt")
+    args = ap.parse_args()
+
+    localizer = load_localizer(args.cache_dir, rebuild_cache=args.rebuild_cache,
+                               dtype=np.float32 if args.float32 else np.float64)
+    server_cls = ThreadingHTTPServer if args.workers == 1 else HTTPServer
+    server = server_cls((args.host, args.port), make_handler(localizer))
+    for _ in range(args.workers - 1):
+        if os.fork() == 0:
+            break
+    print(f"[{os.getpid()}] Serving {len(localizer.commit_ids)} hunks on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
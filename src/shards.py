@@ -0,0 +1,222 @@
+# src/shards.py
+# python src/shards.py build main=data/commits-main.jsonl 8.5.x=data/commits-8.5.x.json --workers 2
+# python src/shards.py build 2015=data/commits.json --since 2015-01-01 --until 2016-01-01
+# python src/shards.py query --top-k 10 --workers 4
+#
+# ブランチや期間ごとのシャードを、extract_features.py が保存した共有の語彙と IDF に対して
+# 個別に作る。問い合わせ時は各シャードの top-k を並行に求め、1つのランキングに併合する。
+# ブランチを追加するときはそのシャードだけを作ればよい。
+
+import heapq
+import json
+import os
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing import Pool
+import numpy as np
+from scipy.sparse import load_npz, save_npz
+
+from checksums import file_hash
+from commit_stream import iter_records
+from compute_similarity import build_boost_vector, commit_boost_from_features, load_vectorizer, rank_all
+from extract_commit_features import extract_features as extract_commit_features
+from extract_features import load_stats
+from time_index import parse_date
+from update_index import dump_json, load_json, vectorize_commits
+import metrics
+
+SHARDS_DIR = "data/shards"
+VOCAB_FILE = "data/tfidf_vocab.json"
+STATS_FILE = "data/tfidf_stats.npz"
+NL_MATRIX_FILE = "data/nl_tfidf.npz"
+BUG_REPORT_FILE = "data/bug_reports.json"
+OUTPUT_FILE = "data/similarity_scores.json"
+
+def shard_commit_ids(shard_dir):
+    features = load_json(os.path.join(shard_dir, "commit_features.json"), [])
+    return {item["commit_id"] for item in features}
+
+def select_commits(commits_file, since=None, until=None, exclude=()):
+    """Commits of ``commits_file`` dated in ``[since, until)`` and not in ``exclude``."""
+    since, until = parse_date(since), parse_date(until)
+    for commit in iter_records(commits_file):
+        if (commit.get("hash") or commit.get("commit_id")) in exclude:
+            continue
+        date = parse_date(commit.get("date"))
+        if since is not None and (date is None or date < since):
+            continue
+        if until is not None and (date is None or date >= until):
+            continue
+        yield commit
+
+def build_shard(shard_dir, commits, vectorizer, vocab_hash):
+    """Vectorize ``commits`` against the shared vocabulary into ``shard_dir``."""
+    commits = list(commits)
+    hunks, matrix = vectorize_commits(commits, vectorizer)
+    os.makedirs(shard_dir, exist_ok=True)
+    save_npz(os.path.join(shard_dir, "ce_tfidf.npz"), matrix)
+    dump_json(os.path.join(shard_dir, "commit_ids.json"), [f"{h['commit_id']}:{h['index']}" for h in hunks])
+    dump_json(os.path.join(shard_dir, "hunk_dates.json"), [h.get("date") for h in hunks])
+    dump_json(os.path.join(shard_dir, "commit_features.json"), extract_commit_features(commits),
+              ensure_ascii=False)
+    # shard.json を最後に書くので、途中で落ちたシャードは読み込まれない
+    dump_json(os.path.join(shard_dir, "shard.json"),
+              {"commits": len(commits), "hunks": len(hunks), "vocab": vocab_hash}, indent=2)
+    return len(commits), len(hunks)
+
+def _build_task(task):
+    shard_dir, commits_file, since, until, exclude = task
+    idf, _, _ = load_stats(STATS_FILE)
+    vectorizer = load_vectorizer(VOCAB_FILE, idf=idf)
+    commits = select_commits(commits_file, since, until, exclude)
+    return build_shard(shard_dir, commits, vectorizer, file_hash(VOCAB_FILE))
+
+class Shard:
+    def __init__(self, shard_dir):
+        self.name = os.path.basename(shard_dir.rstrip("/"))
+        with open(os.path.join(shard_dir, "shard.json")) as f:
+            self.meta = json.load(f)
+        self.ce_matrix = load_npz(os.path.join(shard_dir, "ce_tfidf.npz")).tocsr()
+        self.commit_ids = load_json(os.path.join(shard_dir, "commit_ids.json"))
+        self.features = load_json(os.path.join(shard_dir, "commit_features.json"))
+        self.boost = None
+
+    def drop_commits(self, seen):
+        """Remove hunks of commits already held by an earlier shard."""
+        keep = np.array([cid.split(":")[0] not in seen for cid in self.commit_ids], dtype=bool)
+        if not keep.all():
+            self.ce_matrix = self.ce_matrix[keep]
+            self.commit_ids = [cid for cid, k in zip(self.commit_ids, keep) if k]
+        self.features = [item for item in self.features if item["commit_id"] not in seen]
+
+class ShardedIndex:
+    """All shards under ``shards_dir`` queried as one index.
+
+    Shards are read in name order. A commit present in several shards (e.g.
+    history shared by two branches) is kept only in the first one, and the
+    commit boost is computed over the union of the shards, so rankings match
+    a single index built from the same commits.
+    """
+
+    def __init__(self, shards_dir=SHARDS_DIR, names=None, vocab_file=VOCAB_FILE, beta=0.1):
+        names = names or sorted(
+            n for n in os.listdir(shards_dir) if os.path.exists(os.path.join(shards_dir, n, "shard.json"))
+        )
+        if not names:
+            raise SystemExit(f"No shards found in {shards_dir}; run `python src/shards.py build` first")
+        vocab_hash = file_hash(vocab_file)
+        self.shards = []
+        seen = set()
+        for name in names:
+            shard = Shard(os.path.join(shards_dir, name))
+            if shard.meta.get("vocab") != vocab_hash:
+                raise ValueError(f"shard {name} was built against a different vocabulary; rebuild it")
+            shard.drop_commits(seen)
+            seen.update(item["commit_id"] for item in shard.features)
+            self.shards.append(shard)
+        commit_boost = commit_boost_from_features([f for s in self.shards for f in s.features], beta)
+        for shard in self.shards:
+            shard.boost = build_boost_vector(shard.commit_ids, commit_boost)
+
+    def __len__(self):
+        return sum(len(s.commit_ids) for s in self.shards)
+
+    def query(self, nl_matrix, top_k=10, block_size=256, workers=None):
+        """Rank every bug row of ``nl_matrix`` against all shards.
+
+        Each shard returns its own top-k per bug, computed in a thread pool
+        (the sparse products and selections run mostly outside the GIL);
+        the per-shard lists are then merged into the global top-k.
+        """
+        def rank_shard(shard):
+            if not shard.commit_ids:
+                return [[] for _ in range(nl_matrix.shape[0])]
+            return rank_all(nl_matrix, shard.ce_matrix, shard.commit_ids, shard.boost,
+                            top_k=top_k, block_size=block_size)
+
+        with ThreadPoolExecutor(max_workers=workers or len(self.shards)) as pool:
+            per_shard = list(pool.map(rank_shard, self.shards))
+        with metrics.phase("merge", items=nl_matrix.shape[0]):
+            return [merge_top_k([ranked[i] for ranked in per_shard], top_k)
+                    for i in range(nl_matrix.shape[0])]
+
+def merge_top_k(lists, top_k):
+    """Merge ``(hunk_id, score)`` lists that are each sorted best first."""
+    merged = heapq.merge(*lists, key=lambda item: -item[1])
+    return [item for _, item in zip(range(top_k), merged)]
+
+def build_main(args):
+    if not os.path.exists(STATS_FILE):
+        raise SystemExit(f"{STATS_FILE} not found; run src/extract_features.py once to fix the vocabulary")
+    specs = []
+    for spec in args.shards:
+        name, sep, path = spec.partition("=")
+        if not sep or not name or not path:
+            raise SystemExit(f"expected NAME=COMMITS_FILE, got {spec!r}")
+        specs.append((name, path))
+
+    # 既存のシャード (今回作り直すもの以外) に入っているコミットは重ねて持たない
+    rebuilding = {name for name, _ in specs}
+    exclude = set()
+    if not args.allow_overlap and os.path.isdir(args.shards_dir):
+        for name in os.listdir(args.shards_dir):
+            if name not in rebuilding:
+                exclude |= shard_commit_ids(os.path.join(args.shards_dir, name))
+
+    tasks = [(os.path.join(args.shards_dir, name), path, args.since, args.until, exclude)
+             for name, path in specs]
+    if args.workers > 1 and len(tasks) > 1:
+        with Pool(min(args.workers, len(tasks))) as pool:
+            results = pool.map(_build_task, tasks)
+    else:
+        results = [_build_task(task) for task in tasks]
+    for (name, _), (n_commits, n_hunks) in zip(specs, results):
+        print(f"Built shard {name}: {n_hunks} hunks from {n_commits} commits")
+
+def query_main(args):
+    with metrics.phase("load"):
+        index = ShardedIndex(args.shards_dir, names=args.names)
+        nl_matrix = load_npz(NL_MATRIX_FILE)
+        with open(BUG_REPORT_FILE) as f:
+            bug_reports = json.load(f)
+    print(f"Querying {len(index.shards)} shards holding {len(index)} hunks")
+    all_ranked = index.query(nl_matrix, top_k=args.top_k, block_size=args.block_size, workers=args.workers)
+    results = {
+        bug["id"]: [{"commit_id": cid, "score": score} for cid, score in ranked]
+        for bug, ranked in zip(bug_reports, all_ranked)
+    }
+    with metrics.phase("dump", items=len(results)):
+        with open(OUTPUT_FILE, "w") as f:
+            json.dump(results, f, indent=2)
+    print(f"Saved ranked similarity results to {OUTPUT_FILE}")
+
+def main():
+    ap = ArgumentParser(description="Build and query per-branch or per-period index shards")
+    ap.add_argument("--shards-dir", default=SHARDS_DIR)
+    sub = ap.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="Build shards from commit files against the shared vocabulary")
+    build.add_argument("shards", nargs="+", metavar="NAME=COMMITS_FILE")
+    build.add_argument("--since", help="Only commits dated on or after this ISO date")
+    build.add_argument("--until", help="Only commits dated before this ISO date")
+    build.add_argument("--workers", type=int, default=1, help="Shards built in parallel")
+    build.add_argument("--allow-overlap", action="store_true",
+                       help="Keep commits that are already in other shards")
+
+    query = sub.add_parser("query", help="Rank all bug reports against the shards")
+    query.add_argument("--names", nargs="+", help="Only query these shards")
+    query.add_argument("--top-k", type=int, default=10)
+    query.add_argument("--block-size", type=int, default=256)
+    query.add_argument("--workers", type=int, default=None, help="Shards scored concurrently")
+    metrics.add_arguments(ap)
+    args = ap.parse_args()
+    metrics.apply_arguments(args)
+
+    if args.command == "build":
+        build_main(args)
+    else:
+        query_main(args)
+
+if __name__ == "__main__":
+    with metrics.stage("shards"):
+        main()
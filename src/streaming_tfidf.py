@@ -0,0 +1,112 @@
+# src/streaming_tfidf.py
+# python src/extract_features.py --out-of-core
+# python src/build_corpus.py --out-of-core --chunk-size 2000
+#
+# 文書の文字列リストを持たずに TF-IDF を作る2パス方式。
+#   1パス目: コーパスを流して語ごとの総出現回数と df を数え、語彙 (max_features) と IDF を決める
+#   2パス目: もう一度流し、チャンクごとの CSR 行を IndexWriter で直接ファイルに書き出す
+# 常駐するのは語彙の統計と1チャンク分の行だけなので、コミット数が増えてもピークメモリはほぼ一定。
+# 結果は TfidfVectorizer(max_features=...) で fit_transform したものと一致する。
+
+import os
+import shutil
+import tempfile
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.feature_extraction.text import CountVectorizer
+
+from hashing_features import apply_idf, smooth_idf
+from index_format import IndexWriter, export_npz
+import metrics
+
+def make_analyzer():
+    # TfidfVectorizer(lowercase=True, stop_words="english") と同じ分かち書き
+    return CountVectorizer(lowercase=True, stop_words="english").build_analyzer()
+
+def doc_counts(fields, analyze):
+    """Term counts of one document given as ``(text, weight)`` fields."""
+    counts = {}
+    for text, weight in fields:
+        for tok in analyze(text):
+            counts[tok] = counts.get(tok, 0) + weight
+    return counts
+
+class TermStats:
+    """Total count and document frequency of every term seen in pass 1."""
+
+    def __init__(self):
+        self.tf = {}
+        self.df = {}
+        self.n_docs = 0
+
+    def add(self, counts):
+        for tok, c in counts.items():
+            self.tf[tok] = self.tf.get(tok, 0) + c
+            self.df[tok] = self.df.get(tok, 0) + 1
+        self.n_docs += 1
+
+    def vocabulary(self, max_features=10000):
+        """Return ``(vocabulary, idf, df)`` for the ``max_features`` most frequent terms.
+
+        Terms are sorted and cut the way ``TfidfVectorizer(max_features=...)``
+        does it (see build_corpus.limit_features), so the columns match.
+        """
+        terms = sorted(self.tf)
+        if max_features is not None and len(terms) > max_features:
+            tfs = np.array([self.tf[t] for t in terms])
+            keep = np.sort((-tfs).argsort()[:max_features])
+            terms = [terms[i] for i in keep]
+        df = np.array([self.df[t] for t in terms], dtype=np.int64)
+        return {t: i for i, t in enumerate(terms)}, smooth_idf(df, self.n_docs), df
+
+def collect_stats(docs, analyze, stats=None):
+    """Pass 1: add every document of ``docs`` (iterables of fields) to ``stats``."""
+    stats = stats or TermStats()
+    for fields in docs:
+        stats.add(doc_counts(fields, analyze))
+    return stats
+
+def iter_tfidf_chunks(docs, analyze, vocabulary, idf, chunk_size=2000):
+    """Pass 2: yield TF-IDF rows of ``docs`` as CSR chunks of ``chunk_size`` documents."""
+    indices, values, indptr = [], [], [0]
+
+    def flush():
+        counts = csr_matrix((np.array(values, dtype=np.float64), np.array(indices, dtype=np.int32),
+                             np.array(indptr, dtype=np.int64)), shape=(len(indptr) - 1, len(vocabulary)))
+        counts.sort_indices()
+        return apply_idf(counts, idf)
+
+    for fields in docs:
+        for tok, c in doc_counts(fields, analyze).items():
+            col = vocabulary.get(tok)
+            if col is not None:
+                indices.append(col)
+                values.append(c)
+        indptr.append(len(indices))
+        if len(indptr) > chunk_size:
+            yield flush()
+            indices, values, indptr = [], [], [0]
+    if len(indptr) > 1:
+        yield flush()
+
+def write_rows(chunks, n_cols, output):
+    """Stream CSR ``chunks`` (e.g. from ``iter_tfidf_chunks``) to ``output``.
+
+    ``output`` is a ``.npz`` file (loadable with ``load_npz``) or, for any
+    other path, a raw index directory (index_format.py). Returns the number
+    of rows written.
+    """
+    to_npz = output.endswith(".npz")
+    index_dir = tempfile.mkdtemp(dir=os.path.dirname(output) or ".") if to_npz else output
+    try:
+        with IndexWriter(index_dir, n_cols) as writer:
+            for chunk in chunks:
+                with metrics.phase("write", items=chunk.shape[0]):
+                    writer.append(chunk)
+        if to_npz:
+            with metrics.phase("export_npz"):
+                export_npz(index_dir, output)
+    finally:
+        if to_npz:
+            shutil.rmtree(index_dir, ignore_errors=True)
+    return writer.n_rows
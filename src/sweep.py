@@ -0,0 +1,152 @@
+# src/sweep.py
+# python src/sweep.py --beta 0 0.05 0.1 0.2 0.5 --top-k 10 20 50 --workers 4
+#
+# boost の beta や top_k を変えながら評価する。コサイン類似度は一度だけ計算して
+# data/sweep_cache/ に疎行列で保存し、各設定では boost を掛け直して top-k を取るだけにする。
+
+import json
+import os
+from argparse import ArgumentParser
+from multiprocessing import Pool
+import numpy as np
+from scipy.sparse import load_npz, save_npz
+from sklearn.preprocessing import normalize
+
+from checksums import file_hash
+from compute_similarity import build_boost_vector, load_commit_boost
+from evaluate_ranking import evaluate
+
+BUG_REPORT_FILE = "data/bug_reports.json"
+COMMIT_IDS_FILE = "data/commit_ids.json"
+CE_MATRIX_FILE = "data/ce_tfidf.npz"
+NL_MATRIX_FILE = "data/nl_tfidf.npz"
+COMMIT_FEATURES_FILE = "data/commit_features.json"
+FIX_HUNK_MAP_FILE = "data/fix_hunk_map.json"
+CACHE_DIR = "data/sweep_cache"
+
+def similarity_matrix(nl_matrix, ce_matrix):
+    """Sparse ``(n_bugs, n_hunks)`` cosine similarities without any boost."""
+    sims = (normalize(nl_matrix) @ normalize(ce_matrix).T).tocsr()
+    sims.data = sims.data.astype(np.float32)
+    sims.eliminate_zeros()
+    sims.sort_indices()
+    return sims
+
+def load_similarity(cache_dir=CACHE_DIR, recompute=False):
+    """Return the cached similarity matrix, recomputing it if its inputs changed."""
+    matrix_path = os.path.join(cache_dir, "similarity.npz")
+    sig_path = os.path.join(cache_dir, "similarity.json")
+    inputs = {p: file_hash(p) for p in (NL_MATRIX_FILE, CE_MATRIX_FILE)}
+    if not recompute and os.path.exists(matrix_path) and os.path.exists(sig_path):
+        with open(sig_path) as f:
+            if json.load(f) == inputs:
+                return load_npz(matrix_path)
+    print("Computing similarity matrix...")
+    sims = similarity_matrix(load_npz(NL_MATRIX_FILE), load_npz(CE_MATRIX_FILE))
+    os.makedirs(cache_dir, exist_ok=True)
+    save_npz(matrix_path, sims, compressed=False)
+    with open(sig_path, "w") as f:
+        json.dump(inputs, f)
+    return sims
+
+def boost_ratio(commit_ids, path=COMMIT_FEATURES_FILE):
+    """Per-hunk ``freq / max_freq`` so that ``boost = 1 + beta * ratio``."""
+    return build_boost_vector(commit_ids, load_commit_boost(path, beta=1.0)) - 1.0
+
+def rank_rows(sims, boost, top_k):
+    """Top-k column indices of every row of ``sims * boost``, best first.
+
+    Only the stored (non-zero) similarities are candidates, so a bug whose
+    text shares terms with fewer than ``top_k`` hunks gets a shorter list.
+    """
+    ranked = []
+    for i in range(sims.shape[0]):
+        start, end = sims.indptr[i], sims.indptr[i + 1]
+        cols = sims.indices[start:end]
+        scores = sims.data[start:end] * boost[cols]
+        if len(scores) > top_k:
+            part = np.argpartition(-scores, top_k - 1)[:top_k]
+        else:
+            part = np.arange(len(scores))
+        order = part[np.argsort(-scores[part], kind="stable")]
+        ranked.append((cols[order], scores[order]))
+    return ranked
+
+_worker = {}
+
+def _init_worker(cache_dir):
+    # fork 後の各ワーカーは保存済みの行列を自分で読む (設定ごとに送らない)
+    with open(COMMIT_IDS_FILE) as f:
+        commit_ids = json.load(f)
+    with open(BUG_REPORT_FILE) as f:
+        bug_ids = [str(bug["id"]) for bug in json.load(f)]
+    with open(FIX_HUNK_MAP_FILE) as f:
+        fix_hunk_ids = json.load(f)
+    _worker.update(
+        sims=load_npz(os.path.join(cache_dir, "similarity.npz")).tocsr(),
+        ratio=boost_ratio(commit_ids),
+        commit_ids=commit_ids,
+        bug_ids=bug_ids,
+        fix_hunk_ids=fix_hunk_ids,
+    )
+
+def evaluate_config(beta, top_ks, ks):
+    """Evaluate one ``beta`` for every cutoff in ``top_ks``.
+
+    The ranking is computed once for the largest cutoff; smaller cutoffs
+    are prefixes of it.
+    """
+    w = _worker
+    ranked = rank_rows(w["sims"], 1.0 + beta * w["ratio"], max(top_ks))
+    rows = []
+    for top_k in top_ks:
+        scores = {
+            bug_id: [{"commit_id": w["commit_ids"][j], "score": float(s)}
+                     for j, s in zip(cols[:top_k], vals[:top_k])]
+            for bug_id, (cols, vals) in zip(w["bug_ids"], ranked)
+        }
+        rows.append({"beta": beta, "top_k": top_k, **evaluate(scores, w["fix_hunk_ids"], ks=ks)})
+    return rows
+
+def _evaluate_config(args):
+    return evaluate_config(*args)
+
+def format_table(rows):
+    keys = list(rows[0])
+    lines = ["  ".join(f"{k:>8}" for k in keys)]
+    for row in rows:
+        lines.append("  ".join(f"{row[k]:>8.4f}" if isinstance(row[k], float) else f"{row[k]:>8}"
+                               for k in keys))
+    return "\n".join(lines)
+
+def main():
+    ap = ArgumentParser(description="Evaluate many boost/top-k settings from one similarity computation")
+    ap.add_argument("--beta", type=float, nargs="+", default=[0.0, 0.05, 0.1, 0.2, 0.5, 1.0],
+                    help="Values of beta in load_commit_boost")
+    ap.add_argument("--top-k", type=int, nargs="+", default=[10], help="Ranking cutoffs")
+    ap.add_argument("--ks", type=int, nargs="+", default=[1, 5, 10], help="Cutoffs reported as TOP@k")
+    ap.add_argument("--workers", type=int, default=1, help="Number of processes evaluating settings")
+    ap.add_argument("--cache-dir", default=CACHE_DIR, help="Where the similarity matrix is cached")
+    ap.add_argument("--recompute", action="store_true", help="Ignore the cached similarity matrix")
+    ap.add_argument("--output", help="Also write the results as JSON")
+    args = ap.parse_args()
+
+    load_similarity(args.cache_dir, recompute=args.recompute)
+    top_ks = sorted(set(args.top_k))
+    tasks = [(beta, top_ks, tuple(args.ks)) for beta in args.beta]
+    if args.workers > 1:
+        with Pool(args.workers, initializer=_init_worker, initargs=(args.cache_dir,)) as pool:
+            results = pool.map(_evaluate_config, tasks)
+    else:
+        _init_worker(args.cache_dir)
+        results = [evaluate_config(*task) for task in tasks]
+    rows = [row for rows in results for row in rows]
+
+    print(format_table(rows))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(rows, f, indent=2)
+        print(f"Saved {len(rows)} results to {args.output}")
+
+if __name__ == "__main__":
+    main()
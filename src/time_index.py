@@ -0,0 +1,58 @@
+# src/time_index.py
+# ハンクをコミット日時順に並べ、バグ報告より前のハンクだけを候補にする
+
+import json
+from datetime import datetime, timezone
+import numpy as np
+from sklearn.preprocessing import normalize
+
+def parse_date(value):
+    """Convert an ISO-8601 timestamp to epoch seconds, or None if unparseable."""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+def load_hunk_dates(path):
+    with open(path, "r") as f:
+        return json.load(f)
+
+class TimeIndex:
+    """Hunk rows of ``ce_matrix`` sorted by commit date.
+
+    The candidates of a bug filed at time ``t`` are the contiguous prefix of
+    hunks committed strictly before ``t``. Hunks without a usable date sort
+    last and are only scored for bugs that have no creation date either.
+    """
+
+    def __init__(self, ce_matrix, commit_ids, hunk_dates):
+        if len(hunk_dates) != len(commit_ids):
+            raise ValueError(
+                f"hunk_dates has {len(hunk_dates)} entries but commit_ids has {len(commit_ids)}"
+            )
+        ts = np.array([parse_date(d) for d in hunk_dates], dtype=float)
+        ts[np.isnan(ts)] = np.inf
+        self.order = np.argsort(ts, kind="stable")
+        self.dates = ts[self.order]
+        self.commit_ids = [commit_ids[i] for i in self.order]
+        # 転置して CSC にしておくと先頭 n ハンクの切り出しが連続領域になる
+        self.matrix_t = normalize(ce_matrix)[self.order].T.tocsc()
+
+    def __len__(self):
+        return len(self.commit_ids)
+
+    def prefix_len(self, created):
+        """Number of leading rows committed before ``created``."""
+        t = parse_date(created)
+        if t is None:
+            return len(self)
+        return int(np.searchsorted(self.dates, t, side="left"))
+
+    def candidates(self, n):
+        """Transposed TF-IDF columns for the first ``n`` hunks."""
+        return self.matrix_t[:, :n]
@@ -0,0 +1,172 @@
+# src/update_index.py
+# python src/update_index.py data/new_commits.jsonl
+# python src/update_index.py data/new_commits.jsonl --refresh-idf --drift-threshold 0.05
+# python src/update_index.py data/new_commits.jsonl --repo ../tomcat   # extract_commits.py --lazy の出力
+#
+# 新しく取り込んだコミットだけを既存のインデックスに追記する。
+# 語彙と IDF は extract_features.py が保存したものをそのまま使う。
+# hunk_corpus.jsonl と hunk_boost.npy も追記・再計算し、行数が変わって使えなくなる派生物
+# (DERIVED_FILES) は削除する。必要なら dedup_hunks.py / index_format.py を実行し直す。
+
+import json
+import os
+import shutil
+from argparse import ArgumentParser
+import numpy as np
+from scipy.sparse import load_npz, save_npz, vstack, csr_matrix
+from sklearn.preprocessing import normalize
+
+from commit_boost import HUNK_BOOST_FILE, load_hunk_boost
+from commit_stream import iter_records
+from compute_similarity import load_vectorizer
+from extract_commit_features import extract_features as extract_commit_features
+from extract_corpora import STOPWORDS
+from extract_features import document_frequencies, load_stats, save_stats
+from extract_hunks import iter_hunks
+from hashing_features import smooth_idf
+from hunk_store import HunkStore, HunkStoreWriter
+from hunk_tokenizer import tokenize_hunk
+
+VOCAB_FILE = "data/tfidf_vocab.json"
+STATS_FILE = "data/tfidf_stats.npz"
+CE_MATRIX_FILE = "data/ce_tfidf.npz"
+NL_MATRIX_FILE = "data/nl_tfidf.npz"
+COMMIT_IDS_FILE = "data/commit_ids.json"
+HUNK_DATES_FILE = "data/hunk_dates.json"
+HUNKS_DIR = "data/hunks"
+COMMIT_FEATURES_FILE = "data/commit_features.json"
+HUNK_CORPUS_FILE = "data/hunk_corpus.jsonl"
+# ce_tfidf.npz の行に揃っていて追記できない派生物。古いまま残すと形が合わないか古い値が使われる
+DERIVED_FILES = {
+    "data/index": "python src/index_format.py",
+    "data/index_cache": "rebuilt by src/serve.py on start",
+    "data/low_rank.npz": "rebuilt by compute_similarity.py --mode two-stage",
+    "data/hunk_groups.json": "python src/dedup_hunks.py",
+    "data/ce_tfidf_dedup.npz": "python src/dedup_hunks.py",
+}
+
+def load_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+def dump_json(path, obj, **kwargs):
+    with open(path, "w") as f:
+        json.dump(obj, f, **kwargs)
+
+def vectorize_commits(commits, vectorizer, start=0):
+    """Extract hunks from ``commits`` and transform their CE tokens.
+
+    Returns the hunk records, with their ``nl`` and ``ce`` tokens added, and
+    a TF-IDF matrix with one row per hunk.
+    """
+    hunks = list(iter_hunks(commits, start=start))
+    for h in hunks:
+        tokens = tokenize_hunk(h["hunk"], STOPWORDS, features=False)
+        h["nl"], h["ce"] = tokens.nl, tokens.ce
+    ce_texts = [" ".join(h["ce"]) for h in hunks]
+    if not ce_texts:
+        return hunks, csr_matrix((0, len(vectorizer.idf_)))
+    return hunks, vectorizer.transform(ce_texts)
+
+def idf_drift(old_idf, new_idf):
+    """Relative L1 change of the IDF vector."""
+    return float(np.abs(new_idf - old_idf).sum() / np.abs(old_idf).sum())
+
+def reweight(matrix, scale):
+    # 行は tf * idf を L2 正規化したものなので、列スケール後に再正規化すれば
+    # 新しい IDF で作り直した行列と一致する
+    return normalize(csr_matrix(matrix.multiply(scale)))
+
+def remove_derived(paths=DERIVED_FILES):
+    for path, rebuild in paths.items():
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        elif os.path.exists(path):
+            os.remove(path)
+        else:
+            continue
+        print(f"Removed stale {path} ({rebuild})")
+
+def main():
+    ap = ArgumentParser(description="Append newly landed commits to the hunk index",
+                        epilog="hunk_corpus.jsonl is appended to and hunk_boost.npy recomputed. "
+                               "data/index, data/index_cache, data/low_rank.npz and the dedup groups "
+                               "are removed; rerun src/index_format.py and src/dedup_hunks.py if you use them.")
+    ap.add_argument("commits", help="commits.json / commits.jsonl holding the new commits")
+    ap.add_argument("--refresh-idf", action="store_true",
+                    help="Recompute IDF and reweight the stored matrices when drift exceeds the threshold")
+    ap.add_argument("--drift-threshold", type=float, default=0.05,
+                    help="Relative L1 IDF change that triggers a refresh")
+    ap.add_argument("--repo", default=None,
+                    help="Git repository holding the patches of --lazy commits (default: $LOCUS_REPO)")
+    args = ap.parse_args()
+
+    if not os.path.exists(STATS_FILE):
+        ap.error(f"{STATS_FILE} not found; run src/extract_features.py once to build the base index")
+
+    commit_ids = load_json(COMMIT_IDS_FILE, [])
+    features = load_json(COMMIT_FEATURES_FILE, [])
+    # コミット特徴量にはハンクを持たないコミットも載っているので両方を見る
+    known = {cid.split(":")[0] for cid in commit_ids}
+    known.update(item["commit_id"] for item in features)
+    commits = [c for c in iter_records(args.commits, repo=args.repo)
+               if (c.get("hash") or c.get("commit_id")) not in known]
+    if not commits:
+        print("No new commits to index.")
+        return
+
+    idf, df, n_docs = load_stats(STATS_FILE)
+    vectorizer = load_vectorizer(VOCAB_FILE, idf=idf)
+
+    has_store = os.path.exists(os.path.join(HUNKS_DIR, "meta.json"))
+    start = len(HunkStore(HUNKS_DIR)) if has_store else len(commit_ids)
+    hunks, new_rows = vectorize_commits(commits, vectorizer, start=start)
+    print(f"Indexing {len(hunks)} hunks from {len(commits)} new commits")
+
+    ce_matrix = vstack([load_npz(CE_MATRIX_FILE), new_rows], format="csr")
+    commit_ids.extend(f"{h['commit_id']}:{h['index']}" for h in hunks)
+
+    df = df + document_frequencies(new_rows)
+    n_docs += new_rows.shape[0]
+    new_idf = smooth_idf(df, n_docs)
+    drift = idf_drift(idf, new_idf)
+    print(f"IDF drift: {drift:.4f}")
+    if args.refresh_idf and drift > args.drift_threshold:
+        print("Drift above threshold, reweighting stored matrices with refreshed IDF")
+        scale = new_idf / idf
+        ce_matrix = reweight(ce_matrix, scale)
+        save_npz(NL_MATRIX_FILE, reweight(load_npz(NL_MATRIX_FILE), scale))
+        idf = new_idf
+
+    save_npz(CE_MATRIX_FILE, ce_matrix)
+    save_stats(STATS_FILE, idf, df, n_docs)
+    dump_json(COMMIT_IDS_FILE, commit_ids)
+
+    hunk_dates = load_json(HUNK_DATES_FILE)
+    if hunk_dates is not None:
+        hunk_dates.extend(h.get("date") for h in hunks)
+        dump_json(HUNK_DATES_FILE, hunk_dates)
+    if has_store:
+        with HunkStoreWriter(HUNKS_DIR, append=True) as writer:
+            for hunk in hunks:
+                writer.add(hunk)
+
+    if os.path.exists(HUNK_CORPUS_FILE):
+        with open(HUNK_CORPUS_FILE, "a") as f:
+            for h in hunks:
+                f.write(json.dumps({"hunk_id": h["hunk_id"], "nl": h["nl"], "ce": h["ce"]}) + "\n")
+
+    features.extend(extract_commit_features(commits))
+    dump_json(COMMIT_FEATURES_FILE, features, ensure_ascii=False, indent=2)
+    if os.path.exists(HUNK_BOOST_FILE):
+        # 保存されている beta のまま作り直して保存される
+        load_hunk_boost(commit_ids, features, commit_ids_file=COMMIT_IDS_FILE,
+                        features_file=COMMIT_FEATURES_FILE)
+    remove_derived()
+
+    print(f"Index now holds {ce_matrix.shape[0]} hunks")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+# tools/benchmark.py
+# python tools/benchmark.py --hunks 10000 100000 --bugs 1000
+# python tools/benchmark.py --hunks 100000 --compare data/benchmarks/20250101-120000.json
+#
+# 合成データ (tools/synth_corpus.py) に対して各ステージを子プロセスで実行し、
+# 経過時間・ピーク RSS・スループットを JSON に保存する。
+
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from argparse import ArgumentParser
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from synth_corpus import write_dataset
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(ROOT, "src")
+
+# (ステージ名, src/ のスクリプトと引数, スループットの単位)
+# build_corpus はコミット単位の commit_ids.json を書くので、ハンク単位の評価が済んでから最後に回す
+STAGES = [
+    ("extract_hunks", ["extract_hunks.py"], "commits"),
+    ("extract_commit_features", ["extract_commit_features.py", "data/commits.json",
+                                 "data/commit_features.json"], "commits"),
+    ("extract_corpora", ["extract_corpora.py"], "hunks"),
+    ("extract_features", ["extract_features.py"], "hunks"),
+    ("generate_hunk_ids", ["generate_hunk_ids.py"], "hunks"),
+    ("generate_fix_hunk_map", ["generate_fix_hunk_map.py"], "bugs"),
+    ("compute_similarity", ["compute_similarity.py", "--mode", "batched"], "bugs"),
+    ("evaluate_ranking", ["evaluate_ranking.py"], "bugs"),
+    ("build_corpus", ["build_corpus.py"], "commits"),
+]
+
+def metrics_lines(path: str) -> int:
+    """Number of records already in the metrics file."""
+    if not os.path.exists(path):
+        return 0
+    with open(path) as f:
+        return sum(1 for _ in f)
+
+def stage_metrics(path: str, stage: str, start: int) -> List[Dict]:
+    """Phases of the record ``stage`` wrote after line ``start`` of the metrics file, if any.
+
+    A stage that wrote no record (not wrapped in ``metrics.stage`` or killed
+    before it could) gets no phases instead of those of the previous stage.
+    """
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        lines = f.read().splitlines()[start:]
+    records = [json.loads(line) for line in lines if line.strip()]
+    matching = [r for r in records if r.get("stage") == stage]
+    return matching[-1]["phases"] if matching else []
+
+def run_measured(cmd: List[str], cwd: str, log_path: str) -> Dict:
+    """Run ``cmd`` and return its wall time, exit status and peak RSS.
+
+    ``os.wait4`` reports the resource usage of that child alone, so stages
+    do not inherit each other's peak as they would with ``RUSAGE_CHILDREN``.
+    """
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        proc = subprocess.Popen(cmd, cwd=cwd, stdout=log, stderr=subprocess.STDOUT)
+        _, status, usage = os.wait4(proc.pid, 0)
+        wall = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # Linux の ru_maxrss は KiB 単位 (macOS はバイト)
+    scale = 1 if sys.platform == "darwin" else 1024
+    return {
+        "wall_s": wall,
+        "user_s": usage.ru_utime,
+        "sys_s": usage.ru_stime,
+        "peak_rss_mb": usage.ru_maxrss * scale / 2 ** 20,
+        "exit_code": proc.returncode,
+    }
+
+def benchmark_size(workdir: str, hunks: int, bugs: int, seed: int, stages: List[str]) -> Dict:
+    data_dir = os.path.join(workdir, "data")
+    log_dir = os.path.join(workdir, "logs")
+    os.makedirs(log_dir, exist_ok=True)
+    metrics_path = os.path.join(workdir, "metrics.jsonl")
+    os.environ["LOCUS_METRICS_FILE"] = metrics_path
+
+    start = time.perf_counter()
+    counts = write_dataset(data_dir, hunks, bugs, seed)
+    run = {**counts, "generate_s": time.perf_counter() - start, "stages": []}
+    print(f"[{hunks} hunks] generated {counts['commits']} commits and {counts['bugs']} bugs "
+          f"in {run['generate_s']:.1f}s", flush=True)
+
+    for name, script_args, unit in STAGES:
+        if name not in stages:
+            continue
+        cmd = [sys.executable, os.path.join(SRC, script_args[0])] + script_args[1:]
+        seen = metrics_lines(metrics_path)
+        result = run_measured(cmd, workdir, os.path.join(log_dir, f"{name}.log"))
+        items = counts[unit]
+        result.update(stage=name, items=items, unit=unit,
+                      throughput=items / result["wall_s"] if result["wall_s"] > 0 else None,
+                      phases=stage_metrics(metrics_path, name, seen))
+        run["stages"].append(result)
+        print(f"[{hunks} hunks] {name}: {result['wall_s']:.2f}s, {result['peak_rss_mb']:.0f} MiB, "
+              f"{result['throughput']:.0f} {unit}/s", flush=True)
+        if result["exit_code"] != 0:
+            print(f"[{hunks} hunks] {name} failed; see {os.path.join(log_dir, name + '.log')}")
+            break
+    return run
+
+def git_revision() -> Optional[str]:
+    proc = subprocess.run(["git", "-C", ROOT, "rev-parse", "HEAD"], capture_output=True, text=True)
+    return proc.stdout.strip() or None
+
+def compare(current: Dict, previous: Dict) -> None:
+    """Print the wall-time and peak-RSS ratio of each stage against an earlier run."""
+    before = {(run["hunks"], s["stage"]): s for run in previous["runs"] for s in run["stages"]}
+    print(f"\nCompared with {previous.get('revision')} ({previous.get('created')}):")
+    print(f"{'hunks':>9}  {'stage':<24}{'wall':>8}{'rss':>8}")
+    for run in current["runs"]:
+        for s in run["stages"]:
+            old = before.get((run["hunks"], s["stage"]))
+            if old is None:
+                continue
+            print(f"{run['hunks']:>9}  {s['stage']:<24}"
+                  f"{s['wall_s'] / old['wall_s']:>7.2f}x{s['peak_rss_mb'] / old['peak_rss_mb']:>7.2f}x")
+
+def main() -> None:
+    ap = ArgumentParser(description="Time each pipeline stage on synthetic datasets of several sizes")
+    ap.add_argument("--hunks", type=int, nargs="+", default=[10000], help="Dataset sizes in hunks")
+    ap.add_argument("--bugs", type=int, default=1000, help="Bug reports per dataset")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--stages", nargs="+", default=[name for name, _, _ in STAGES],
+                    help="Stages to run (in pipeline order)")
+    ap.add_argument("--workdir", help="Where datasets are generated (default: a temporary directory)")
+    ap.add_argument("--keep", action="store_true",
+                    help="Keep the generated datasets and logs (always kept with --workdir)")
+    ap.add_argument("--output", help="Results file (default: data/benchmarks/<timestamp>.json)")
+    ap.add_argument("--compare", help="Earlier results file to compare against")
+    args = ap.parse_args()
+
+    created = datetime.now()
+    results = {
+        "created": created.isoformat(timespec="seconds"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": args.seed,
+        "runs": [],
+    }
+    workdir = args.workdir or tempfile.mkdtemp(prefix="locus-bench-")
+    try:
+        for hunks in args.hunks:
+            size_dir = os.path.join(workdir, str(hunks))
+            results["runs"].append(benchmark_size(size_dir, hunks, args.bugs, args.seed, args.stages))
+    finally:
+        if args.keep or args.workdir:
+            print(f"Datasets and logs kept in {workdir}")
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join("data", "benchmarks", created.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Saved benchmark results to {output}")
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+if __name__ == "__main__":
+    main()
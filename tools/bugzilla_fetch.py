@@ -0,0 +1,161 @@
+import json
+import os
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import requests
+from tqdm import tqdm
+
+DEFAULT_BASE_URL = "https://bz.apache.org/bugzilla"
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class RetryableResponse(Exception):
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Seconds to wait from a ``Retry-After`` header (delay in seconds or an HTTP date)."""
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+    except (TypeError, ValueError):
+        return None
+
+
+def rest_body_ok(text: str) -> bool:
+    """True if a REST response holds at least one bug and no error."""
+    try:
+        data = json.loads(text)
+    except json.JSONDecodeError:
+        return False
+    return isinstance(data, dict) and not data.get("error") and bool(data.get("bugs"))
+
+
+# kind ごとに、キャッシュしてよい応答かを判定する関数 (get の cacheable で上書きできる)
+CACHE_CHECKS: Dict[str, Callable[[str], bool]] = {"rest": rest_body_ok}
+
+
+class BugzillaFetcher:
+    """Fetch Bugzilla responses concurrently with retries and an on-disk cache.
+
+    Successful responses are cached under ``cache_dir/<kind>/<bug_id>``, so a
+    rerun only downloads the bugs that are still missing. A 2xx body that is
+    really an error page (see ``CACHE_CHECKS``) is returned but not cached. ``base_url`` (or the
+    ``BUGZILLA_URL`` environment variable) can point at a local stand-in server.
+    """
+
+    def __init__(
+        self,
+        base_url: Optional[str] = None,
+        cache_dir: Optional[str] = "data/bugzilla_cache",
+        concurrency: int = 8,
+        retries: int = 3,
+        backoff: float = 1.0,
+        timeout: float = 30,
+    ):
+        self.base_url = (base_url or os.environ.get("BUGZILLA_URL") or DEFAULT_BASE_URL).rstrip("/")
+        self.cache_dir = cache_dir
+        self.concurrency = concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _session(self) -> requests.Session:
+        if not hasattr(self._local, "session"):
+            self._local.session = requests.Session()
+        return self._local.session
+
+    def _cache_path(self, kind: str, bug_id: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, kind, str(bug_id))
+
+    def get(self, kind: str, bug_id: str, path: str, params: Optional[Dict] = None,
+            cacheable: Optional[Callable[[str], bool]] = None) -> str:
+        """Return the body of ``base_url/path``, from the cache when possible.
+
+        ``cacheable(body)`` (default: ``CACHE_CHECKS[kind]``, if any) decides
+        whether the body may be cached; cached bodies failing it are fetched again.
+        """
+        cacheable = cacheable or CACHE_CHECKS.get(kind) or (lambda body: True)
+        cache_path = self._cache_path(kind, bug_id)
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as f:
+                body = f.read()
+            if cacheable(body):
+                return body
+
+        url = f"{self.base_url}/{path.lstrip('/')}"
+        for attempt in range(self.retries + 1):
+            try:
+                res = self._session().get(url, params=params, timeout=self.timeout)
+                if res.status_code in RETRY_STATUSES:
+                    raise RetryableResponse(f"status {res.status_code}",
+                                            parse_retry_after(res.headers.get("Retry-After")))
+                res.raise_for_status()
+                break
+            except (requests.ConnectionError, requests.Timeout, RetryableResponse) as e:
+                if attempt == self.retries:
+                    raise
+                # サーバーが待ち時間を指定していればそれに従う
+                delay = getattr(e, "retry_after", None)
+                time.sleep(self.backoff * 2 ** attempt if delay is None else delay)
+
+        if cache_path and cacheable(res.text):
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            tmp_path = f"{cache_path}.tmp{threading.get_ident()}"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(res.text)
+            os.replace(tmp_path, cache_path)
+        return res.text
+
+    def fetch_many(
+        self, bug_ids: Iterable[str], fetch_one: Callable[[str], Dict], desc: str = "Fetching bugs"
+    ) -> List[Tuple[str, Optional[Dict], Optional[Exception]]]:
+        """Run ``fetch_one`` for every bug id with at most ``concurrency`` in flight.
+
+        Returns ``(bug_id, result, error)`` tuples in the order of ``bug_ids``.
+        """
+        bug_ids = list(bug_ids)
+        outcomes = {}
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            futures = {pool.submit(fetch_one, bid): bid for bid in bug_ids}
+            for fut in tqdm(as_completed(futures), total=len(futures), desc=desc):
+                bid = futures[fut]
+                try:
+                    outcomes[bid] = (fut.result(), None)
+                except Exception as e:
+                    outcomes[bid] = (None, e)
+        return [(bid, *outcomes[bid]) for bid in bug_ids]
+
+
+def add_fetcher_arguments(ap) -> None:
+    ap.add_argument("--base-url", default=None,
+                    help=f"Bugzilla base URL (default: $BUGZILLA_URL or {DEFAULT_BASE_URL})")
+    ap.add_argument("--cache-dir", default="data/bugzilla_cache", help="On-disk response cache")
+    ap.add_argument("--no-cache", action="store_true", help="Always download, never read or write the cache")
+    ap.add_argument("--concurrency", type=int, default=8, help="Maximum concurrent requests")
+    ap.add_argument("--retries", type=int, default=3, help="Retries per bug on timeouts and 429/5xx")
+    ap.add_argument("--backoff", type=float, default=1.0, help="Initial retry delay in seconds, doubled per retry")
+
+
+def fetcher_from_args(args) -> BugzillaFetcher:
+    return BugzillaFetcher(
+        base_url=args.base_url,
+        cache_dir=None if args.no_cache else args.cache_dir,
+        concurrency=args.concurrency,
+        retries=args.retries,
+        backoff=args.backoff,
+    )
@@ -1,20 +1,32 @@
 import json
 import os
 import re
-from typing import Dict, List
+from argparse import ArgumentParser
+from typing import Dict, List, Optional
 
 import git
-import requests
 from bs4 import BeautifulSoup
 from tqdm import tqdm
 
+from bugzilla_fetch import BugzillaFetcher, add_fetcher_arguments, fetcher_from_args
 
-def fetch_bug_report(bug_id: str) -> Dict:
+
+def fetch_bug_report(bug_id: str, fetcher: Optional[BugzillaFetcher] = None) -> Dict:
     """Fetch summary and description for a Bugzilla bug."""
-    url = f"https://bz.apache.org/bugzilla/show_bug.cgi?id={bug_id}"
-    res = requests.get(url, timeout=30)
-    res.raise_for_status()
-    soup = BeautifulSoup(res.text, "html.parser")
+    fetcher = fetcher or BugzillaFetcher()
+    html = fetcher.get("html", bug_id, "show_bug.cgi", params={"id": bug_id},
+                       cacheable=lambda body: has_bug(bug_id, body))
+    return parse_bug_html(bug_id, html)
+
+
+def has_bug(bug_id: str, html: str) -> bool:
+    # "Bug #N does not exist" やアクセス拒否のページには件名がないのでキャッシュしない
+    return bool(parse_bug_html(bug_id, html)["summary"])
+
+
+def parse_bug_html(bug_id: str, html: str) -> Dict:
+    """Extract summary, description and creation date from a show_bug page."""
+    soup = BeautifulSoup(html, "html.parser")
     summary = soup.find("span", id="short_desc_nonedit_display")
     description = soup.find("pre", class_="bz_comment_text")
 
@@ -46,17 +58,22 @@ def scan_repository(repo_path: str) -> Dict[str, List[str]]:
 
 
 def main():
+    ap = ArgumentParser(description="Collect Bugzilla reports referenced from commit messages")
+    add_fetcher_arguments(ap)
+    args = ap.parse_args()
+    fetcher = fetcher_from_args(args)
+
     repo_path = os.environ.get("TOMCAT_REPO", "tomcat")
     bug_map = scan_repository(repo_path)
 
     reports = []
-    for bug_id, commits in tqdm(bug_map.items()):
-        try:
-            br = fetch_bug_report(bug_id)
-            br["fixes"] = [c[:7] for c in commits]
-            reports.append(br)
-        except Exception as e:
-            print(f"Failed to fetch BUG-{bug_id}: {e}")
+    fetched = fetcher.fetch_many(bug_map, lambda bid: fetch_bug_report(bid, fetcher))
+    for bug_id, br, error in fetched:
+        if error is not None:
+            print(f"Failed to fetch BUG-{bug_id}: {error}")
+            continue
+        br["fixes"] = [c[:7] for c in bug_map[bug_id]]
+        reports.append(br)
 
     os.makedirs("data", exist_ok=True)
     with open("data/bug_reports.json", "w") as f:
@@ -1,15 +1,16 @@
 import json
 import re
-import requests
-from tqdm import tqdm
+from argparse import ArgumentParser
+from bugzilla_fetch import BugzillaFetcher, add_fetcher_arguments, fetcher_from_args
 
-def fetch_bug_report_rest(bug_id):
-    url = f"https://bz.apache.org/bugzilla/rest.cgi/bug/{bug_id}?Bugzilla_api_key={'azVGl7F6Kj4iw3xIn4DiMbtqYrfPfznyOTsF0BJW'}"
-    res = requests.get(url, timeout=10)
+def fetch_bug_report_rest(bug_id, fetcher=None):
+    fetcher = fetcher or BugzillaFetcher(timeout=10)
+    text = fetcher.get("rest", bug_id, f"rest.cgi/bug/{bug_id}",
+                       params={"Bugzilla_api_key": 'azVGl7F6Kj4iw3xIn4DiMbtqYrfPfznyOTsF0BJW'})
     try:
-        data = res.json()
+        data = json.loads(text)
     except json.JSONDecodeError:
-        raise Exception(f"Bug {bug_id} returned invalid JSON (status={res.status_code})")
+        raise Exception(f"Bug {bug_id} returned invalid JSON")
 
     if "bugs" not in data or not data["bugs"]:
         raise Exception(f"Bug {bug_id} not found")
@@ -49,16 +50,21 @@ def collect_from_commit_log(commits_file):
     return bug_map
 
 if __name__ == "__main__":
+    ap = ArgumentParser(description="Fetch RESOLVED FIXED bugs referenced from changelog patches")
+    add_fetcher_arguments(ap)
+    args = ap.parse_args()
+    fetcher = fetcher_from_args(args)
+
     bug_map = collect_from_commit_log("data/commits.json")
 
     result = []
-    for bug_id, commit_ids in tqdm(bug_map.items(), desc="Fetching bugs"):
-        try:
-            bug = fetch_bug_report_rest(bug_id)
-            bug["fixes"] = [cid[:7] for cid in commit_ids]
-            result.append(bug)
-        except Exception as e:
-            print(f"Skipped BUG-{bug_id}: {e}")
+    fetched = fetcher.fetch_many(bug_map, lambda bid: fetch_bug_report_rest(bid, fetcher))
+    for bug_id, bug, error in fetched:
+        if error is not None:
+            print(f"Skipped BUG-{bug_id}: {error}")
+            continue
+        bug["fixes"] = [cid[:7] for cid in bug_map[bug_id]]
+        result.append(bug)
 
     with open("data/bug_reports.json", "w") as f:
         json.dump(result, f, indent=2)
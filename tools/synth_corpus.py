@@ -0,0 +1,199 @@
+# tools/synth_corpus.py
+# python tools/synth_corpus.py /tmp/synth/data --hunks 100000 --bugs 1000 --seed 0
+#
+# Tomcat 風の Java 差分を持つ合成コミットとバグ報告を作る。ベンチマーク用で、
+# 出力は extract_commits.py / collect_dataset.py と同じ形式。
+
+import hashlib
+import json
+import os
+import random
+import re
+from argparse import ArgumentParser
+from datetime import datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Dict, Iterator, List, Tuple
+
+WORDS = [
+    "request", "response", "context", "session", "buffer", "connector", "valve", "wrapper",
+    "servlet", "filter", "loader", "manager", "host", "engine", "socket", "channel", "header",
+    "cookie", "attribute", "parameter", "timeout", "pool", "thread", "stream", "body", "content",
+    "mapping", "realm", "principal", "cache", "resource", "jar", "config", "listener", "event",
+    "state", "lifecycle", "endpoint", "processor", "handler", "encoding", "charset", "upgrade",
+    "async", "dispatch", "container", "pipeline", "cluster", "member", "deployer", "naming",
+]
+PACKAGES = [
+    "java/org/apache/catalina/core", "java/org/apache/catalina/connector",
+    "java/org/apache/catalina/session", "java/org/apache/catalina/valves",
+    "java/org/apache/coyote/http11", "java/org/apache/coyote/ajp", "java/org/apache/jasper/compiler",
+    "java/org/apache/jasper/runtime", "java/org/apache/tomcat/util/net", "java/org/apache/tomcat/util/buf",
+    "java/org/apache/naming/resources", "java/org/apache/el/parser",
+]
+COMMENT_WORDS = [
+    "ensure", "the", "is", "not", "null", "before", "using", "it", "avoid", "leak", "when",
+    "closed", "reset", "after", "recycle", "handle", "case", "where", "already", "committed",
+    "check", "length", "limit", "exceeded", "release", "memory", "large", "allocation",
+]
+START_DATE = datetime(2010, 1, 1, tzinfo=timezone.utc)
+IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+
+class Vocabulary:
+    """Zipf-weighted identifiers so a few names dominate, as in real code."""
+
+    def __init__(self, rng: random.Random, size: int = 2000):
+        self.rng = rng
+        names = set()
+        while len(names) < size:
+            parts = rng.sample(WORDS, rng.randint(1, 3))
+            names.add(parts[0] + "".join(p.capitalize() for p in parts[1:]))
+        self.names = sorted(names)
+        self.name_set = names
+        rng.shuffle(self.names)
+        self.cum_weights = list(accumulate(1.0 / (rank + 1) for rank in range(size)))
+
+    def name(self) -> str:
+        return self.rng.choices(self.names, cum_weights=self.cum_weights)[0]
+
+    def type_name(self) -> str:
+        name = self.name()
+        return name[0].upper() + name[1:]
+
+    def words(self, n: int) -> str:
+        return " ".join(self.rng.choice(COMMENT_WORDS) for _ in range(n))
+
+def code_line(vocab: Vocabulary, indent: str) -> str:
+    rng = vocab.rng
+    kind = rng.randrange(9)
+    if kind == 0:
+        return f"{indent}if ({vocab.name()} == null) {{"
+    if kind == 1:
+        return f"{indent}{vocab.name()}.{vocab.name()}({vocab.name()});"
+    if kind == 2:
+        return f"{indent}// {vocab.words(rng.randint(3, 8))}"
+    if kind == 3:
+        return f'{indent}log.debug("{vocab.words(rng.randint(2, 6))}");'
+    if kind == 4:
+        t = vocab.type_name()
+        return f"{indent}{t} {vocab.name()} = new {t}({vocab.name()});"
+    if kind == 5:
+        return f"{indent}return {vocab.name()};"
+    if kind == 6:
+        return f"{indent}for (int i = 0; i < {vocab.name()}.length; i++) {{"
+    if kind == 7:
+        return f"{indent}}} catch ({vocab.type_name()}Exception e) {{"
+    return f"{indent}}}"
+
+def make_hunk(vocab: Vocabulary, start: int) -> Tuple[str, int]:
+    """One unified-diff hunk with context, removed and added lines."""
+    rng = vocab.rng
+    indent = " " * rng.choice((8, 12))
+    before = [" " + code_line(vocab, indent) for _ in range(3)]
+    removed = ["-" + code_line(vocab, indent) for _ in range(rng.randint(0, 5))]
+    added = ["+" + code_line(vocab, indent) for _ in range(rng.randint(1, 8))]
+    after = [" " + code_line(vocab, indent) for _ in range(3)]
+    old_len = len(before) + len(removed) + len(after)
+    new_len = len(before) + len(added) + len(after)
+    header = (f"@@ -{start},{old_len} +{start},{new_len} @@ "
+              f"public void {vocab.name()}({vocab.type_name()} {vocab.name()}) {{")
+    return "\n".join([header] + before + removed + added + after), new_len
+
+def make_commit(vocab: Vocabulary, seq: int, date: datetime, max_hunks: int) -> Tuple[Dict, List[str]]:
+    rng = vocab.rng
+    diffs = []
+    hunks = 0
+    for _ in range(rng.choices((1, 2, 3, 4, 6), (40, 25, 15, 10, 10))[0]):
+        if hunks >= max_hunks:
+            break
+        path = f"{rng.choice(PACKAGES)}/{vocab.type_name()}.java"
+        parts = []
+        line = rng.randint(20, 200)
+        for _ in range(min(rng.choices((1, 2, 3, 5), (50, 25, 15, 10))[0], max_hunks - hunks)):
+            text, length = make_hunk(vocab, line)
+            parts.append(text)
+            line += length + rng.randint(10, 120)
+            hunks += 1
+        diffs.append({"file": path, "patch": "\n".join(parts) + "\n"})
+    # バグ報告の要約に使う名前は、このコミットの追加行に現れるものから選ぶ
+    added = sorted({name for d in diffs for line in d["patch"].splitlines() if line.startswith("+")
+                    for name in IDENTIFIER_RE.findall(line) if name in vocab.name_set})
+    topic = rng.sample(added, 3) if len(added) >= 3 else added + [vocab.name() for _ in range(3 - len(added))]
+    record = {
+        "hash": hashlib.sha1(f"synth-{seq}-{date.isoformat()}".encode()).hexdigest(),
+        "message": f"Fix {vocab.words(3)} in {topic[0]} when {topic[1]} uses {topic[2]}",
+        "author": f"dev{seq % 37}",
+        "date": date.isoformat(),
+        "diffs": diffs,
+    }
+    return record, topic
+
+def generate(hunks: int, seed: int = 0) -> Iterator[Tuple[Dict, List[str], int]]:
+    """Yield ``(commit, topic words, hunk count)`` until ``hunks`` hunks exist."""
+    rng = random.Random(seed)
+    vocab = Vocabulary(rng)
+    total = 0
+    seq = 0
+    date = START_DATE
+    while total < hunks:
+        date += timedelta(minutes=rng.randint(5, 600))
+        record, topic = make_commit(vocab, seq, date, hunks - total)
+        n = sum(d["patch"].count("\n@@") + 1 for d in record["diffs"])
+        total += n
+        seq += 1
+        yield record, topic, n
+
+def write_dataset(data_dir: str, hunks: int, bugs: int, seed: int = 0) -> Dict[str, int]:
+    """Write ``commits.json`` and ``bug_reports.json`` to ``data_dir``.
+
+    Bug reports are written for a random sample of commits; each summary
+    reuses identifiers from its fixing commit so the ranking has signal.
+    """
+    os.makedirs(data_dir, exist_ok=True)
+    rng = random.Random(seed + 1)
+    fixes: List[Tuple[str, List[str], str]] = []
+    n_commits = 0
+    n_hunks = 0
+    with open(os.path.join(data_dir, "commits.json"), "w", encoding="utf-8") as f:
+        f.write("[\n")
+        for record, topic, n in generate(hunks, seed):
+            if n_commits:
+                f.write(",\n")
+            json.dump(record, f)
+            n_commits += 1
+            n_hunks += n
+            # 先頭から bugs 件を取り、以降は確率的に入れ替えて一様な標本にする
+            if len(fixes) < bugs:
+                fixes.append((record["hash"], topic, record["date"]))
+            elif rng.random() < bugs / n_commits:
+                fixes[rng.randrange(bugs)] = (record["hash"], topic, record["date"])
+        f.write("\n]\n")
+
+    reports = []
+    for i, (sha, topic, date) in enumerate(fixes):
+        created = datetime.fromisoformat(date) - timedelta(days=rng.randint(1, 90))
+        reports.append({
+            "id": f"BUG-{100000 + i}",
+            "product": "Tomcat 9",
+            "version": "9.0.0",
+            "summary": f"{topic[0]} fails with {topic[1]} {rng.choice(COMMENT_WORDS)} {topic[2]}",
+            "description": "",
+            "created": created.strftime("%Y-%m-%dT%H:%M:%SZ"),
+            "fixes": [sha[:7]],
+        })
+    with open(os.path.join(data_dir, "bug_reports.json"), "w", encoding="utf-8") as f:
+        json.dump(reports, f, indent=2)
+    return {"commits": n_commits, "hunks": n_hunks, "bugs": len(reports)}
+
+def main() -> None:
+    ap = ArgumentParser(description="Generate a synthetic Tomcat-like commit and bug report dataset")
+    ap.add_argument("data_dir", help="Directory to write commits.json and bug_reports.json to")
+    ap.add_argument("--hunks", type=int, default=10000, help="Approximate number of hunks")
+    ap.add_argument("--bugs", type=int, default=1000, help="Number of bug reports")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args()
+
+    counts = write_dataset(args.data_dir, args.hunks, args.bugs, args.seed)
+    print(f"Wrote {counts['commits']} commits ({counts['hunks']} hunks) and {counts['bugs']} bug reports "
+          f"to {args.data_dir}")
+
+if __name__ == "__main__":
+    main()